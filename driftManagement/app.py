@@ -1,36 +1,218 @@
-from flask import Flask, jsonify, render_template
-from apscheduler.schedulers.background import BackgroundScheduler
+import logging
+from flask import Blueprint, Flask, Response, json, jsonify, render_template, request, stream_with_context
 from poll_azure import collect_snapshot
 from ingest import ingest_signin_logs
-from db import get_snapshots, get_signin_logs
-from drift_detect import detect_drift
-from datetime import datetime
+from werkzeug.http import is_resource_modified
+from features import update_signin_series
+from db import (
+    ensure_indexes, get_latest_snapshots, iter_resource_history, iter_signin_logs, iter_snapshots, rollup_snapshots
+)
+from drift_results import get_drift_results, refresh_drift_results
+from events import broadcaster
+from leader import JobRunner
+from logging_config import configure_logging
+import metrics
+from datetime import datetime, timezone
+from functools import partial
 
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
+bp = Blueprint("drift", __name__)
 
-# Schedule snapshot collection every 30 minutes
-scheduler = BackgroundScheduler()
-scheduler.add_job(func=collect_snapshot, trigger="interval", minutes=30)
-scheduler.add_job(func=ingest_signin_logs, trigger="interval", minutes=10)
-scheduler.start()
+# Page size for the JSON list endpoints; NDJSON streams are unbounded by default
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NDJSON_MIMETYPE = "application/x-ndjson"
+# Dashboard page rendered for the current drift results etag
+_index_page = {"page": (None, None)}
 
-@app.route("/")
+
+def snapshot_job():
+    collect_snapshot()
+    refresh_drift_results()
+
+
+def ingest_job():
+    stats = ingest_signin_logs()
+    if stats["inserted"]:
+        update_signin_series()
+        refresh_drift_results()
+
+
+def rollup_job():
+    stats = rollup_snapshots()
+    if stats["removed"]:
+        logger.info("Snapshot rollup kept %d of %d old snapshots", stats["kept"], stats["scanned"])
+
+
+def create_runner():
+    """Schedule snapshot collection every 30 minutes, ingest every 10 and the
+    rollup daily. Every worker runs the schedule, but only the one holding
+    the leader lease executes the jobs."""
+    runner = JobRunner()
+    runner.add_job(snapshot_job, minutes=30)
+    runner.add_job(ingest_job, minutes=10)
+    runner.add_job(rollup_job, hours=24)
+    return runner
+
+
+def create_app(start_jobs=True):
+    """Build the app, and unless ``start_jobs`` is false create the indexes and
+    start this process's job runner.
+
+    Importing this module has no side effects: call the factory in each
+    worker process (``gunicorn "app:create_app()"``, ``flask run``) so
+    connections and scheduler threads are created after fork.
+    """
+    configure_logging()
+    app = Flask(__name__)
+    metrics.init_app(app)
+    app.register_blueprint(bp)
+    if start_jobs:
+        ensure_indexes()
+        runner = create_runner()
+        runner.start()
+        app.extensions["job_runner"] = runner
+    return app
+
+
+def _parse_time(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid '{name}': expected an ISO 8601 timestamp")
+    # Stored timestamps are naive UTC
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _page_args(stream):
+    """Read cursor, since, until, fields and limit from the query string."""
+    limit = request.args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValueError("Invalid 'limit': must be a positive integer")
+    if not stream:
+        limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+    fields = request.args.get("fields")
+    return {
+        "cursor": request.args.get("cursor"),
+        "since": _parse_time("since"),
+        "until": _parse_time("until"),
+        "fields": [f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        "limit": limit,
+    }
+
+
+def _wants_ndjson():
+    if request.args.get("format") == "ndjson":
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def _paginated(iter_docs):
+    """Serve a cursor-paginated JSON page, or stream NDJSON as the cursor yields.
+
+    JSON pages are a plain list with the cursor for the next page in the
+    X-Next-Cursor header; it is omitted on the last page.
+    """
+    stream = _wants_ndjson()
+    try:
+        args = _page_args(stream)
+        docs = iter_docs(**args)
+        first = next(docs, None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        def generate():
+            if first is None:
+                return
+            yield json.dumps(first[1]) + "\n"
+            for _, doc in docs:
+                yield json.dumps(doc) + "\n"
+        return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+    page = [] if first is None else [first]
+    page.extend(docs)
+    response = jsonify([doc for _, doc in page])
+    if len(page) == args["limit"]:
+        response.headers["X-Next-Cursor"] = page[-1][0]
+    return response
+
+
+def _conditional(results, build):
+    """Answer 304 if the client already has ``results``, else the response from ``build()``.
+
+    Both routes revalidate against the materialized drift results, so an
+    unchanged poll costs neither a snapshot rebuild nor a render.
+    """
+    if not is_resource_modified(request.environ, etag=results["etag"], last_modified=results["updated_at"]):
+        response = Response(status=304)
+    else:
+        response = build()
+    response.set_etag(results["etag"])
+    response.last_modified = results["updated_at"]
+    response.cache_control.no_cache = True
+    return response
+
+
+@bp.route("/")
 def index():
-    snapshots = get_snapshots()
-    drift = detect_drift()
-    return render_template("index.html", snapshots=snapshots, drift=drift, current_year=datetime.now().year)
+    results = get_drift_results()
+
+    def render():
+        etag, html = _index_page["page"]
+        if etag != results["etag"]:
+            html = render_template(
+                "index.html", snapshots=get_latest_snapshots(), drift=results["report"],
+                etag=results["etag"], current_year=datetime.now().year,
+            )
+            _index_page["page"] = (results["etag"], html)
+        return Response(html, mimetype="text/html")
 
-@app.route("/snapshots", methods=["GET"])
+    return _conditional(results, render)
+
+@bp.route("/snapshots", methods=["GET"])
 def snapshots():
-    return jsonify(get_snapshots())
+    return _paginated(partial(iter_snapshots, subscription_id=request.args.get("subscription_id")))
+
+@bp.route("/snapshots/latest", methods=["GET"])
+def latest_snapshots():
+    """The newest snapshot of every subscription."""
+    return jsonify(get_latest_snapshots())
 
-@app.route("/logs", methods=["GET"])
+@bp.route("/resources/<path:resource_id>/history", methods=["GET"])
+def resource_history(resource_id):
+    """Changes recorded for one resource, by ARM id (with or without the leading slash)."""
+    return _paginated(partial(iter_resource_history, "/" + resource_id.lstrip("/")))
+
+@bp.route("/logs", methods=["GET"])
 def logs():
-    return jsonify(get_signin_logs())
+    return _paginated(iter_signin_logs)
 
-@app.route("/drift", methods=["GET"])
+@bp.route("/drift", methods=["GET"])
 def drift():
-    return jsonify(detect_drift())
+    results = get_drift_results()
+    return _conditional(results, lambda: jsonify(results["report"]))
+
+@bp.route("/events", methods=["GET"])
+def events():
+    """Server-sent events: ``snapshot`` and ``drift`` whenever the drift results change."""
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    response = Response(broadcaster.stream(last_event_id), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop reverse proxies from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
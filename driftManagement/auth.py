@@ -1,5 +1,6 @@
 import os
-from azure.identity import ClientSecretCredential
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,20 +11,116 @@ CLIENT_ID = os.getenv("AZURE_CLIENT_ID")
 CLIENT_SECRET = os.getenv("AZURE_CLIENT_SECRET")
 SUBSCRIPTION_ID = os.getenv("AZURE_SUBSCRIPTION_ID")
 
-# Check if environment variables are set
-def get_credentials():
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+ARM_SCOPE = "https://management.azure.com/.default"
+
+# Tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
+
+class TokenCache:
+    """Process-wide cache of one credential per tenant and one token per (tenant, scope).
+
+    Tokens are refreshed proactively once they are within ``refresh_margin``
+    seconds of ``expires_on``. Concurrent callers needing the same token wait
+    for a single refresh instead of each requesting one.
+    """
+
+    def __init__(self, credential_factory, refresh_margin=TOKEN_REFRESH_MARGIN, clock=time.time):
+        self._credential_factory = credential_factory
+        self.refresh_margin = refresh_margin
+        self._clock = clock
+        self._credentials = {}
+        self._tokens = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0}
+
+    def _fresh(self, token):
+        return token is not None and token.expires_on - self.refresh_margin > self._clock()
+
+    def credential(self, tenant_id=None):
+        """Shared underlying credential for a tenant."""
+        with self._lock:
+            if tenant_id not in self._credentials:
+                self._credentials[tenant_id] = self._credential_factory(tenant_id)
+            return self._credentials[tenant_id]
+
+    def get_token(self, scope, tenant_id=None):
+        """Return a cached AccessToken for ``scope``, fetching it if stale."""
+        key = (tenant_id, scope)
+        token = self._tokens.get(key)
+        if self._fresh(token):
+            with self._lock:
+                self.stats["hits"] += 1
+            return token
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            token = self._tokens.get(key)
+            if self._fresh(token):
+                # Refreshed by another thread while we waited
+                with self._lock:
+                    self.stats["hits"] += 1
+                return token
+            refreshed = self.credential(tenant_id).get_token(scope)
+            with self._lock:
+                self.stats["refreshes" if token is not None else "misses"] += 1
+                self._tokens[key] = refreshed
+            return refreshed
+
+    def clear(self):
+        with self._lock:
+            self._credentials.clear()
+            self._tokens.clear()
+
+
+class CachedCredential:
+    """azure-core TokenCredential that serves tokens from a TokenCache.
+
+    Passed to the management SDK clients so every client and scheduler job in
+    the process shares the same tokens.
+    """
+
+    def __init__(self, cache, tenant_id=None):
+        self._cache = cache
+        self._tenant_id = tenant_id
+
+    def get_token(self, *scopes, **kwargs):
+        if len(scopes) != 1 or kwargs.get("claims"):
+            # Multi-scope and claims challenge requests bypass the cache
+            return self._cache.credential(self._tenant_id).get_token(*scopes, **kwargs)
+        return self._cache.get_token(scopes[0], self._tenant_id)
+
+    def close(self):
+        pass
+
+
+def _create_credential(tenant_id=None):
+    # Imported on first use: azure.identity alone adds ~0.2s to app startup
+    from azure.identity import ClientSecretCredential
+
     return ClientSecretCredential(
-        tenant_id="TENANT_ID",
-        client_id="CLIENT_ID",
-        client_secret="CLIENT_SECRET",
-        subscription_id = "SUBSCRIPTION_ID"
+        tenant_id=tenant_id or TENANT_ID,
+        client_id=CLIENT_ID,
+        client_secret=CLIENT_SECRET
     )
 
+
+token_cache = TokenCache(_create_credential)
+
+# Check if environment variables are set
+def get_credentials(tenant_id=None):
+    return CachedCredential(token_cache, tenant_id)
+
 # Get the credentials for Azure
-def get_graph_token():
+def get_graph_token(tenant_id=None):
     """
     Get access token for Microsoft Graph API.
     """
-    credential = get_credentials()
-    token = credential.get_token("https://graph.microsoft.com/.default")
-    return token.token
+    return token_cache.get_token(GRAPH_SCOPE, tenant_id).token
+
+
+def get_token_cache_stats():
+    return dict(token_cache.stats)
@@ -0,0 +1,96 @@
+"""Local stand-in for the Azure Resource Manager list endpoints used by collect_snapshot.
+
+Serves ``GET /subscriptions/{id}/resourcegroups`` and ``GET /subscriptions/{id}/resources``
+with ARM's ``value``/``nextLink`` paging, so the real SDK clients can be
+pointed at it through ``base_url``.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from azure.core.credentials import AccessToken
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+from azure.mgmt.resource import ResourceManagementClient
+from azure.mgmt.resource.resources import ResourceManagementClient as AzureResourcesClient
+
+
+class StaticCredential:
+    def get_token(self, *scopes, **kwargs):
+        return AccessToken("token", 2 ** 31)
+
+
+class ArmStub:
+    """Serve a synthetic tenant (see synthetic.make_tenant); assign ``tenant`` to swap it."""
+
+    def __init__(self, tenant, page_size=1000):
+        self.tenant = tenant
+        self.page_size = page_size
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def clients(self):
+        """(ResourceManagementClient, resources client) talking to this stub without TLS or auth."""
+        options = {"base_url": self.url, "authentication_policy": SansIOHTTPPolicy()}
+        subscription_id = self.tenant["subscription_id"]
+        return (
+            ResourceManagementClient(StaticCredential(), subscription_id, **options),
+            AzureResourcesClient(StaticCredential(), subscription_id, **options),
+        )
+
+    def _items(self, path):
+        if path.rstrip("/").lower().endswith("/resourcegroups"):
+            subscription = self.tenant["subscription_id"]
+            return [
+                {"id": f"/subscriptions/{subscription}/resourceGroups/{g['name']}", "name": g["name"],
+                 "type": "Microsoft.Resources/resourceGroups", "location": g["location"],
+                 "properties": {"provisioningState": "Succeeded"}}
+                for g in self.tenant["groups"]
+            ]
+        return self.tenant["resources"]
+
+    def page(self, path, query):
+        items = self._items(path)
+        skip = int(query.get("$skiptoken", ["0"])[0])
+        body = {"value": items[skip:skip + self.page_size]}
+        if skip + self.page_size < len(items):
+            next_query = {k: v[0] for k, v in query.items()}
+            next_query["$skiptoken"] = skip + self.page_size
+            body["nextLink"] = f"{self.url}{path}?{urlencode(next_query)}"
+        return body
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub.requests += 1
+                parsed = urlparse(self.path)
+                payload = json.dumps(stub.page(parsed.path, parse_qs(parsed.query))).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,49 @@
+"""Batch vs per-pair DriftDetector scoring at 10k metrics x 1k samples.
+
+Run from driftManagement/: python benchmarks/bench_drift_batch.py
+"""
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from drift_detect import DriftDetector  # noqa: E402
+
+METRICS = 10_000
+SAMPLES = 1_000
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(0)
+    baselines = rng.normal(size=(METRICS, SAMPLES))
+    currents = baselines + rng.normal(scale=0.5, size=(METRICS, SAMPLES))
+    detector = DriftDetector(tolerance=0.1)
+
+    baseline_lists, current_lists = baselines.tolist(), currents.tolist()
+    single, single_time = timed(lambda: [
+        detector.calculate_drift_score(b, c) for b, c in zip(baseline_lists, current_lists)
+    ])
+    batch, batch_time = timed(lambda: detector.detect_drift_batch(baselines, currents))
+    batch32, batch32_time = timed(lambda: detector.detect_drift_batch(baselines, currents, dtype=np.float32))
+
+    assert np.allclose(batch[0], single)
+    assert np.allclose(batch32[0], single, atol=1e-3)
+    print(f"{METRICS} metrics x {SAMPLES} samples")
+    print(f"per-pair calculate_drift_score   {single_time:7.2f}s")
+    print(f"detect_drift_batch float64       {batch_time:7.2f}s  ({single_time / batch_time:5.1f}x)")
+    print(f"detect_drift_batch float32       {batch32_time:7.2f}s  ({single_time / batch32_time:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
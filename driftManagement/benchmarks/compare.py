@@ -0,0 +1,55 @@
+"""Compare two benchmark result files written by suite.py.
+
+    python benchmarks/compare.py benchmarks/results/abc1234-small.json benchmarks/results/def5678-small.json
+
+Exits with status 1 if any benchmark got slower than --threshold (default 15%).
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, candidate, threshold):
+    """Return (rows, regressions); each row is (name, old seconds, new seconds, ratio)."""
+    rows, regressions = [], []
+    for name, new in candidate["results"].items():
+        old = baseline["results"].get(name)
+        if not old or "seconds" not in old or "seconds" not in new:
+            continue
+        ratio = new["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        rows.append((name, old["seconds"], new["seconds"], ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    for key in ("scale", "backend"):
+        if baseline.get(key) != candidate.get(key):
+            print(f"warning: {key} differs ({baseline.get(key)} vs {candidate.get(key)})")
+
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    print(f"{'benchmark':<52} {baseline['commit']:>12} {candidate['commit']:>12}  change")
+    for name, old, new, ratio in rows:
+        flag = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<52} {old:11.4f}s {new:11.4f}s {ratio - 1:+7.1%}{flag}")
+    missing = sorted(set(baseline["results"]) - set(candidate["results"]))
+    if missing:
+        print(f"not in candidate: {', '.join(missing)}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""End-to-end benchmark suite on synthetic tenants.
+
+Times process startup, collect_snapshot against a local ARM stub, snapshot
+storage and queries in db.py, snapshot diffs, ingest_signin_logs against a local Graph stub,
+the sign-in log queries and DriftDetector scoring. Results are written as JSON
+keyed by benchmark name; compare two runs with benchmarks/compare.py.
+
+Run from driftManagement/:
+
+    python benchmarks/suite.py                      # small scale, mongomock
+    python benchmarks/suite.py --scale full --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import bson
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "tests"))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import db  # noqa: E402
+import drift_results  # noqa: E402
+import features  # noqa: E402
+import ingest  # noqa: E402
+import poll_azure  # noqa: E402
+import tenant_eval  # noqa: E402
+from arm_stub import ArmStub  # noqa: E402
+from drift_detect import DriftDetector, DriftMonitor, MetricSketch  # noqa: E402
+from graph_stub import GraphStub  # noqa: E402
+from snapshot_delta import index_snapshot  # noqa: E402
+from snapshot_diff import diff_items, diff_snapshots  # noqa: E402
+from synthetic import churn, make_signins, make_tenant  # noqa: E402
+
+# mongomock scans every document on each upsert, so sign-in counts in the
+# millions are only practical with --mongo-uri pointing at a local mongod
+SCALES = {
+    "small": {"tenants": [10_000], "snapshots": 6, "signins": 1_000, "metrics": 2_000, "samples": 500},
+    "full": {"tenants": [10_000, 100_000, 500_000], "snapshots": 12, "signins": 2_000_000, "metrics": 10_000,
+             "samples": 1_000},
+}
+BENCH_DATABASE = "drift_bench"
+CHURN_RATE = 0.01
+GRAPH_PAGE_SIZE = 1000
+LOG_PAGE_SIZE = 1000
+
+
+def snapshot_of(version):
+    """Synthetic tenant in the nested snapshot layout."""
+    by_group = {}
+    for resource in version["resources"]:
+        by_group.setdefault(resource["id"].split("/")[4], []).append(dict(resource))
+    return {"resources": [
+        {"resource_group": g["name"], "location": g["location"], "resources": by_group.get(g["name"], [])}
+        for g in version["groups"]
+    ]}
+
+
+class Suite:
+    def __init__(self, mongo_uri=None, repeat=3, only=None):
+        self.mongo_uri = mongo_uri
+        self.repeat = repeat
+        self.only = only
+        self.results = {}
+
+    def wanted(self, name):
+        return not self.only or any(name.startswith(prefix) for prefix in self.only)
+
+    def section(self, name):
+        """Whether any benchmark starting with ``name`` may be wanted."""
+        return not self.only or any(name.startswith(p) or p.startswith(name) for p in self.only)
+
+    def fresh_database(self):
+        """Point db.py at an empty benchmark database (mongomock unless --mongo-uri)."""
+        if self.mongo_uri:
+            import pymongo
+            client = pymongo.MongoClient(self.mongo_uri)
+            client.drop_database(BENCH_DATABASE)
+        else:
+            import mongomock
+            import mongomock_compat
+            mongomock_compat.install()
+            client = mongomock.MongoClient()
+            # mongomock emulates TTL indexes by checking every document on
+            # every read, which would dominate the sign-in timings
+            db.SIGNIN_LOG_RETENTION_DAYS = 0
+        database = client[BENCH_DATABASE]
+        db.db = database
+        db.snapshots_collection = database["snapshots"]
+        db.logs_collection = database["signin_logs"]
+        db.state_collection = database["ingest_state"]
+        db.history_collection = database["resource_history"]
+        db._chains = {}
+        db._indexes_ready = False
+        db.ensure_indexes()
+        drift_results.clear_cache()
+        return database
+
+    def measure(self, name, fn, items=None, repeat=None, setup=None):
+        """Time ``fn`` (after ``setup``, untimed) ``repeat`` times and record the median."""
+        if not self.wanted(name):
+            return None
+        runs, result = [], None
+        for _ in range(repeat or self.repeat):
+            if setup is not None:
+                setup()
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                result = fn()
+                runs.append(time.perf_counter() - start)
+        seconds = statistics.median(runs)
+        record = {"seconds": seconds, "min": min(runs), "runs": runs}
+        if items:
+            record.update(items=items, per_second=items / seconds if seconds else None)
+        self.results[name] = record
+        rate = f"{items / seconds:12.0f}/s" if items and seconds else ""
+        print(f"{name:<52} {seconds:9.4f}s {rate}")
+        return result
+
+    def skip(self, name, reason):
+        if self.wanted(name):
+            self.results[name] = {"skipped": reason}
+            print(f"{name:<52} skipped: {reason}")
+
+    # -- snapshots -------------------------------------------------------
+
+    def collect_snapshot(self, size):
+        tenant = make_tenant(size, seed=size)
+        with ArmStub(tenant) as stub:
+            os.environ["AZURE_SUBSCRIPTION_ID"] = tenant["subscription_id"]
+            poll_azure._clients.clear()
+            poll_azure._clients[tenant["subscription_id"]] = stub.clients()
+
+            self.measure(f"collect_snapshot.keyframe[{size}]", poll_azure.collect_snapshot, items=size, repeat=1,
+                         setup=self.fresh_database)
+            stub.tenant = churn(tenant, CHURN_RATE)
+            self.measure(f"collect_snapshot.delta[{size}]", poll_azure.collect_snapshot, items=size, repeat=1)
+        poll_azure._clients.clear()
+
+    def snapshot_queries(self, size, count):
+        tenant = make_tenant(size, seed=size)
+        versions = [tenant]
+        for i in range(1, count):
+            versions.append(churn(versions[-1], CHURN_RATE, seed=i))
+
+        snapshots = [snapshot_of(version) for version in versions]
+
+        def save_all():
+            for snapshot in snapshots:
+                db.save_snapshot(dict(snapshot))
+
+        # The packed encoding is measured on the same snapshots, then the
+        # plain one is left in place for the queries that follow
+        for encoding, suffix in (("packed", ".packed"), ("plain", "")):
+            db.SNAPSHOT_ENCODING = encoding
+            self.measure(f"db.save_snapshot[{size}x{count}]{suffix}", save_all, items=count, repeat=1,
+                         setup=self.fresh_database)
+            self.measure(f"db.get_snapshots.latest[{size}]{suffix}", lambda: db.get_snapshots(limit=1), items=size)
+            if self.wanted(f"db.snapshot_bytes[{size}x{count}]{suffix}"):
+                stored = sum(len(bson.encode(doc)) for doc in db.snapshots_collection.find())
+                self.results[f"db.snapshot_bytes[{size}x{count}]{suffix}"] = {"bytes": stored}
+                print(f"{f'db.snapshot_bytes[{size}x{count}]{suffix}':<52} {stored:>10} bytes")
+        middle = db.get_snapshots(fields=["timestamp"])[count // 2]["timestamp"]
+        self.measure(f"db.get_snapshots.summaries[{size}x{count}]", lambda: db.get_snapshots(fields=["timestamp"]),
+                     items=count)
+        self.measure(f"db.get_snapshot_at.middle[{size}]", lambda: db.get_snapshot_at(middle), items=size)
+        resource_id = versions[-1]["resources"][0]["id"]
+        self.measure(f"db.iter_resource_history[{size}x{count}]",
+                     lambda: list(db.iter_resource_history(resource_id)), items=1)
+        self.measure(f"drift_results.snapshot_drift[{size}]", drift_results.snapshot_drift, items=size)
+
+    def snapshot_diff(self, size):
+        tenant = make_tenant(size, seed=size)
+        previous, current = snapshot_of(tenant), snapshot_of(churn(tenant, CHURN_RATE, seed=1))
+        _, previous_items = index_snapshot(previous)
+        _, current_items = index_snapshot(current)
+        self.measure(f"snapshot_diff.diff_items[{size}]", lambda: diff_items(previous_items, current_items),
+                     items=size)
+        self.measure(f"snapshot_diff.diff_snapshots[{size}]", lambda: diff_snapshots(previous, current), items=size)
+
+    # -- sign-ins --------------------------------------------------------
+
+    def ingest(self, count):
+        signins = list(make_signins(count))
+        endpoint, token, lookback = ingest.GRAPH_ENDPOINT, ingest.get_graph_token, ingest.INGEST_LOOKBACK_DAYS
+        try:
+            with GraphStub(signins, page_size=GRAPH_PAGE_SIZE) as stub:
+                ingest.GRAPH_ENDPOINT = stub.url
+                ingest.get_graph_token = lambda tenant_id=None: "token"
+                ingest.INGEST_LOOKBACK_DAYS = 31
+                ingest._clients.clear()
+                self.measure(f"ingest_signin_logs[{count}]", ingest.ingest_signin_logs, items=count, repeat=1,
+                             setup=self.fresh_database)
+                # Re-ingesting the same window only finds duplicates
+                self.measure(f"ingest_signin_logs.rerun[{count}]", self._reingest, items=count, repeat=1)
+        finally:
+            ingest.GRAPH_ENDPOINT, ingest.get_graph_token, ingest.INGEST_LOOKBACK_DAYS = endpoint, token, lookback
+            ingest._clients.clear()
+        del signins
+
+        def pages(n):
+            cursor = None
+            for _ in range(n):
+                page = list(db.iter_signin_logs(cursor=cursor, limit=LOG_PAGE_SIZE))
+                if len(page) < LOG_PAGE_SIZE:
+                    break
+                cursor = page[-1][0]
+
+        self.measure("db.iter_signin_logs.10_pages", lambda: pages(10), items=10 * LOG_PAGE_SIZE)
+        if not self.mongo_uri:
+            # mongomock implements neither $dateTrunc nor $merge
+            self.skip(f"features.update_signin_series[{count}]", "needs --mongo-uri")
+            self.skip("features.score_signin_series.user", "needs --mongo-uri")
+            self.skip("tenant_eval.evaluate_tenants", "needs --mongo-uri")
+            return
+        self.measure(f"features.update_signin_series[{count}]", features.update_signin_series, items=count, repeat=1)
+        self.measure("features.score_signin_series.user", lambda: features.score_signin_series("user"))
+        self.measure("tenant_eval.evaluate_tenants", tenant_eval.evaluate_tenants)
+
+    def _reingest(self):
+        db.state_collection.delete_many({})
+        return ingest.ingest_signin_logs()
+
+    # -- scoring ---------------------------------------------------------
+
+    # -- startup ---------------------------------------------------------
+
+    def startup(self):
+        """Import and app factory time, each in a fresh interpreter."""
+        env = dict(os.environ, PYTHONPATH=os.path.join(HERE, ".."), MONGO_URI="mongodb://127.0.0.1:1")
+
+        def run(code):
+            return lambda: subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        self.measure("startup.python", run("pass"))
+        self.measure("startup.import_app", run("import app"))
+        self.measure("startup.create_app", run("import app; app.create_app(start_jobs=False)"))
+
+    def scoring(self, metrics, samples):
+        rng = np.random.default_rng(0)
+        baselines = rng.normal(size=(metrics, samples))
+        currents = baselines + rng.normal(scale=0.5, size=(metrics, samples))
+        detector = DriftDetector()
+        self.measure(f"DriftDetector.detect_drift_batch[{metrics}x{samples}]",
+                     lambda: detector.detect_drift_batch(baselines, currents), items=metrics)
+        self.measure(f"DriftDetector.detect_drift_batch.float32[{metrics}x{samples}]",
+                     lambda: detector.detect_drift_batch(baselines, currents, dtype=np.float32), items=metrics)
+        rows = min(metrics, 1000)
+        baseline_lists, current_lists = baselines[:rows].tolist(), currents[:rows].tolist()
+        self.measure(f"DriftDetector.calculate_drift_score[{rows}x{samples}]",
+                     lambda: [detector.calculate_drift_score(b, c) for b, c in zip(baseline_lists, current_lists)],
+                     items=rows)
+
+        values = rng.normal(size=1_000_000)
+        self.measure("MetricSketch.update[1000000]", lambda: MetricSketch(-5, 5).update(values), items=len(values))
+        stream = values[:100_000].tolist()
+
+        def observe():
+            monitor = DriftMonitor(detector, reference_size=500, recent_size=100)
+            for value in stream:
+                monitor.observe("metric", value)
+
+        self.measure("DriftMonitor.observe[100000]", observe, items=len(stream))
+
+    def run(self, scale):
+        params = SCALES[scale]
+        if self.section("startup"):
+            self.startup()
+        for size in params["tenants"]:
+            if self.section("collect_snapshot"):
+                self.collect_snapshot(size)
+            if self.section("snapshot_diff"):
+                self.snapshot_diff(size)
+            if self.section("db.save_snapshot") or self.section("db.get_snapshot") or self.section("drift_results"):
+                self.snapshot_queries(size, params["snapshots"])
+        if (self.section("ingest") or self.section("db.iter_signin_logs") or self.section("features")
+                or self.section("tenant_eval")):
+            self.ingest(params["signins"])
+        if self.section("DriftDetector") or self.section("MetricSketch") or self.section("DriftMonitor"):
+            self.scoring(params["metrics"], params["samples"])
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD", "--", ".."], cwd=HERE) != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--mongo-uri", help="benchmark against this MongoDB instead of mongomock")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per read-only benchmark (median is reported)")
+    parser.add_argument("--only", action="append", help="only run benchmarks whose name starts with this")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<commit>-<scale>.json)")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    if args.scale == "full" and not args.mongo_uri:
+        print("warning: full scale on mongomock takes hours; pass --mongo-uri for a local mongod")
+    commit = git_commit()
+    suite = Suite(args.mongo_uri, args.repeat, args.only)
+    started = datetime.utcnow()
+    suite.run(args.scale)
+
+    output = args.output or os.path.join(HERE, "results", f"{commit}-{args.scale}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "started_at": started.isoformat() + "Z",
+            "scale": args.scale,
+            "params": SCALES[args.scale],
+            "backend": "mongodb" if args.mongo_uri else "mongomock",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": suite.results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Seeded generators for synthetic Azure subscriptions and sign-in streams.
+
+The same seed always produces the same tenant, churn and sign-ins, so
+benchmark results from different commits measure the same workload.
+"""
+import random
+from datetime import datetime, timedelta
+
+SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+LOCATIONS = ["westeurope", "northeurope", "eastus", "eastus2", "westus2", "uksouth", "southeastasia"]
+RESOURCE_TYPES = [
+    ("Microsoft.Compute/virtualMachines", "vm"),
+    ("Microsoft.Compute/disks", "disk"),
+    ("Microsoft.Network/networkInterfaces", "nic"),
+    ("Microsoft.Network/networkSecurityGroups", "nsg"),
+    ("Microsoft.Network/publicIPAddresses", "pip"),
+    ("Microsoft.Storage/storageAccounts", "st"),
+    ("Microsoft.Web/sites", "app"),
+    ("Microsoft.KeyVault/vaults", "kv"),
+    ("Microsoft.Sql/servers/databases", "sqldb"),
+]
+TAG_VALUES = {
+    "env": ["dev", "test", "staging", "prod"],
+    "owner": [f"team-{i}" for i in range(40)],
+    "costCenter": [str(1000 + i) for i in range(25)],
+    "app": [f"app-{i}" for i in range(200)],
+    "managedBy": ["terraform", "bicep", "portal"],
+}
+APPS = ["Azure Portal", "Microsoft Teams", "Office 365 Exchange Online", "Azure CLI", "Visual Studio Code",
+        "Microsoft Graph PowerShell", "SharePoint Online", "Outlook Mobile"]
+COUNTRIES = ["NL", "IE", "GB", "US", "DE", "FR", "IN", "SG", "BR", "NG"]
+FAILURE_CODES = [50126, 50053, 50074, 53003]
+GRAPH_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _tags(rng):
+    keys = rng.sample(sorted(TAG_VALUES), rng.randint(0, 4))
+    return {key: rng.choice(TAG_VALUES[key]) for key in keys} or None
+
+
+def _resource(rng, index, group, subscription_id):
+    resource_type, prefix = rng.choice(RESOURCE_TYPES)
+    name = f"{prefix}-{index:07d}"
+    return {
+        "id": f"/subscriptions/{subscription_id}/resourceGroups/{group['name']}/providers/{resource_type}/{name}",
+        "name": name,
+        "type": resource_type,
+        "location": group["location"],
+        "tags": _tags(rng),
+    }
+
+
+def make_tenant(resources, groups=None, seed=0, subscription_id=SUBSCRIPTION_ID):
+    """Return {"subscription_id", "groups": [{name, location}], "resources": [ARM resource dicts]}."""
+    rng = random.Random(seed)
+    groups = groups or max(1, resources // 50)
+    group_list = [{"name": f"rg-{i:05d}", "location": rng.choice(LOCATIONS)} for i in range(groups)]
+    return {
+        "subscription_id": subscription_id,
+        "groups": group_list,
+        "resources": [_resource(rng, i, rng.choice(group_list), subscription_id) for i in range(resources)],
+        "next_index": resources,
+    }
+
+
+def churn(tenant, rate=0.01, seed=1):
+    """Copy of ``tenant`` with ``rate`` of its resources changed.
+
+    Of the changes, 60% retag a resource, 15% add one, 15% delete one and
+    10% move one to another resource group (which changes its id).
+    """
+    rng = random.Random(seed)
+    resources = list(tenant["resources"])
+    next_index = tenant["next_index"]
+    subscription_id = tenant["subscription_id"]
+    for _ in range(max(1, int(len(resources) * rate))):
+        roll = rng.random()
+        if roll < 0.15:
+            resources.append(_resource(rng, next_index, rng.choice(tenant["groups"]), subscription_id))
+            next_index += 1
+            continue
+        if not resources:
+            continue
+        i = rng.randrange(len(resources))
+        if roll < 0.30:
+            resources[i] = resources[-1]
+            resources.pop()
+        elif roll < 0.40:
+            group = rng.choice(tenant["groups"])
+            moved = dict(resources[i], location=group["location"])
+            moved["id"] = moved["id"].replace(moved["id"].split("/")[4], group["name"], 1)
+            resources[i] = moved
+        else:
+            resources[i] = dict(resources[i], tags=_tags(rng))
+    return dict(tenant, resources=resources, next_index=next_index)
+
+
+def make_signins(count, end=None, days=30, users=5000, seed=0, tenant_id=None):
+    """Yield ``count`` Graph signIn records spread evenly over ``days`` up to ``end``, oldest first."""
+    rng = random.Random(seed)
+    end = end or datetime.utcnow()
+    start = end - timedelta(days=days)
+    step = (end - start) / max(count, 1)
+    for i in range(count):
+        # Skewed activity: a few users and apps account for most sign-ins
+        user = int(users * rng.random() ** 3)
+        failed = rng.random() < 0.05
+        record = {
+            "id": f"{seed:x}-{i:09d}",
+            "createdDateTime": (start + step * i).strftime(GRAPH_TIME_FORMAT),
+            "userPrincipalName": f"user{user}@contoso.com",
+            "appDisplayName": APPS[int(len(APPS) * rng.random() ** 2)],
+            "ipAddress": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            "location": {"countryOrRegion": COUNTRIES[int(len(COUNTRIES) * rng.random() ** 2)]},
+            "status": {"errorCode": rng.choice(FAILURE_CODES) if failed else 0},
+        }
+        if tenant_id:
+            record["tenant_id"] = tenant_id
+        yield record
@@ -1,36 +1,649 @@
+import base64
+import logging
 import os
-from pymongo import MongoClient
+import threading
+from collections import defaultdict
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 from dotenv import load_dotenv
-from datetime import datetime
+from metrics import MongoCommandMetrics
+from datetime import datetime, timedelta
+from snapshot_delta import (
+    DELTA, INTERNAL_FIELDS, KEYFRAME, apply_delta, build_snapshot, encode_delta, hash_items, index_snapshot,
+    resource_key,
+)
+from snapshot_codec import pack, unpack
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables from .env file
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-db = client["drift_db"]
+DATABASE_NAME = "drift_db"
+
+# A MongoClient must not be shared across fork, so each process opens its own
+# on first use; pre-fork servers import this module before forking workers
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The MongoClient of the current process, created on first use."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = MongoClient(MONGO_URI, event_listeners=[MongoCommandMetrics()])
+                _client_pid = pid
+    return _client
+
+
+def _forget_client():
+    # Runs in a forked child: the parent's client and lock state are not usable
+    global _client, _client_lock
+    _client, _client_lock = None, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_client)
+
+
+class LazyCollection:
+    """Database or collection of the current process's client, resolved on each use.
+
+    ``db["name"]`` gives another LazyCollection, so module-level collection
+    handles can be declared at import without connecting.
+    """
+
+    def __init__(self, *path):
+        self._path = path
+
+    def resolve(self):
+        target = get_client()[DATABASE_NAME]
+        for name in self._path:
+            target = target[name]
+        return target
+
+    def __getitem__(self, name):
+        return LazyCollection(*self._path, name)
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+db = LazyCollection()
 
 # Collections
 snapshots_collection = db["snapshots"]
 logs_collection = db["signin_logs"]
+state_collection = db["ingest_state"]
+# One document per resource change (added/changed/removed), written as
+# snapshots are saved, so a resource's history is an index range scan
+history_collection = db["resource_history"]
+HISTORY_INSERT_BATCH = 1000
+
+# Snapshot storage: "delta" keeps a full keyframe every SNAPSHOT_KEYFRAME_INTERVAL
+# snapshots and only the added/changed/removed resources in between; "full"
+# stores every snapshot as a complete document.
+SNAPSHOT_STORAGE = os.getenv("SNAPSHOT_STORAGE", "delta")
+SNAPSHOT_KEYFRAME_INTERVAL = int(os.getenv("SNAPSHOT_KEYFRAME_INTERVAL", "48"))
+# Resource payload encoding of new snapshot documents: "plain" BSON, or
+# "packed" (dictionary-encoded, compressed binary; see snapshot_codec)
+SNAPSHOT_ENCODING = os.getenv("SNAPSHOT_ENCODING", "plain")
+
+# State of the delta chain being written for each subscription: keyframe id,
+# number of deltas written on top of it and the resource hashes of the last
+# saved snapshot. Snapshots without a subscription_id share the None chain.
+_chains = {}
+# One lock per subscription, so chains of different subscriptions are written in parallel
+_chain_locks = defaultdict(threading.Lock)
+_chain_locks_lock = threading.Lock()
+
+# Raw sign-in logs are deleted this many days after ingestion (0 keeps them forever)
+SIGNIN_LOG_RETENTION_DAYS = int(os.getenv("SIGNIN_LOG_RETENTION_DAYS", "90"))
+LOG_TTL_INDEX = "fetched_at_ttl"
+
+# Snapshots older than these ages are downsampled to one per hour / per day
+SNAPSHOT_HOURLY_AFTER_DAYS = int(os.getenv("SNAPSHOT_HOURLY_AFTER_DAYS", "7"))
+SNAPSHOT_DAILY_AFTER_DAYS = int(os.getenv("SNAPSHOT_DAILY_AFTER_DAYS", "30"))
+ROLLUP_DELETE_BATCH = 1000
+LOG_DEDUPE_DELETE_BATCH = 1000
+
+_indexes_ready = False
+DUPLICATE_KEY = 11000
+
+
+def _apply_log_retention():
+    """Create, update or drop the TTL index on signin_logs.fetched_at."""
+    existing = logs_collection.index_information().get(LOG_TTL_INDEX)
+    if not SIGNIN_LOG_RETENTION_DAYS:
+        if existing:
+            logs_collection.drop_index(LOG_TTL_INDEX)
+        return
+    seconds = SIGNIN_LOG_RETENTION_DAYS * 86400
+    if existing is None:
+        logs_collection.create_index([("fetched_at", ASCENDING)], name=LOG_TTL_INDEX, expireAfterSeconds=seconds)
+    elif existing.get("expireAfterSeconds") != seconds:
+        # Changing the TTL of an existing index needs collMod, not create_index
+        db.command("collMod", logs_collection.name, index={"name": LOG_TTL_INDEX, "expireAfterSeconds": seconds})
+
+
+def _dedupe_signin_logs():
+    """Delete all but the first stored copy of each sign-in ``id``; returns the number deleted.
+
+    Ingestion used to insert every fetched sign-in again on each poll, so
+    older deployments hold duplicates that the unique index on id rejects.
+    """
+    duplicates = logs_collection.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": "$id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    extra = [oid for group in duplicates for oid in group["ids"][1:]]
+    for i in range(0, len(extra), LOG_DEDUPE_DELETE_BATCH):
+        logs_collection.delete_many({"_id": {"$in": extra[i:i + LOG_DEDUPE_DELETE_BATCH]}})
+    return len(extra)
+
+
+def _ensure_unique_log_ids():
+    if "id_1" in logs_collection.index_information():
+        return
+    removed = _dedupe_signin_logs()
+    if removed:
+        logger.info("Removed %d duplicate sign-in logs before indexing id", removed)
+    try:
+        logs_collection.create_index("id", unique=True)
+    except OperationFailure as e:
+        # Duplicates written while deduplicating; ingestion still works, without the guarantee
+        logger.warning("Could not create the unique index on signin_logs.id: %s", e)
+
+
+def ensure_indexes():
+    """Create the indexes the queries in this module rely on.
+
+    Safe to call on every start: existing indexes are left as they are and
+    only the log retention is updated when SIGNIN_LOG_RETENTION_DAYS changed.
+    Duplicate sign-in logs are removed before the unique index on id is
+    first created.
+    """
+    global _indexes_ready
+    # Newest-first pages and point-in-time lookups, overall and per subscription
+    snapshots_collection.create_index([("timestamp", DESCENDING), ("_id", DESCENDING)])
+    snapshots_collection.create_index(
+        [("subscription_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]
+    )
+    # Replaying a delta chain from its keyframe
+    snapshots_collection.create_index([("base", ASCENDING), ("timestamp", ASCENDING)], sparse=True)
+
+    _ensure_unique_log_ids()
+    logs_collection.create_index([("fetched_at", DESCENDING), ("_id", DESCENDING)])
+    # Series updates match and sort sign-ins on createdDateTime
+    logs_collection.create_index([("createdDateTime", DESCENDING)])
+    _apply_log_retention()
+
+    history_collection.create_index(
+        [("resource_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]
+    )
+
+    db["signin_series"].create_index(
+        [("dimension", ASCENDING), ("bucket", ASCENDING), ("tenant_id", ASCENDING), ("key", ASCENDING)]
+    )
+    _indexes_ready = True
+
+
+def _replay(base_id, upto=None):
+    """Rebuild (groups, items) from a keyframe plus its deltas up to the ``upto`` document."""
+    keyframe = snapshots_collection.find_one({"_id": base_id})
+    if keyframe is None:
+        return None, None, 0
+    groups, items = index_snapshot(unpack(keyframe))
+
+    query = {"storage": DELTA, "base": base_id}
+    if upto is not None:
+        query["timestamp"] = {"$lte": upto["timestamp"]}
+    applied = 0
+    for delta in snapshots_collection.find(query).sort([("timestamp", 1), ("_id", 1)]):
+        apply_delta(groups, items, unpack(delta))
+        applied += 1
+        if upto is not None and delta["_id"] == upto["_id"]:
+            break
+    return groups, items, applied
+
+
+def _newest_snapshot(subscription_id=None, fields=None):
+    return snapshots_collection.find_one(
+        {"subscription_id": subscription_id}, fields or {"_id": 1}, sort=[("timestamp", -1), ("_id", -1)],
+    )
+
+
+def _load_chain(subscription_id=None):
+    """Rebuild a subscription's chain state from its newest stored snapshot.
+
+    Used after a restart, and whenever another process (another worker, or
+    a previous leader) stored a snapshot since this one last did.
+    """
+    newest = _newest_snapshot(subscription_id, {"_id": 1, "storage": 1, "base": 1, "timestamp": 1})
+    if newest is None:
+        return None
+    base_id = newest["base"] if newest.get("storage") == DELTA else newest["_id"]
+    groups, items, length = _replay(base_id, upto=newest)
+    if groups is None:
+        return None
+    return {"base": base_id, "length": length, "hashes": hash_items(items), "last": newest["_id"]}
+
+
+def _materialize_items(docs):
+    """Yield (doc, groups, items) for stored documents in ascending time order.
+
+    Chains of different subscriptions may be interleaved, so the rebuilt
+    state is tracked per subscription. The lookup tables are updated in
+    place for the next document, so copy them to keep them around.
+    """
+    states = {}
+    for doc in docs:
+        doc = unpack(doc)
+        subscription_id = doc.get("subscription_id")
+        base_id, groups, items = states.get(subscription_id, (None, None, None))
+        if doc.get("storage") == DELTA:
+            if base_id != doc["base"]:
+                # Chain started before the first requested document
+                groups, items, _ = _replay(doc["base"], upto=doc)
+                if groups is None:
+                    states.pop(subscription_id, None)
+                    continue
+                states[subscription_id] = (doc["base"], groups, items)
+            else:
+                apply_delta(groups, items, doc)
+        else:
+            groups, items = index_snapshot(doc)
+            states[subscription_id] = (doc["_id"], groups, items)
+        yield doc, groups, items
+
+
+def _materialize(docs):
+    """Yield (doc, full snapshot) for stored documents in ascending time order."""
+    for doc, groups, items in _materialize_items(docs):
+        yield doc, build_snapshot(groups, items, doc)
+
+
+def _materialize_desc(docs):
+    """Like _materialize, for documents in descending time order.
+
+    Documents are buffered one delta chain at a time (at most
+    SNAPSHOT_KEYFRAME_INTERVAL of them), rebuilt oldest first and yielded
+    newest first.
+    """
+    chain = []
+    for doc in docs:
+        chain.append(doc)
+        if doc.get("storage") != DELTA:
+            yield from reversed(list(_materialize(reversed(chain))))
+            chain = []
+    if chain:
+        yield from reversed(list(_materialize(reversed(chain))))
+
+
+def encode_cursor(doc, field):
+    """Opaque keyset cursor pointing just past ``doc`` in (field, _id) order."""
+    raw = f"{doc[field].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        value, oid = raw.rsplit("|", 1)
+        return datetime.fromisoformat(value), ObjectId(oid)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def _page_query(field, cursor=None, since=None, until=None):
+    """Query for documents older than ``cursor`` within [since, until)."""
+    query = {}
+    if since is not None or until is not None:
+        query[field] = {}
+        if since is not None:
+            query[field]["$gte"] = since
+        if until is not None:
+            query[field]["$lt"] = until
+    if cursor:
+        value, oid = decode_cursor(cursor)
+        keyset = {"$or": [{field: {"$lt": value}}, {field: value, "_id": {"$lt": oid}}]}
+        query = {"$and": [query, keyset]} if query else keyset
+    return query
+
+
+def _project(doc, fields):
+    if fields is None:
+        return doc
+    return {k: v for k, v in doc.items() if k in fields and k not in INTERNAL_FIELDS}
+
+
+def _summarize(snapshot):
+    """Set the counts kept as plain fields next to the (possibly packed) resources."""
+    snapshot["group_count"] = len(snapshot.get("resources") or [])
+    snapshot["resource_count"] = sum(len(group.get("resources") or []) for group in snapshot.get("resources") or [])
+
+
+def _insert_snapshot(doc):
+    if SNAPSHOT_ENCODING == "packed":
+        doc = pack(doc)
+    return snapshots_collection.insert_one(doc).inserted_id
+
+
+def _record_history(changes, snapshot_id, data):
+    """Append the added/changed/removed resources of a saved snapshot to the history."""
+    entries = []
+    base = {"timestamp": data["timestamp"], "subscription_id": data.get("subscription_id"), "snapshot_id": snapshot_id}
+    for change in ("added", "changed"):
+        for entry in changes[change]:
+            resource = entry["resource"]
+            entries.append(dict(base, resource_id=resource_key(entry["resource_group"], resource), change=change,
+                                resource_group=entry["resource_group"], resource=resource))
+    for key in changes["removed"]:
+        entries.append(dict(base, resource_id=key, change="removed"))
+    for i in range(0, len(entries), HISTORY_INSERT_BATCH):
+        history_collection.insert_many(entries[i:i + HISTORY_INSERT_BATCH], ordered=False)
+
+
+def _chain_lock(subscription_id):
+    with _chain_locks_lock:
+        return _chain_locks[subscription_id]
 
 
 # Check if environment variables are set
 def save_snapshot(data):
+    """Store a snapshot, chained with earlier snapshots of its ``subscription_id``,
+    and record its changes in the resource history."""
     data["timestamp"] = datetime.utcnow()
-    snapshots_collection.insert_one(data)
+    _summarize(data)
+
+    subscription_id = data.get("subscription_id")
+    with _chain_lock(subscription_id):
+        chain = _chains.get(subscription_id)
+        # The cached chain is only valid while this process wrote the newest
+        # snapshot; deltas against a stale chain would corrupt the history
+        newest = _newest_snapshot(subscription_id)
+        if chain is None or newest is None or chain["last"] != newest["_id"]:
+            chain = _chains[subscription_id] = _load_chain(subscription_id)
+        changes, hashes = encode_delta(chain["hashes"] if chain else {}, data)
+
+        if SNAPSHOT_STORAGE != "delta" or chain is None or chain["length"] + 1 >= SNAPSHOT_KEYFRAME_INTERVAL:
+            if SNAPSHOT_STORAGE == "delta":
+                data["storage"] = KEYFRAME
+            snapshot_id = _insert_snapshot(data)
+            _chains[subscription_id] = {"base": snapshot_id, "length": 0, "hashes": hashes, "last": snapshot_id}
+        else:
+            doc = {k: v for k, v in data.items() if k != "resources"}
+            doc.update(changes, storage=DELTA, base=chain["base"])
+            snapshot_id = _insert_snapshot(doc)
+            chain["length"] += 1
+            chain["hashes"] = hashes
+            chain["last"] = snapshot_id
+        _record_history(changes, snapshot_id, data)
+
+def iter_snapshots(cursor=None, since=None, until=None, fields=None, limit=None, subscription_id=None):
+    """Yield (cursor, snapshot) pairs, newest first.
+
+    ``cursor`` resumes after a previously yielded snapshot, ``since``/``until``
+    bound the timestamp, ``subscription_id`` selects one subscription and
+    ``fields`` restricts the top-level fields returned. Snapshots are only
+    rebuilt from deltas when ``resources`` is requested.
+    """
+    query = _page_query("timestamp", cursor, since, until)
+    if subscription_id is not None:
+        query = {"$and": [query, {"subscription_id": subscription_id}]} if query else {"subscription_id": subscription_id}
+    order = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+    if fields is not None and "resources" not in fields:
+        projection = {f: 1 for f in fields}
+        projection["timestamp"] = 1
+        docs = snapshots_collection.find(query, projection).sort(order).limit(limit or 0)
+        for doc in docs:
+            yield encode_cursor(doc, "timestamp"), _project(doc, fields)
+        return
+
+    docs = snapshots_collection.find(query).sort(order).limit(limit or 0)
+    for doc, snapshot in _materialize_desc(docs):
+        yield encode_cursor(doc, "timestamp"), _project(snapshot, fields)
+
+def iter_resource_history(resource_id, cursor=None, since=None, until=None, fields=None, limit=None):
+    """Yield (cursor, change) pairs for one resource, newest first.
+
+    ``resource_id`` is the ARM id in any case. Each change has the snapshot
+    ``timestamp``, ``change`` (added, changed or removed) and, unless
+    removed, the ``resource`` and its ``resource_group``.
+    """
+    projection = None
+    if fields is not None:
+        projection = {f: 1 for f in fields}
+        projection["timestamp"] = 1
+    query = _page_query("timestamp", cursor, since, until)
+    owner = {"resource_id": resource_id.lower()}
+    query = {"$and": [owner, query]} if query else owner
+    order = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+    docs = history_collection.find(query, projection).sort(order).limit(limit or 0)
+    for doc in docs:
+        next_cursor = encode_cursor(doc, "timestamp")
+        doc.pop("_id")
+        if "snapshot_id" in doc:
+            doc["snapshot_id"] = str(doc["snapshot_id"])
+        yield next_cursor, _project(doc, fields)
+
 
 #def get_latest_snapshot():
-def get_snapshots():
-    return list(snapshots_collection.find({}, {"_id": 0}).sort("timestamp", -1))
+def get_snapshots(**kwargs):
+    return [snapshot for _, snapshot in iter_snapshots(**kwargs)]
+
+
+def subscription_ids():
+    """Subscriptions with stored snapshots; None stands for snapshots saved without one."""
+    ids = sorted(s for s in snapshots_collection.distinct("subscription_id") if s is not None)
+    if snapshots_collection.find_one({"subscription_id": None}, {"_id": 1}) is not None:
+        ids.insert(0, None)
+    return ids
+
+
+def get_latest_snapshots():
+    """Rebuild the newest snapshot of every subscription, newest first."""
+    # Snapshots saved before subscriptions were tagged are only shown when
+    # there is nothing newer
+    ids = subscription_ids()
+    latest = []
+    for subscription_id in [s for s in ids if s is not None] or ids:
+        doc = snapshots_collection.find_one(
+            {"subscription_id": subscription_id}, sort=[("timestamp", -1), ("_id", -1)]
+        )
+        latest.extend(snapshot for _, snapshot in _materialize([doc]))
+    return sorted(latest, key=lambda s: s["timestamp"], reverse=True)
+
+
+def latest_snapshot_items(subscription_id=None, count=2):
+    """Lookup tables of the ``count`` newest snapshots of a subscription, oldest first.
+
+    Returns (doc, items) pairs (see snapshot_delta.index_snapshot) without
+    rebuilding the nested layout. Resources unchanged between consecutive
+    snapshots of a delta chain share the same (group, resource) tuple.
+    """
+    docs = list(snapshots_collection.find({"subscription_id": subscription_id})
+                .sort([("timestamp", -1), ("_id", -1)]).limit(count))
+    return [(doc, dict(items)) for doc, _, items in _materialize_items(reversed(docs))]
+
+
+def get_snapshot_at(when, subscription_id=None):
+    """Rebuild the snapshot of ``subscription_id`` that was current at ``when``, or None."""
+    query = {"timestamp": {"$lte": when}}
+    if subscription_id is not None:
+        query["subscription_id"] = subscription_id
+    doc = snapshots_collection.find_one(query, sort=[("timestamp", -1), ("_id", -1)])
+    if doc is None:
+        return None
+    return next((snapshot for _, snapshot in _materialize([doc])), None)
+
+
+def _rollup_bucket(timestamp, daily_cutoff):
+    if timestamp < daily_cutoff:
+        return "day", timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return "hour", timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _write_rollup(snapshots):
+    """Store (granularity, snapshot) pairs as fresh keyframe/delta chains; returns the count.
+
+    Every run of one granularity starts with a keyframe, so a later rollup
+    can rewrite the hourly part without touching the daily one before it.
+    """
+    chain, granularity, written = None, None, 0
+    for level, snapshot in snapshots:
+        written += 1
+        _summarize(snapshot)
+        if (chain is None or level != granularity or SNAPSHOT_STORAGE != "delta"
+                or chain["length"] + 1 >= SNAPSHOT_KEYFRAME_INTERVAL):
+            _, items = index_snapshot(snapshot)
+            doc = dict(snapshot, storage=KEYFRAME, granularity=level)
+            base = _insert_snapshot(doc)
+            chain, granularity = {"base": base, "length": 0, "hashes": hash_items(items)}, level
+            continue
+        fields, chain["hashes"] = encode_delta(chain["hashes"], snapshot)
+        doc = {k: v for k, v in snapshot.items() if k != "resources"}
+        doc.update(fields, storage=DELTA, base=chain["base"], granularity=level)
+        _insert_snapshot(doc)
+        chain["length"] += 1
+    return written
+
+
+def rollup_snapshots(now=None):
+    """Downsample old snapshots: one per hour after SNAPSHOT_HOURLY_AFTER_DAYS,
+    one per day after SNAPSHOT_DAILY_AFTER_DAYS.
+
+    The last snapshot of each bucket is kept. Only whole delta chains that
+    ended before the hourly cutoff are rewritten, so the chain currently being
+    appended to is never touched, and snapshots already at their final
+    granularity are not read again. Each subscription's chains are rolled
+    up separately. Returns counts of the run.
+    """
+    now = now or datetime.utcnow()
+    hourly_cutoff = now - timedelta(days=SNAPSHOT_HOURLY_AFTER_DAYS)
+    daily_cutoff = now - timedelta(days=SNAPSHOT_DAILY_AFTER_DAYS)
+    stats = {"scanned": 0, "kept": 0, "removed": 0}
+    for subscription_id in subscription_ids():
+        for key, value in _rollup_subscription(subscription_id, hourly_cutoff, daily_cutoff).items():
+            stats[key] += value
+    return stats
+
+
+def _rollup_subscription(subscription_id, hourly_cutoff, daily_cutoff):
+    stats = {"scanned": 0, "kept": 0, "removed": 0}
+    owner = {"subscription_id": subscription_id}
+
+    # Stop at the keyframe of the chain holding the first snapshot after the
+    # cutoff, or of the open chain when every snapshot is older than that
+    recent = snapshots_collection.find_one(
+        dict(owner, timestamp={"$gt": hourly_cutoff}), {"timestamp": 1, "storage": 1, "base": 1}, sort=[("timestamp", 1), ("_id", 1)]
+    )
+    if recent is None:
+        boundary = snapshots_collection.find_one(
+            dict(owner, storage={"$ne": DELTA}), {"timestamp": 1}, sort=[("timestamp", -1), ("_id", -1)]
+        )
+    elif recent.get("storage") == DELTA:
+        boundary = snapshots_collection.find_one({"_id": recent["base"]}, {"timestamp": 1})
+    else:
+        boundary = recent
+    if boundary is None:
+        return stats
+    # Oldest snapshot not yet at its final granularity: raw snapshots and
+    # hourly rollups that have since aged past the daily cutoff
+    start = snapshots_collection.find_one(
+        {"subscription_id": subscription_id, "timestamp": {"$lt": boundary["timestamp"]},
+         "$or": [{"granularity": {"$exists": False}}, {"granularity": "hour", "timestamp": {"$lt": daily_cutoff}}]},
+        {"timestamp": 1}, sort=[("timestamp", 1), ("_id", 1)],
+    )
+    if start is None:
+        return stats
+
+    # Rolled-up documents are written while the old ones are still being
+    # read; ids issued from here on are greater than ``marker``
+    marker = ObjectId()
+    query = dict(owner, timestamp={"$gte": start["timestamp"], "$lt": boundary["timestamp"]}, _id={"$lt": marker})
+    docs = snapshots_collection.find(query).sort([("timestamp", 1), ("_id", 1)])
+    old_ids = []
+
+    def downsample():
+        pending = None
+        for doc, snapshot in _materialize(docs):
+            old_ids.append(doc["_id"])
+            bucket = _rollup_bucket(doc["timestamp"], daily_cutoff)
+            if pending is not None and pending[0] != bucket:
+                yield pending[0][0], pending[1]
+            pending = (bucket, snapshot)
+        if pending is not None:
+            yield pending[0][0], pending[1]
+
+    # The new chains are written before the old documents are deleted so
+    # readers never see a gap
+    kept = _write_rollup(downsample())
+    for i in range(0, len(old_ids), ROLLUP_DELETE_BATCH):
+        snapshots_collection.delete_many({"_id": {"$in": old_ids[i:i + ROLLUP_DELETE_BATCH]}})
+    stats.update(scanned=len(old_ids), kept=kept, removed=len(old_ids) - kept)
+    return stats
 
 #def get_latest_snapshot():
 def save_signin_logs(logs):
+    """Upsert sign-in logs keyed on their Graph id.
+
+    Returns (new, duplicates): logs already stored are left untouched, so
+    re-ingesting a page is a no-op.
+    """
+    if not logs:
+        return 0, 0
+    if not _indexes_ready:
+        # Deduplication relies on the unique index on id
+        ensure_indexes()
+    fetched_at = datetime.utcnow()
+    ops = []
     for log in logs:
-        log["fetched_at"] = datetime.utcnow()
-    if logs:
-        logs_collection.insert_many(logs)
+        log["fetched_at"] = fetched_at
+        ops.append(UpdateOne({"id": log["id"]}, {"$setOnInsert": log}, upsert=True))
+    try:
+        inserted = logs_collection.bulk_write(ops, ordered=False).upserted_count
+    except BulkWriteError as e:
+        # Concurrent upserts of the same id lose the race on the unique index
+        if any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+            raise
+        inserted = e.details["nUpserted"]
+    return inserted, len(ops) - inserted
+
+
+def get_watermark(name):
+    state = state_collection.find_one({"_id": name})
+    return state.get("watermark") if state else None
+
+
+def set_watermark(name, value):
+    state_collection.update_one(
+        {"_id": name}, {"$set": {"watermark": value, "updated_at": datetime.utcnow()}}, upsert=True
+    )
+
+def iter_signin_logs(cursor=None, since=None, until=None, fields=None, limit=None):
+    """Yield (cursor, log) pairs, most recently fetched first."""
+    projection = None
+    if fields is not None:
+        projection = {f: 1 for f in fields}
+        projection["fetched_at"] = 1
+    query = _page_query("fetched_at", cursor, since, until)
+    order = [("fetched_at", DESCENDING), ("_id", DESCENDING)]
+    docs = logs_collection.find(query, projection).sort(order).limit(limit or 0)
+    for doc in docs:
+        next_cursor = encode_cursor(doc, "fetched_at")
+        doc.pop("_id")
+        yield next_cursor, _project(doc, fields)
 
 #def get_latest_signin_logs():
-def get_signin_logs():
-    return list(logs_collection.find({}, {"_id": 0}).sort("fetched_at", -1))
+def get_signin_logs(**kwargs):
+    return [log for _, log in iter_signin_logs(**kwargs)]
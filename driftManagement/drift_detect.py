@@ -1,19 +1,14 @@
 import logging
+import math
+import time
 import json
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
 import numpy as np
 from dataclasses import dataclass
+from metrics import DRIFT_SCORE_ROWS, DRIFT_SCORE_SECONDS
 
-# Configure structured logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('drift_management.log'),
-        logging.StreamHandler()
-    ]
-)
+# Handlers are set up by the entry point (logging_config.configure_logging)
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -24,6 +19,187 @@ class DriftSeverity:
     MEDIUM: float = 0.4
     LOW: float = 0.2
 
+SEVERITY_LABELS = np.array(["CRITICAL", "HIGH", "MEDIUM", "LOW"])
+
+# Rows scored per vectorized step in batch scoring, bounding temporary memory
+BATCH_CHUNK_ROWS = 4096
+
+ArrayLike = Union[np.ndarray, Sequence[Sequence[float]]]
+
+
+def _as_rows(values: ArrayLike, mask: Optional[np.ndarray], dtype) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (values, mask) as 2-D arrays, padding ragged row lists."""
+    if isinstance(values, np.ndarray):
+        values = np.asarray(values, dtype=dtype)
+        if values.ndim == 1:
+            values = values[np.newaxis, :]
+        if mask is None:
+            mask = np.ones(values.shape, dtype=bool)
+        return values, np.asarray(mask, dtype=bool).reshape(values.shape)
+
+    width = max((len(row) for row in values), default=0)
+    padded = np.zeros((len(values), width), dtype=dtype)
+    valid = np.zeros((len(values), width), dtype=bool)
+    for i, row in enumerate(values):
+        padded[i, :len(row)] = row
+        valid[i, :len(row)] = True
+    if mask is not None:
+        valid &= np.asarray(mask, dtype=bool)
+    return padded, valid
+
+
+def _zscores(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Row-wise z-scores over the masked positions; constant rows become zeros."""
+    count = np.maximum(mask.sum(axis=1, keepdims=True), 1).astype(values.dtype)
+    mean = np.where(mask, values, 0).sum(axis=1, keepdims=True) / count
+    centered = np.where(mask, values - mean, 0)
+    std = np.sqrt((centered * centered).sum(axis=1, keepdims=True) / count)
+    return np.where(std > 0, centered / np.where(std > 0, std, 1), 0).astype(values.dtype, copy=False)
+
+
+def _softmax(z: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Row-wise softmax over the masked positions (zero elsewhere)."""
+    shifted = np.where(mask, z, -np.inf)
+    peak = shifted.max(axis=1, keepdims=True)
+    peak = np.where(np.isfinite(peak), peak, 0)
+    weights = np.where(mask, np.exp(np.where(mask, z - peak, 0)), 0)
+    total = weights.sum(axis=1, keepdims=True)
+    return weights / np.where(total > 0, total, 1)
+
+
+def kl_scores(baseline: np.ndarray, baseline_mask: np.ndarray,
+              current: np.ndarray, current_mask: np.ndarray) -> np.ndarray:
+    """KL(current || baseline) per row of paired series.
+
+    Each series is z-scored on its own valid values, then turned into a
+    probability distribution over the positions both series share with a
+    softmax, which keeps every term positive so the log is always defined.
+    """
+    width = min(baseline.shape[1], current.shape[1])
+    shared = baseline_mask[:, :width] & current_mask[:, :width]
+    p_baseline = _softmax(_zscores(baseline, baseline_mask)[:, :width], shared)
+    p_current = _softmax(_zscores(current, current_mask)[:, :width], shared)
+
+    tiny = np.finfo(baseline.dtype).tiny
+    ratio = np.maximum(p_current, tiny) / np.maximum(p_baseline, tiny)
+    terms = np.where(shared & (p_current > 0), p_current * np.log(ratio), 0)
+    return np.maximum(terms.sum(axis=1), 0)
+
+
+# Added to every histogram bin before comparing sketches so empty bins do not
+# make KL/PSI infinite
+SKETCH_SMOOTHING = 1e-6
+
+
+class MetricSketch:
+    """Constant-size summary of a metric's distribution.
+
+    Keeps a fixed-bin histogram over [low, high) with one underflow and one
+    overflow bin, plus a running count/mean/M2 (Welford). Raw samples are
+    never retained, so memory per metric does not grow with traffic.
+    Sketches with the same bin layout can be merged, e.g. across workers,
+    and round-trip through ``to_dict``/``from_dict`` for persistence.
+    """
+
+    def __init__(self, low: float, high: float, bins: int = 32):
+        if high <= low or bins < 1:
+            raise ValueError("MetricSketch needs low < high and at least one bin")
+        self.low = float(low)
+        self.high = float(high)
+        self.bins = bins
+        self.counts = np.zeros(bins + 2, dtype=np.int64)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def _bin_index(self, values: np.ndarray) -> np.ndarray:
+        width = (self.high - self.low) / self.bins
+        index = np.floor((values - self.low) / width).astype(np.int64) + 1
+        return np.clip(index, 0, self.bins + 1)
+
+    def add(self, value: float) -> None:
+        """Add one observation (Welford update)."""
+        self.counts[self._bin_index(np.array([value], dtype=float))[0]] += 1
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def update(self, values: Sequence[float]) -> None:
+        """Add a batch of observations in one vectorized step."""
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return
+        self.counts += np.bincount(self._bin_index(values), minlength=self.bins + 2)
+        mean = float(values.mean())
+        self._combine(values.size, mean, float(((values - mean) ** 2).sum()))
+
+    def _combine(self, count: int, mean: float, m2: float) -> None:
+        # Chan et al. parallel form of Welford's update
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def merge(self, other: "MetricSketch") -> "MetricSketch":
+        """Fold another sketch with the same bin layout into this one."""
+        if (self.low, self.high, self.bins) != (other.low, other.high, other.bins):
+            raise ValueError("Cannot merge sketches with different bin layouts")
+        if other.count:
+            self.counts += other.counts
+            self._combine(other.count, other.mean, other.m2)
+        return self
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+    def probabilities(self, smoothing: float = SKETCH_SMOOTHING) -> np.ndarray:
+        smoothed = self.counts + smoothing
+        return smoothed / smoothed.sum()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "low": self.low, "high": self.high, "bins": self.bins,
+            "counts": self.counts.tolist(), "count": self.count, "mean": self.mean, "m2": self.m2,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MetricSketch":
+        sketch = cls(data["low"], data["high"], data["bins"])
+        sketch.counts = np.asarray(data["counts"], dtype=np.int64)
+        sketch.count = data["count"]
+        sketch.mean = data["mean"]
+        sketch.m2 = data["m2"]
+        return sketch
+
+
+def kl_divergence(p: np.ndarray, q: np.ndarray) -> float:
+    """KL(p || q) of two strictly positive probability vectors."""
+    return float(np.sum(p * np.log(p / q)))
+
+
+def population_stability_index(p: np.ndarray, q: np.ndarray) -> float:
+    return float(np.sum((p - q) * np.log(p / q)))
+
+
+def js_divergence(p: np.ndarray, q: np.ndarray) -> float:
+    m = (p + q) / 2
+    return 0.5 * kl_divergence(p, m) + 0.5 * kl_divergence(q, m)
+
+
+SKETCH_DIVERGENCES = {
+    "kl": kl_divergence,
+    "psi": population_stability_index,
+    "js": js_divergence,
+}
+
+
 # This class is responsible for detecting drift in data distributions.
 # It uses KL divergence to measure the difference between two distributions.
 class DriftDetector:
@@ -32,34 +208,127 @@ class DriftDetector:
         self.severity_levels = DriftSeverity()
         logger.info("Initialized DriftDetector with tolerance: %f", tolerance)
 
-    def normalize_data(self, data: List[float]) -> List[float]:
+    def normalize_data(self, data: Sequence[float]) -> np.ndarray:
         """Normalize data to handle noisy inputs."""
-        if not data:
-            return []
-        mean = np.mean(data)
-        std = np.std(data)
-        if std == 0:
-            return [0] * len(data)
-        return [(x - mean) / std for x in data]
-
-    def calculate_drift_score(self, baseline: List[float], current: List[float]) -> float:
+        if len(data) == 0:
+            return np.array([])
+        values = np.asarray(data, dtype=float)
+        return _zscores(values[np.newaxis, :], np.ones((1, len(values)), dtype=bool))[0]
+
+    def calculate_drift_score(self, baseline: Sequence[float], current: Sequence[float]) -> float:
         """Calculate drift score with noise tolerance."""
-        if not baseline or not current:
+        if len(baseline) == 0 or len(current) == 0:
             return 0.0
 
-        baseline_norm = self.normalize_data(baseline)
-        current_norm = self.normalize_data(current)
-        
-        # Calculate KL divergence
-        kl_div = np.sum(np.where(current_norm != 0, 
-                                current_norm * np.log(current_norm / baseline_norm), 0))
-        
-        # Apply noise tolerance
-        drift_score = max(0, kl_div - self.tolerance)
+        started = time.perf_counter()
+        drift_score = self._drift_scores([baseline], [current])[0]
+        DRIFT_SCORE_SECONDS.labels("single").observe(time.perf_counter() - started)
+        DRIFT_SCORE_ROWS.labels("single").inc()
         logger.debug("Calculated drift score: %f", drift_score)
         return float(drift_score)
 
-#     def log_drift_detection(self, drift_score: float, severity: str):
+    def calculate_drift_scores(self, baselines: ArrayLike, currents: ArrayLike,
+                               baseline_mask: Optional[np.ndarray] = None,
+                               current_mask: Optional[np.ndarray] = None,
+                               tolerance: Union[float, np.ndarray, None] = None,
+                               dtype=np.float64) -> np.ndarray:
+        """Score many baseline/current pairs at once, one metric per row.
+
+        Rows may be ragged: pass lists of lists, or 2-D arrays with boolean
+        masks marking the valid entries. ``tolerance`` defaults to the
+        detector's and may be a per-row array. Pass ``dtype=np.float32`` to
+        halve memory and bandwidth on large batches.
+        """
+        started = time.perf_counter()
+        scores = self._drift_scores(baselines, currents, baseline_mask, current_mask, tolerance, dtype)
+        DRIFT_SCORE_SECONDS.labels("batch").observe(time.perf_counter() - started)
+        DRIFT_SCORE_ROWS.labels("batch").inc(len(scores))
+        return scores
+
+    def _drift_scores(self, baselines: ArrayLike, currents: ArrayLike,
+                      baseline_mask: Optional[np.ndarray] = None,
+                      current_mask: Optional[np.ndarray] = None,
+                      tolerance: Union[float, np.ndarray, None] = None,
+                      dtype=np.float64) -> np.ndarray:
+        baselines, baseline_mask = _as_rows(baselines, baseline_mask, dtype)
+        currents, current_mask = _as_rows(currents, current_mask, dtype)
+        if baselines.shape[0] != currents.shape[0]:
+            raise ValueError("baselines and currents must have the same number of rows")
+
+        rows = baselines.shape[0]
+        kl = np.empty(rows, dtype=dtype)
+        for start in range(0, rows, BATCH_CHUNK_ROWS):
+            end = start + BATCH_CHUNK_ROWS
+            kl[start:end] = kl_scores(baselines[start:end], baseline_mask[start:end],
+                                      currents[start:end], current_mask[start:end])
+
+        tolerance = self.tolerance if tolerance is None else np.asarray(tolerance, dtype=dtype)
+        scores = np.maximum(kl - tolerance, 0)
+        # Series with no values on either side do not drift
+        empty = ~baseline_mask.any(axis=1) | ~current_mask.any(axis=1)
+        return np.where(empty, 0, scores).astype(dtype, copy=False)
+
+    def determine_severities(self, drift_scores: np.ndarray, thresholds: Optional[np.ndarray] = None) -> np.ndarray:
+        """Vectorized determine_severity.
+
+        ``thresholds`` optionally gives per-row (critical, high, medium)
+        boundaries as an array of shape (rows, 3).
+        """
+        drift_scores = np.asarray(drift_scores)
+        if thresholds is None:
+            levels = self.severity_levels
+            critical, high, medium = levels.CRITICAL, levels.HIGH, levels.MEDIUM
+        else:
+            thresholds = np.asarray(thresholds)
+            critical, high, medium = thresholds[:, 0], thresholds[:, 1], thresholds[:, 2]
+        index = np.select(
+            [drift_scores >= critical, drift_scores >= high, drift_scores >= medium], [0, 1, 2], default=3
+        )
+        return SEVERITY_LABELS[index]
+
+    def detect_drift_batch(self, baselines: ArrayLike, currents: ArrayLike,
+                           baseline_mask: Optional[np.ndarray] = None,
+                           current_mask: Optional[np.ndarray] = None,
+                           dtype=np.float64) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (drift scores, severities) for every row in one pass."""
+        scores = self.calculate_drift_scores(baselines, currents, baseline_mask, current_mask, dtype=dtype)
+        severities = self.determine_severities(scores)
+        logger.info("Batch drift detection completed for %d metrics", len(scores))
+        return scores, severities
+
+    def calculate_sketch_drift(self, baseline: MetricSketch, current: MetricSketch, method: str = "kl") -> float:
+        """Drift score between two sketches in O(bins).
+
+        ``method`` is one of "kl" (KL(current || baseline)), "psi" or "js".
+        """
+        if method not in SKETCH_DIVERGENCES:
+            raise ValueError(f"Unknown divergence {method!r}; expected one of {sorted(SKETCH_DIVERGENCES)}")
+        if (baseline.low, baseline.high, baseline.bins) != (current.low, current.high, current.bins):
+            raise ValueError("Cannot compare sketches with different bin layouts")
+        if not baseline.count or not current.count:
+            return 0.0
+        divergence = SKETCH_DIVERGENCES[method](current.probabilities(), baseline.probabilities())
+        return float(max(0.0, divergence - self.tolerance))
+
+    def detect_sketch_drift(self, baseline: MetricSketch, current: MetricSketch, method: str = "kl") -> Dict[str, Any]:
+        """detect_drift for streaming sketches instead of raw sample lists."""
+        drift_score = self.calculate_sketch_drift(baseline, current, method)
+        result = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "drift_score": drift_score,
+            "severity": self.determine_severity(drift_score),
+            "baseline_size": baseline.count,
+            "current_size": current.count,
+            "tolerance": self.tolerance,
+            "method": method,
+            "baseline_mean": baseline.mean,
+            "current_mean": current.mean,
+            "baseline_std": baseline.std,
+            "current_std": current.std,
+        }
+        logger.info("Sketch drift detection completed", extra=result)
+        return result
+
     def determine_severity(self, drift_score: float) -> str:
         """Determine severity level based on drift score."""
         if drift_score >= self.severity_levels.CRITICAL:
@@ -112,5 +381,152 @@ class DriftDetector:
         logger.info("Generated drift summary", extra=summary)
         return summary
 
+class _RingWindow:
+    """Fixed-capacity FIFO of floats with running (shifted) sum and sum of squares.
+
+    Every ``capacity`` pushes the shift is moved to the current mean and the
+    sums are recomputed from the stored values, so after a level change the
+    sums stay small and their rounding errors do not linger. That costs
+    O(capacity) once per ``capacity`` pushes, O(1) amortized.
+    """
+
+    __slots__ = ("values", "capacity", "start", "size", "shift", "total", "total_sq", "pushes")
+
+    def __init__(self, capacity: int):
+        self.values = [0.0] * capacity
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.pushes = 0
+
+    def push(self, value: float) -> Optional[float]:
+        """Append a value; return the evicted oldest value once full."""
+        if self.shift is None:
+            # Summing value - shift avoids cancellation in the variance
+            self.shift = value
+        evicted = None
+        if self.size == self.capacity:
+            evicted = self.values[self.start]
+            self.values[self.start] = value
+            self.start = (self.start + 1) % self.capacity
+            offset = evicted - self.shift
+            self.total -= offset
+            self.total_sq -= offset * offset
+        else:
+            self.values[(self.start + self.size) % self.capacity] = value
+            self.size += 1
+        offset = value - self.shift
+        self.total += offset
+        self.total_sq += offset * offset
+        self.pushes += 1
+        if self.pushes >= self.capacity:
+            self._rebase()
+        return evicted
+
+    def _rebase(self) -> None:
+        # Only reached once the window is full, so every slot holds a value
+        self.shift = math.fsum(self.values) / self.size
+        offsets = [value - self.shift for value in self.values]
+        self.total = math.fsum(offsets)
+        self.total_sq = math.fsum(offset * offset for offset in offsets)
+        self.pushes = 0
+
+    def mean(self) -> float:
+        return self.shift + self.total / self.size
+
+    def variance(self) -> float:
+        mean_offset = self.total / self.size
+        return max(self.total_sq / self.size - mean_offset * mean_offset, 0.0)
+
+
+class DriftMonitor:
+    """Stateful drift detection over sliding windows, one pair of windows per metric key.
+
+    Each observation enters the key's recent window; values pushed out of
+    the recent window move into the reference window. Both windows keep
+    running sums, so an update is O(1) regardless of window size. Drift is
+    the KL divergence between normal fits of the two windows, and a
+    ``detect_drift``-shaped result is returned only when a key's severity
+    moves across a DriftSeverity boundary.
+    """
+
+    # Variance floor, relative to the reference level, so constant windows compare sanely
+    VARIANCE_FLOOR = 1e-9
+
+    def __init__(self, detector: Optional[DriftDetector] = None, reference_size: int = 500,
+                 recent_size: int = 100, min_samples: int = 30):
+        self.detector = detector or DriftDetector()
+        self.reference_size = reference_size
+        self.recent_size = recent_size
+        self.min_samples = min_samples
+        self._windows: Dict[Any, Tuple[_RingWindow, _RingWindow]] = {}
+        self._severity: Dict[Any, str] = {}
+
+    def _score(self, reference: _RingWindow, recent: _RingWindow) -> float:
+        mean_ref, mean_cur = reference.mean(), recent.mean()
+        floor = self.VARIANCE_FLOOR * (1.0 + mean_ref * mean_ref)
+        var_ref = max(reference.variance(), floor)
+        var_cur = max(recent.variance(), floor)
+        kl = 0.5 * (np.log(var_ref / var_cur) + (var_cur + (mean_cur - mean_ref) ** 2) / var_ref - 1.0)
+        return float(max(0.0, kl - self.detector.tolerance))
+
+    def observe(self, key: Any, value: float) -> Optional[Dict[str, Any]]:
+        """Add one observation for ``key``; return a result if its severity changed."""
+        windows = self._windows.get(key)
+        if windows is None:
+            windows = self._windows[key] = (_RingWindow(self.reference_size), _RingWindow(self.recent_size))
+            self._severity[key] = "LOW"
+        reference, recent = windows
+
+        evicted = recent.push(float(value))
+        if evicted is not None:
+            reference.push(evicted)
+        if reference.size < self.min_samples or recent.size < self.min_samples:
+            return None
+
+        drift_score = self._score(reference, recent)
+        severity = self.detector.determine_severity(drift_score)
+        if severity == self._severity[key]:
+            return None
+
+        previous, self._severity[key] = self._severity[key], severity
+        result = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "metric": key,
+            "drift_score": drift_score,
+            "severity": severity,
+            "previous_severity": previous,
+            "baseline_size": reference.size,
+            "current_size": recent.size,
+            "tolerance": self.detector.tolerance,
+        }
+        logger.info("Drift severity changed", extra=result)
+        return result
+
+    def observe_many(self, key: Any, values: Sequence[float]) -> List[Dict[str, Any]]:
+        """Feed several observations in order; return every severity change."""
+        results = []
+        for value in values:
+            result = self.observe(key, value)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def severity(self, key: Any) -> Optional[str]:
+        return self._severity.get(key)
+
+    def reset(self, key: Any) -> None:
+        self._windows.pop(key, None)
+        self._severity.pop(key, None)
+
+
 if __name__ == "__main__":
-    detect_drift()
+    # Print the current snapshot drift report
+    import drift_results
+    from logging_config import configure_logging
+
+    configure_logging()
+    print(json.dumps(drift_results.snapshot_drift(), indent=2, default=str))
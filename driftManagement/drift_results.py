@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import db
+from drift_detect import SEVERITY_LABELS, DriftDetector
+from snapshot_diff import assess, diff_items
+from tenant_eval import evaluate_tenants
+
+# Latest drift report, recomputed by the collection jobs and served as is
+RESULTS_COLLECTION = "drift_results"
+LATEST = "latest"
+# Sign-in series below these severities are left out of the report
+REPORTED_SEVERITIES = ("CRITICAL", "HIGH", "MEDIUM")
+# Per-resource lists of a snapshot diff, merged across subscriptions
+DIFF_LISTS = ("added", "removed", "changed", "moved", "tags_changed", "location_changed")
+# How long a process serves its cached report before checking Mongo for a newer one
+RESULTS_CACHE_SECONDS = float(os.getenv("DRIFT_RESULTS_CACHE_SECONDS", "5"))
+
+_cache = {"doc": None, "checked": 0.0}
+_cache_lock = threading.Lock()
+
+
+def results_collection():
+    return db.db[RESULTS_COLLECTION]
+
+
+def snapshot_drift(detector=None):
+    """Resource drift between the two newest snapshots of each subscription.
+
+    Lists the resources added, removed, changed in place, moved to another
+    resource group, and those whose tags or location changed (see
+    snapshot_diff.diff_items). ``timestamp`` is the newest snapshot overall;
+    ``subscriptions`` holds the pair of timestamps compared, the drift score
+    and the severity for every subscription, and the top-level score and
+    severity are those of the worst one.
+    """
+    detector = detector or DriftDetector()
+    report = {key: [] for key in DIFF_LISTS}
+    report["subscriptions"] = {}
+    named = [s for s in db.subscription_ids() if s is not None]
+    for subscription_id in named or [None]:
+        latest = db.latest_snapshot_items(subscription_id)
+        if len(latest) < 2:
+            continue
+        (previous, previous_items), (current, current_items) = latest
+        diff = assess(diff_items(previous_items, current_items), detector)
+        for key in DIFF_LISTS:
+            report[key].extend(diff[key])
+        report["subscriptions"][subscription_id or "default"] = {
+            "timestamp": current["timestamp"], "previous_timestamp": previous["timestamp"],
+            "resources": diff["total"], "drift_score": diff["drift_score"], "severity": diff["severity"],
+        }
+    if not report["subscriptions"]:
+        return None
+    for key in DIFF_LISTS:
+        report[key].sort(key=lambda entry: entry if isinstance(entry, str) else entry["id"])
+    pairs = report["subscriptions"].values()
+    report["timestamp"] = max(pair["timestamp"] for pair in pairs)
+    report["previous_timestamp"] = max(pair["previous_timestamp"] for pair in pairs)
+    report["drift_score"] = max(pair["drift_score"] for pair in pairs)
+    report["severity"] = detector.determine_severity(report["drift_score"])
+    return report
+
+
+def compute_drift(detector=None):
+    """Build the drift report: snapshot changes plus drifting sign-in series.
+
+    Sign-in series are scored with each tenant's drift configs; series a
+    tenant asked to be alerted on are reported whatever their severity.
+    """
+    detector = detector or DriftDetector()
+    signins = [row for row in evaluate_tenants(detector) if row["severity"] in REPORTED_SEVERITIES or row["alert"]]
+    signins.sort(key=lambda row: row["drift_score"], reverse=True)
+    severities = {label: 0 for label in SEVERITY_LABELS}
+    for row in signins:
+        severities[row["severity"]] += 1
+    return {"snapshots": snapshot_drift(detector), "signins": signins, "signin_severities": severities}
+
+
+def report_etag(report):
+    payload = json.dumps(report, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _remember(doc):
+    with _cache_lock:
+        _cache["doc"] = doc
+        _cache["checked"] = time.monotonic()
+
+
+def refresh_drift_results(detector=None):
+    """Recompute the report and store it if it changed; returns the stored document.
+
+    ``updated_at`` only moves when the report content changes, so clients
+    revalidating with ETag or Last-Modified keep getting 304s in between.
+    """
+    report = compute_drift(detector)
+    etag = report_etag(report)
+    stored = results_collection().find_one({"_id": LATEST})
+    if stored is None or stored["etag"] != etag:
+        # HTTP dates have second precision
+        stored = {"_id": LATEST, "etag": etag, "updated_at": datetime.utcnow().replace(microsecond=0),
+                  "report": report}
+        results_collection().replace_one({"_id": LATEST}, stored, upsert=True)
+    _remember(stored)
+    return stored
+
+
+def get_drift_results():
+    """Latest stored report, from the process cache when it is fresh enough.
+
+    Once the cache is older than RESULTS_CACHE_SECONDS only the etag is read
+    back; the full report is fetched again only if another process stored a
+    newer one. Computes the first report if none exists yet.
+    """
+    with _cache_lock:
+        doc, checked = _cache["doc"], _cache["checked"]
+    if doc is not None and time.monotonic() - checked < RESULTS_CACHE_SECONDS:
+        return doc
+
+    latest = results_collection().find_one({"_id": LATEST}, {"etag": 1})
+    if latest is None:
+        return refresh_drift_results()
+    if doc is None or latest["etag"] != doc["etag"]:
+        doc = results_collection().find_one({"_id": LATEST})
+    _remember(doc)
+    return doc
+
+
+def clear_cache():
+    _remember(None)
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from drift_results import get_drift_results
+
+logger = logging.getLogger(__name__)
+
+# How often the watcher checks for new drift results, and how long an idle
+# stream waits before sending a keep-alive comment
+EVENTS_POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "2"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+# Browser reconnect delay sent to EventSource clients, in milliseconds
+EVENTS_RETRY_MS = 5000
+
+
+def _encode(value):
+    return json.dumps(value, separators=(",", ":"), default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+
+
+class EventBroadcaster:
+    """Fan out drift result changes to any number of server-sent event streams.
+
+    One watcher thread per process polls ``load`` (the cached drift results)
+    and publishes a new state when its etag changes; streams block on a
+    condition until then, so idle clients cost no queries and no traffic
+    beyond keep-alives.
+    """
+
+    def __init__(self, load=get_drift_results, interval=EVENTS_POLL_SECONDS):
+        self._load = load
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stop = threading.Event()
+        self.etag = None
+        self.events = ()
+
+    def check(self):
+        """Publish the current results if they changed; returns True if so."""
+        results = self._load()
+        if results is None or results["etag"] == self.etag:
+            return False
+        report = results["report"]
+        snapshot = report.get("snapshots") or {}
+        events = (
+            ("snapshot", _encode({"timestamp": snapshot.get("timestamp")})),
+            ("drift", _encode(report)),
+        )
+        with self._cond:
+            self.etag, self.events = results["etag"], events
+            self._cond.notify_all()
+        return True
+
+    def _watch(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning("Failed to check drift results for events: %s", e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, name="drift-events", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, last_etag, timeout):
+        """Block until the published etag differs from ``last_etag`` or ``timeout`` passes."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.etag is not None and self.etag != last_etag, timeout)
+            return self.etag, self.events
+
+    def stream(self, last_etag=None, heartbeat=EVENTS_HEARTBEAT_SECONDS):
+        """Yield text/event-stream chunks, starting with the state after ``last_etag``.
+
+        The event id is the results etag, so a reconnecting EventSource sends
+        it back as Last-Event-ID and only receives events it has not seen.
+        """
+        self.start()
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        while True:
+            etag, events = self.wait(last_etag, heartbeat)
+            if etag is None or etag == last_etag:
+                yield ": keep-alive\n\n"
+                continue
+            for name, data in events:
+                yield f"id: {etag}\nevent: {name}\ndata: {data}\n\n"
+            last_etag = etag
+
+
+broadcaster = EventBroadcaster()
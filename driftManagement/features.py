@@ -0,0 +1,183 @@
+import os
+from datetime import datetime, timedelta
+import numpy as np
+import db
+from drift_detect import DriftDetector
+from ingest import GRAPH_TIME_FORMAT, parse_graph_time
+
+# Sign-in counts are bucketed per tenant, dimension value and time bucket
+SERIES_COLLECTION = "signin_series"
+# ingest_state key holding the newest fetched_at already folded into the series
+SERIES_STATE_KEY = "signin_series:fetched_at"
+SERIES_BUCKET = os.getenv("SIGNIN_SERIES_BUCKET", "hour")
+# Buckets per drift window: the last window is compared with the one before it
+SERIES_WINDOW = int(os.getenv("SIGNIN_SERIES_WINDOW", "24"))
+
+BUCKET_SIZES = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+# Dimension name -> field path in a Graph signIn document
+DIMENSIONS = {
+    "user": "$userPrincipalName",
+    "app": "$appDisplayName",
+    "location": "$location.countryOrRegion",
+    "status": "$status.errorCode",
+}
+
+
+def series_collection():
+    return db.db[SERIES_COLLECTION]
+
+
+def bucket_start(when, unit=SERIES_BUCKET):
+    """Truncate a datetime to the start of its bucket."""
+    if unit == "day":
+        return when.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "hour":
+        return when.replace(minute=0, second=0, microsecond=0)
+    if unit == "minute":
+        return when.replace(second=0, microsecond=0)
+    raise ValueError(f"Unsupported bucket unit {unit!r}; expected one of {sorted(BUCKET_SIZES)}")
+
+
+def build_series_pipeline(since=None, unit=SERIES_BUCKET):
+    """Aggregation that recounts every bucket from ``since`` and merges it into the series.
+
+    ``since`` must be a bucket boundary (a Graph timestamp string) so that
+    each bucket it touches is recounted in full and replaced, which keeps
+    the update idempotent.
+    """
+    pipeline = []
+    if since:
+        # createdDateTime is an ISO 8601 string, so string order is time order
+        # across seconds; within one, "...:00.5Z" sorts before "...:00Z". Without
+        # its "Z" the bound is a prefix of every timestamp in its second.
+        pipeline.append({"$match": {"createdDateTime": {"$gte": since.rstrip("Z")}}})
+    pipeline += [
+        {"$project": {
+            "_id": 0,
+            "tenant_id": 1,
+            "bucket": {"$dateTrunc": {"date": {"$toDate": "$createdDateTime"}, "unit": unit}},
+            "failed": {"$ne": [{"$ifNull": ["$status.errorCode", 0]}, 0]},
+            "dims": [{"d": name, "k": path} for name, path in DIMENSIONS.items()],
+        }},
+        {"$unwind": "$dims"},
+        {"$group": {
+            "_id": {"tenant_id": "$tenant_id", "dimension": "$dims.d", "key": "$dims.k", "bucket": "$bucket"},
+            "count": {"$sum": 1},
+            "failures": {"$sum": {"$cond": ["$failed", 1, 0]}},
+        }},
+        {"$project": {
+            "tenant_id": "$_id.tenant_id", "dimension": "$_id.dimension", "key": "$_id.key",
+            "bucket": "$_id.bucket", "count": 1, "failures": 1,
+        }},
+        {"$merge": {"into": SERIES_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    return pipeline
+
+
+def update_signin_series():
+    """Fold sign-ins ingested since the last update into the series collection.
+
+    Only the buckets from the one holding the oldest createdDateTime among
+    the newly fetched logs onward are recounted, inside MongoDB; no raw log
+    crosses the wire. Going by fetch time rather than creation time picks
+    up backfills, such as the retry of a tenant whose watermark was held
+    back, whose sign-ins are older than ones already counted.
+    """
+    previous = db.get_watermark(SERIES_STATE_KEY)
+    fetched = {"fetched_at": {"$gt": previous}} if previous else {}
+    newest = db.logs_collection.find_one(fetched, {"fetched_at": 1}, sort=[("fetched_at", -1)])
+    if newest is None:
+        return {"updated": False, "since": None}
+
+    since = None
+    if previous:
+        oldest = db.logs_collection.find_one(fetched, {"createdDateTime": 1}, sort=[("createdDateTime", 1)])
+        since = bucket_start(parse_graph_time(oldest["createdDateTime"])).strftime(GRAPH_TIME_FORMAT)
+    db.logs_collection.aggregate(build_series_pipeline(since))
+    db.set_watermark(SERIES_STATE_KEY, newest["fetched_at"])
+    return {"updated": True, "since": since}
+
+
+def load_series(dimension, since, until=None, tenant_id=None):
+    """Return {(tenant_id, key): {bucket: count}} for one dimension."""
+    query = {"dimension": dimension, "bucket": {"$gte": since}}
+    if until is not None:
+        query["bucket"]["$lt"] = until
+    if tenant_id is not None:
+        query["tenant_id"] = tenant_id
+    series = {}
+    projection = {"_id": 0, "tenant_id": 1, "key": 1, "bucket": 1, "count": 1}
+    for doc in series_collection().find(query, projection):
+        series.setdefault((doc.get("tenant_id"), doc.get("key")), {})[doc["bucket"]] = doc["count"]
+    return series
+
+
+def series_windows(series, end, window=SERIES_WINDOW, unit=SERIES_BUCKET):
+    """Turn sparse bucket counts into (keys, baselines, currents) count vectors.
+
+    The current window is the ``window`` buckets before ``end`` and the
+    baseline is the window before that; buckets with no sign-ins count 0.
+    """
+    step = BUCKET_SIZES[unit]
+    end = bucket_start(end, unit)
+    grid = [end - step * (2 * window - i) for i in range(2 * window)]
+    keys, baselines, currents = [], [], []
+    for key, counts in series.items():
+        values = [counts.get(bucket, 0) for bucket in grid]
+        keys.append(key)
+        baselines.append(values[:window])
+        currents.append(values[window:])
+    return keys, baselines, currents
+
+
+def level_scores(baselines, currents):
+    """How far each current window's mean count moved from its baseline's.
+
+    DriftDetector z-scores each window, so it scores the shape of a series
+    but not its size: a uniform surge, or a drop to zero, keeps the shape.
+    This is the mean term of the KL divergence between normal fits of the
+    two windows, 0.5 * shift^2 / baseline variance. Counts are taken to be
+    at least Poisson-noisy (variance no less than the mean, nor than 1), so
+    a quiet series does not drift on one extra sign-in.
+    """
+    baselines = np.asarray(baselines, dtype=float)
+    currents = np.asarray(currents, dtype=float)
+    mean = baselines.mean(axis=1)
+    variance = np.maximum(baselines.var(axis=1), np.maximum(mean, 1.0))
+    shift = currents.mean(axis=1) - mean
+    return 0.5 * shift * shift / variance
+
+
+def series_drift_scores(detector, baselines, currents, tolerance=None):
+    """Drift of count windows: the larger of the detector's shape score and the level score.
+
+    ``tolerance`` (the detector's by default, or one per row) is taken off both.
+    """
+    shape = detector.calculate_drift_scores(baselines, currents, tolerance=tolerance)
+    tolerance = detector.tolerance if tolerance is None else np.asarray(tolerance, dtype=float)
+    return np.maximum(shape, np.maximum(level_scores(baselines, currents) - tolerance, 0))
+
+
+def score_signin_series(dimension, detector=None, end=None, window=SERIES_WINDOW, unit=SERIES_BUCKET):
+    """Score every series of a dimension with DriftDetector in one batch."""
+    detector = detector or DriftDetector()
+    end = end or datetime.utcnow()
+    since = bucket_start(end, unit) - BUCKET_SIZES[unit] * 2 * window
+    keys, baselines, currents = series_windows(load_series(dimension, since, end), end, window, unit)
+    if not keys:
+        return []
+    scores = series_drift_scores(detector, baselines, currents)
+    severities = detector.determine_severities(scores)
+    return [
+        {
+            "tenant_id": tenant_id,
+            "dimension": dimension,
+            "key": key,
+            "drift_score": float(score),
+            "severity": str(severity),
+            "baseline_total": int(sum(baseline)),
+            "current_total": int(sum(current)),
+        }
+        for (tenant_id, key), score, severity, baseline, current in zip(keys, scores, severities, baselines, currents)
+    ]
@@ -0,0 +1,129 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import GRAPH_PAGES, GRAPH_REQUESTS, GRAPH_THROTTLED
+
+# Statuses Graph uses for throttling and transient failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GraphError(Exception):
+    """Raised when a Graph request fails for good (non-retryable or retries exhausted)."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"Graph request failed: {status_code} {message}")
+        self.status_code = status_code
+
+
+def retry_after_seconds(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date); None if absent or invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class GraphClient:
+    """Microsoft Graph client sharing one pooled keep-alive session across threads.
+
+    Throttled (429) and transient 5xx responses are retried with exponential
+    backoff and jitter, waiting at least as long as the Retry-After header asks.
+    """
+
+    def __init__(self, token_provider, pool_size=10, max_retries=5, backoff=0.5, max_backoff=60.0,
+                 timeout=30, sleep=time.sleep):
+        self.token_provider = token_provider
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._sleep = sleep
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.stats = {"requests": 0, "pages": 0, "throttled": 0, "retries": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def _delay(self, attempt, response):
+        retry_after = retry_after_seconds(response.headers.get("Retry-After")) if response is not None else None
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        return max(delay, retry_after or 0.0)
+
+    def get(self, url, params=None):
+        """GET a Graph URL and return the decoded JSON body."""
+        for attempt in range(self.max_retries + 1):
+            headers = {"Authorization": f"Bearer {self.token_provider()}"}
+            response = None
+            try:
+                response = self.session.get(url, headers=headers, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = GraphError(None, str(e))
+            else:
+                self._count(requests=1)
+                GRAPH_REQUESTS.labels(response.status_code).inc()
+                if response.status_code == 200:
+                    return response.json()
+                error = GraphError(response.status_code, response.text)
+                if response.status_code == 429:
+                    self._count(throttled=1)
+                    GRAPH_THROTTLED.inc()
+                if response.status_code not in RETRY_STATUSES:
+                    raise error
+
+            if attempt == self.max_retries:
+                raise error
+            self._count(retries=1)
+            self._sleep(self._delay(attempt, response))
+
+    def iter_pages(self, url, params=None):
+        """Yield the ``value`` list of every page, following @odata.nextLink."""
+        while url:
+            data = self.get(url, params=params)
+            self._count(pages=1)
+            GRAPH_PAGES.inc()
+            yield data.get("value", [])
+            url = data.get("@odata.nextLink")
+            params = None  # nextLink already carries the query
+
+    def close(self):
+        self.session.close()
+
+
+def run_concurrently(tasks, max_workers):
+    """Run zero-argument callables on a bounded thread pool.
+
+    Returns one (result, exception) pair per task, in task order, so one
+    failing stream does not discard the others.
+    """
+    def call(task):
+        try:
+            return task(), None
+        except Exception as e:
+            return None, e
+
+    if max_workers <= 1 or len(tasks) <= 1:
+        return [call(task) for task in tasks]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(call, tasks))
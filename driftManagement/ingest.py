@@ -1,33 +1,147 @@
-import requests
-from auth import get_graph_token
-from db import save_signin_logs
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from functools import partial
+from auth import TENANT_ID, get_graph_token
+from db import get_watermark, save_signin_logs, set_watermark
+from graph_client import GraphClient, run_concurrently
+from metrics import SIGNINS
+
+logger = logging.getLogger(__name__)
 
 GRAPH_ENDPOINT = "https://graph.microsoft.com/v1.0/auditLogs/signIns"
 
+# Key of the persisted createdDateTime high-watermark in ingest_state
+WATERMARK_KEY = "signin_logs"
+
+# Tenants to ingest (default: AZURE_TENANT_ID only), how many Graph streams to
+# fetch at once and how many time slices to split each tenant's window into
+TENANT_IDS = [t.strip() for t in os.getenv("AZURE_TENANT_IDS", "").split(",") if t.strip()]
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+INGEST_SLICES = int(os.getenv("INGEST_SLICES", "4"))
+# Window fetched on a tenant's first run (Graph keeps sign-ins for 30 days)
+INGEST_LOOKBACK_DAYS = int(os.getenv("INGEST_LOOKBACK_DAYS", "30"))
+MIN_SLICE = timedelta(hours=1)
+
+GRAPH_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Counters of the most recent run, also returned by ingest_signin_logs
+last_run_stats = {}
+
+_clients = {}
+
+
+def get_client(tenant_id=None):
+    """Shared pooled Graph client per tenant."""
+    if tenant_id not in _clients:
+        _clients[tenant_id] = GraphClient(partial(get_graph_token, tenant_id), pool_size=max(INGEST_CONCURRENCY, 1))
+    return _clients[tenant_id]
+
+
+def watermark_key(tenant_id):
+    return f"{WATERMARK_KEY}:{tenant_id}" if tenant_id else WATERMARK_KEY
+
+
+def parse_graph_time(value):
+    """Parse a Graph timestamp such as 2024-01-01T10:00:00.1234567Z as naive UTC."""
+    match = re.match(r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d+))?", value)
+    parsed = datetime.strptime(match.group(1), "%Y-%m-%dT%H:%M:%S")
+    if match.group(2):
+        parsed += timedelta(microseconds=int(match.group(2)[:6].ljust(6, "0")))
+    return parsed
+
+
+def later(a, b):
+    """Whether Graph timestamp ``a`` is after ``b``.
+
+    Compared as times: as strings, "...:00.5Z" sorts before "...:00Z".
+    """
+    return parse_graph_time(a) > parse_graph_time(b)
+
+
+def time_slices(watermark, now):
+    """Split [watermark, now) into createdDateTime $filter clauses.
+
+    The first slice starts exactly at the stored watermark and the last one
+    is open-ended, so sign-ins created while the run is going are not missed.
+    """
+    start = parse_graph_time(watermark) if watermark else now - timedelta(days=INGEST_LOOKBACK_DAYS)
+    lower = watermark or start.strftime(GRAPH_TIME_FORMAT)
+    count = max(1, min(INGEST_SLICES, int((now - start) / MIN_SLICE)))
+    step = (now - start) / count
+
+    filters = []
+    for i in range(1, count):
+        upper = (start + step * i).strftime(GRAPH_TIME_FORMAT)
+        filters.append(f"createdDateTime ge {lower} and createdDateTime lt {upper}")
+        lower = upper
+    filters.append(f"createdDateTime ge {lower}")
+    return filters
+
+
+def ingest_stream(tenant_id, graph_filter):
+    """Fetch one filtered stream of sign-ins, upserting each page as it arrives."""
+    stats = {"pages": 0, "fetched": 0, "inserted": 0, "duplicates": 0, "newest": None}
+    for page in get_client(tenant_id).iter_pages(GRAPH_ENDPOINT, params={"$filter": graph_filter}):
+        for log in page:
+            log["tenant_id"] = tenant_id or TENANT_ID
+            created = log.get("createdDateTime")
+            if created and (stats["newest"] is None or later(created, stats["newest"])):
+                stats["newest"] = created
+        inserted, duplicates = save_signin_logs(page)
+        stats["pages"] += 1
+        stats["fetched"] += len(page)
+        stats["inserted"] += inserted
+        stats["duplicates"] += duplicates
+        SIGNINS.labels("fetched").inc(len(page))
+        SIGNINS.labels("inserted").inc(inserted)
+        SIGNINS.labels("duplicate").inc(duplicates)
+    return stats
+
+
 def ingest_signin_logs():
-    token = get_graph_token()
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
-
-    logs = []
-    url = GRAPH_ENDPOINT
-
-    while url:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            print(f"Failed to fetch logs: {response.status_code} {response.text}")
-            break
-
-        data = response.json()
-        logs.extend(data.get("value", []))
-        url = data.get("@odata.nextLink")  # Handle pagination
-
-    if logs:
-        save_signin_logs(logs)
-        print(f"{len(logs)} sign-in logs ingested.")
+    """Fetch sign-ins created since each tenant's watermark, several streams at a time."""
+    now = datetime.utcnow()
+    tenants = TENANT_IDS or [None]
+    watermarks = {tenant: get_watermark(watermark_key(tenant)) for tenant in tenants}
+    throttled_before = sum(get_client(t).stats["throttled"] for t in tenants)
+
+    streams = [(tenant, graph_filter) for tenant in tenants for graph_filter in time_slices(watermarks[tenant], now)]
+    results = run_concurrently([partial(ingest_stream, *stream) for stream in streams], INGEST_CONCURRENCY)
+
+    stats = {"pages": 0, "fetched": 0, "inserted": 0, "duplicates": 0, "streams": len(streams), "failed": 0}
+    newest = dict(watermarks)
+    failed_tenants = set()
+    for (tenant, graph_filter), (result, error) in zip(streams, results):
+        if error is not None:
+            logger.error("Failed to fetch logs (%s): %s", graph_filter, error)
+            stats["failed"] += 1
+            failed_tenants.add(tenant)
+            continue
+        for name in ("pages", "fetched", "inserted", "duplicates"):
+            stats[name] += result[name]
+        if result["newest"] and (newest[tenant] is None or later(result["newest"], newest[tenant])):
+            newest[tenant] = result["newest"]
+
+    # A tenant's watermark only advances once all of its slices are stored
+    for tenant in tenants:
+        if tenant not in failed_tenants and newest[tenant] != watermarks[tenant]:
+            set_watermark(watermark_key(tenant), newest[tenant])
+    stats["complete"] = not failed_tenants
+    stats["watermark"] = newest[None] if tenants == [None] else {t: newest[t] for t in tenants}
+    stats["throttled"] = sum(get_client(t).stats["throttled"] for t in tenants) - throttled_before
+
+    last_run_stats.clear()
+    last_run_stats.update(stats)
+    if stats["inserted"]:
+        logger.info("%d sign-in logs ingested (%d duplicates skipped)", stats["inserted"], stats["duplicates"])
     else:
-        print("No new sign-in logs found.")
+        logger.info("No new sign-in logs found")
+    return stats
 
 if __name__ == "__main__":
+    from logging_config import configure_logging
+
+    configure_logging()
     ingest_signin_logs()
@@ -0,0 +1,209 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+from apscheduler.schedulers.background import BackgroundScheduler
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import db
+from metrics import JOB_LAG_SECONDS, JOB_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LEASES_COLLECTION = "leases"
+JOB_RUNS_COLLECTION = "job_runs"
+LEADER_LEASE = "scheduler"
+LEASE_JOB_ID = "leader-lease"
+
+# The leader renews its lease every third of LEADER_LEASE_SECONDS; a follower
+# takes over at most this long after the leader stops renewing
+LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", "60"))
+# Upper bound on a single job run; a crashed runner's job lock expires after it
+JOB_LOCK_SECONDS = int(os.getenv("JOB_LOCK_SECONDS", "3600"))
+JOB_RUN_RETENTION_DAYS = int(os.getenv("JOB_RUN_RETENTION_DAYS", "30"))
+
+# Late runs are merged into one, never run twice at once, and dropped if
+# they could not start within a minute of their scheduled time
+JOB_DEFAULTS = {"coalesce": True, "max_instances": 1, "misfire_grace_time": 60}
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _utc(value):
+    """Aware scheduler datetime -> naive UTC, as stored in Mongo."""
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class MongoLease:
+    """Time-bound lock held by one owner, stored as a document in ``leases``.
+
+    ``acquire`` both takes a free or expired lease and renews one already
+    held. Expiry is compared against the wall clock of the caller, so hosts
+    must agree on the time to within a fraction of ``seconds``.
+    """
+
+    def __init__(self, name, owner, seconds, collection=None, clock=datetime.utcnow):
+        self.name = name
+        self.owner = owner
+        self.seconds = seconds
+        self._collection = collection
+        self._clock = clock
+
+    @property
+    def collection(self):
+        return self._collection if self._collection is not None else db.db[LEASES_COLLECTION]
+
+    def acquire(self):
+        now = self._clock()
+        try:
+            self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.seconds), "renewed_at": now}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            return True
+        except DuplicateKeyError:
+            # The lease exists and another owner holds it
+            return False
+
+    def release(self):
+        self.collection.update_one({"_id": self.name, "owner": self.owner}, {"$set": {"expires_at": self._clock()}})
+
+    def holder(self):
+        lease = self.collection.find_one({"_id": self.name})
+        if lease is None or lease["expires_at"] <= self._clock():
+            return None
+        return lease["owner"]
+
+
+class JobRunner:
+    """APScheduler wrapper that runs jobs in one elected process only.
+
+    Every process runs the same schedule, but only the holder of the leader
+    lease executes job bodies; followers just try to take the lease over
+    every renewal interval. A per-job lock additionally skips a run while a
+    previous leader is still finishing the same job. Runs are recorded in
+    ``job_runs`` with their duration and their lag behind the schedule.
+    """
+
+    def __init__(self, owner=None, lease_seconds=LEADER_LEASE_SECONDS, database=None, scheduler=None,
+                 clock=datetime.utcnow):
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self._db = database
+        self._clock = clock
+        self.lease = MongoLease(LEADER_LEASE, self.owner, lease_seconds, self._collection(LEASES_COLLECTION), clock)
+        self.scheduler = scheduler or BackgroundScheduler(job_defaults=JOB_DEFAULTS)
+        self.scheduler.add_listener(self._record, EVENT_JOB_EXECUTED | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+        self._leader_until = None
+        self._lock = threading.Lock()
+        self.last_runs = {}
+
+    def _collection(self, name):
+        # None lets MongoLease resolve db.db at call time
+        return None if self._db is None else self._db[name]
+
+    @property
+    def runs_collection(self):
+        return (self._db if self._db is not None else db.db)[JOB_RUNS_COLLECTION]
+
+    @property
+    def is_leader(self):
+        # Leadership ends locally one renewal interval before the lease
+        # expires in Mongo, so two processes never both believe they lead
+        until = self._leader_until
+        return until is not None and time.monotonic() < until
+
+    def renew(self):
+        """Take or extend the leader lease; returns whether this process leads."""
+        started = time.monotonic()
+        try:
+            acquired = self.lease.acquire()
+        except Exception as e:
+            logger.warning("Failed to renew leader lease: %s", e)
+            return self.is_leader
+        with self._lock:
+            was_leader = self.is_leader
+            self._leader_until = started + self.lease_seconds * 2 / 3 if acquired else None
+        if acquired != was_leader:
+            logger.info("%s %s the job leader", self.owner, "is now" if acquired else "is no longer")
+        return acquired
+
+    def add_job(self, func, trigger="interval", name=None, lock_seconds=JOB_LOCK_SECONDS, **trigger_args):
+        name = name or func.__name__
+        self.scheduler.add_job(self.run, trigger, args=(name, func, lock_seconds), id=name, name=name,
+                               replace_existing=True, **trigger_args)
+
+    def run(self, name, func, lock_seconds=JOB_LOCK_SECONDS):
+        """Run one job if this process leads; returns the run record, or None on followers."""
+        if not self.is_leader:
+            return None
+        run = {"job": name, "owner": self.owner, "started_at": self._clock()}
+        lock = MongoLease(f"job:{name}", self.owner, lock_seconds, self._collection(LEASES_COLLECTION), self._clock)
+        if not lock.acquire():
+            run.update(status="skipped", duration=0.0, error="previous run still in progress")
+            return run
+
+        started = time.perf_counter()
+        try:
+            func()
+            run.update(status="ok", error=None)
+        except Exception as e:
+            logger.exception("Job %s failed", name)
+            run.update(status="failed", error=str(e))
+        finally:
+            lock.release()
+        run["duration"] = time.perf_counter() - started
+        return run
+
+    def _record(self, event):
+        if event.job_id == LEASE_JOB_ID:
+            return
+        if event.code == EVENT_JOB_EXECUTED:
+            run = event.retval
+            if not run:
+                return
+            run["scheduled_at"] = _utc(event.scheduled_run_time)
+            run["lag"] = max((run["started_at"] - run["scheduled_at"]).total_seconds(), 0.0)
+        elif self.is_leader:
+            # The scheduler skipped the run: still running, or too late to start
+            scheduled = getattr(event, "scheduled_run_time", None) or event.scheduled_run_times[0]
+            run = {
+                "job": event.job_id, "owner": self.owner, "scheduled_at": _utc(scheduled),
+                "status": "missed" if event.code == EVENT_JOB_MISSED else "skipped",
+            }
+        else:
+            return
+        self.last_runs[run["job"]] = run
+        JOB_SECONDS.labels(run["job"], run["status"]).observe(run.get("duration", 0.0))
+        if "lag" in run:
+            JOB_LAG_SECONDS.labels(run["job"]).observe(run["lag"])
+        try:
+            self.runs_collection.insert_one(dict(run))
+        except Exception as e:
+            logger.warning("Failed to record run of job %s: %s", run["job"], e)
+
+    def ensure_indexes(self):
+        runs = self.runs_collection
+        runs.create_index([("job", ASCENDING), ("started_at", DESCENDING)])
+        runs.create_index([("scheduled_at", ASCENDING)], expireAfterSeconds=JOB_RUN_RETENTION_DAYS * 86400)
+
+    def start(self):
+        self.ensure_indexes()
+        self.renew()
+        self.scheduler.add_job(self.renew, "interval", seconds=max(self.lease_seconds // 3, 1), id=LEASE_JOB_ID,
+                               replace_existing=True)
+        self.scheduler.start()
+
+    def shutdown(self):
+        self.scheduler.shutdown(wait=False)
+        if self.is_leader:
+            self._leader_until = None
+            # Hand over immediately instead of after the lease expires
+            self.lease.release()
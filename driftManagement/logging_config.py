@@ -0,0 +1,56 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_FILE = os.getenv("DRIFT_LOG_FILE", "drift_management.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# The QueueHandler installed on the root logger and the pid whose listener
+# thread drains it; a forked child starts its own listener
+_state = {"handler": None, "listener": None, "pid": None}
+
+
+def configure_logging(path=None, level=None):
+    """Send log records through a queue to the file and stderr handlers.
+
+    Logging calls only enqueue the record; a QueueListener thread does the
+    formatting and I/O, so request and job threads never wait on the disk.
+    ``path`` and ``level`` default to DRIFT_LOG_FILE and LOG_LEVEL; an empty
+    path logs to stderr only. Repeated calls in the same process do nothing.
+    """
+    if _state["pid"] == os.getpid():
+        return
+    path = LOG_FILE if path is None else path
+    level = level or LOG_LEVEL
+    root = logging.getLogger()
+    if _state["handler"] is not None:
+        root.removeHandler(_state["handler"])
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if path:
+        handlers.append(logging.FileHandler(path))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    root.addHandler(handler)
+    root.setLevel(level)
+    _state.update(handler=handler, listener=listener, pid=os.getpid())
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    if _state["listener"] is not None and _state["pid"] == os.getpid():
+        _state["listener"].stop()
+        logging.getLogger().removeHandler(_state["handler"])
+    _state.update(handler=None, listener=None, pid=None)
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,92 @@
+import os
+import time
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+# Under gunicorn, point PROMETHEUS_MULTIPROC_DIR at an empty directory shared
+# by the workers so /metrics aggregates all of them instead of one
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Second-scale jobs and API calls; millisecond-scale Mongo commands and scoring
+JOB_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+SNAPSHOT_SECONDS = Histogram("drift_snapshot_collect_seconds", "Duration of collect_snapshot", buckets=JOB_BUCKETS)
+SNAPSHOT_SUBSCRIPTION_SECONDS = Histogram("drift_snapshot_subscription_seconds",
+                                          "Duration of collecting one subscription", ["subscription"],
+                                          buckets=JOB_BUCKETS)
+SNAPSHOT_FAILURES = Counter("drift_snapshot_failures_total", "Subscriptions whose collection failed",
+                            ["subscription"])
+SNAPSHOT_RESOURCES = Gauge("drift_snapshot_resources", "Resources in the last collected snapshot",
+                           ["subscription"], multiprocess_mode="liveall")
+SNAPSHOT_GROUPS = Gauge("drift_snapshot_resource_groups", "Resource groups in the last collected snapshot",
+                        ["subscription"], multiprocess_mode="liveall")
+
+GRAPH_REQUESTS = Counter("drift_graph_requests_total", "Microsoft Graph HTTP requests by status", ["status"])
+GRAPH_PAGES = Counter("drift_graph_pages_total", "Microsoft Graph result pages fetched")
+GRAPH_THROTTLED = Counter("drift_graph_throttled_total", "Microsoft Graph requests answered 429")
+SIGNINS = Counter("drift_signin_logs_total", "Sign-in logs fetched from Graph, by outcome", ["outcome"])
+
+MONGO_SECONDS = Histogram("drift_mongo_command_seconds", "MongoDB command latency", ["command"],
+                          buckets=FAST_BUCKETS)
+MONGO_FAILURES = Counter("drift_mongo_command_failures_total", "Failed MongoDB commands", ["command"])
+
+DRIFT_SCORE_SECONDS = Histogram("drift_score_seconds", "DriftDetector scoring time", ["mode"], buckets=FAST_BUCKETS)
+DRIFT_SCORE_ROWS = Counter("drift_score_rows_total", "Baseline/current pairs scored", ["mode"])
+
+JOB_SECONDS = Histogram("drift_job_seconds", "Scheduled job duration", ["job", "status"], buckets=JOB_BUCKETS)
+JOB_LAG_SECONDS = Histogram("drift_job_lag_seconds", "Delay between a job's scheduled and actual start", ["job"],
+                            buckets=FAST_BUCKETS + (10, 30, 60))
+
+REQUEST_SECONDS = Histogram("drift_http_request_seconds", "HTTP request latency", ["method", "route", "status"],
+                            buckets=FAST_BUCKETS)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener timing every command the client sends.
+
+    pymongo measures the round-trip itself, so this only costs one
+    histogram observation per command.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(event.command_name).inc()
+
+
+def render():
+    """Exposition text for every collector, across workers in multiprocess mode."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def init_app(app):
+    """Time every request by route template and serve GET /metrics."""
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(time.perf_counter() - started)
+        return response
+
+    def metrics():
+        return Response(render(), mimetype=CONTENT_TYPE_LATEST)
+
+    app.add_url_rule("/metrics", "metrics", metrics)
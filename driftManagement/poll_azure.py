@@ -1,56 +1,164 @@
 from datetime import datetime
+from functools import partial
+import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.resource.resources import ResourceManagementClient as AzureResourcesClient
 from auth import get_credentials
 from db import save_snapshot
+from graph_client import run_concurrently
+from metrics import (SNAPSHOT_FAILURES, SNAPSHOT_GROUPS, SNAPSHOT_RESOURCES, SNAPSHOT_SECONDS,
+                     SNAPSHOT_SUBSCRIPTION_SECONDS)
 
 load_dotenv()
 
-def collect_snapshot():
-    credential = get_credentials()
-    azureSub = os.getenv("AZURE_SUBSCRIPTION_ID")
-    subscription_id = f"{azureSub}"
+logger = logging.getLogger(__name__)
+
+RG_SEGMENT = "/resourcegroups/"
+
+# Subscriptions to collect (default: AZURE_SUBSCRIPTION_ID only) and how many
+# of them to collect at once
+SUBSCRIPTION_IDS = [s.strip() for s in os.getenv("AZURE_SUBSCRIPTION_IDS", "").split(",") if s.strip()]
+SNAPSHOT_CONCURRENCY = int(os.getenv("SNAPSHOT_CONCURRENCY", "8"))
+
+# Per-subscription stats of the most recent run, also returned by collect_snapshot
+last_run_stats = {}
+
+# Management clients are reused across runs; they share the cached credential
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_clients(subscription_id):
+    """Return the (resource group, resources) clients for a subscription."""
+    # The management SDK takes about half of the app's import time, so it is
+    # only loaded once a snapshot is actually collected
+    from azure.mgmt.resource import ResourceManagementClient
+    from azure.mgmt.resource.resources import ResourceManagementClient as AzureResourcesClient
+
+    with _clients_lock:
+        if subscription_id not in _clients:
+            credential = get_credentials()
+            _clients[subscription_id] = (
+                ResourceManagementClient(credential, subscription_id),
+                AzureResourcesClient(credential, subscription_id),
+            )
+        return _clients[subscription_id]
+
+
+def resource_group_of(resource_id):
+    """Return the lower-cased resource group name in an ARM id, or None."""
+    if not resource_id:
+        return None
+    lowered = resource_id.lower()
+    start = lowered.find(RG_SEGMENT)
+    if start == -1:
+        return None
+    start += len(RG_SEGMENT)
+    end = lowered.find("/", start)
+    return lowered[start:] if end == -1 else lowered[start:end]
+
+
+def subscription_ids():
+    """Subscriptions to collect: AZURE_SUBSCRIPTION_IDS, else AZURE_SUBSCRIPTION_ID."""
+    return SUBSCRIPTION_IDS or [os.getenv("AZURE_SUBSCRIPTION_ID")]
+
 
-    rg_client = ResourceManagementClient(credential, subscription_id)
-    res_client = AzureResourcesClient(credential, subscription_id)
+def _list_groups(rg_client):
+    return [(rg.name, rg.location) for rg in rg_client.resource_groups.list()]
+
+
+def _list_resources(res_client):
+    # Stream resources once, bucketing them by resource group as they arrive.
+    # Only the plain dicts are kept so the SDK models can be freed page by page.
+    by_group = {}
+    for res in res_client.resources.list():
+        by_group.setdefault(resource_group_of(res.id), []).append({
+            "name": res.name,
+            "type": res.type,
+            "location": res.location,
+            "id": res.id,
+            "tags": res.tags
+        })
+    return by_group
+
+
+def collect_subscription(subscription_id):
+    """Collect and save one subscription's snapshot; returns its counts and timing.
+
+    The resource group and resource listings run concurrently.
+    """
+    started = time.perf_counter()
+    rg_client, res_client = get_clients(subscription_id)
+    (groups, groups_error), (by_group, resources_error) = run_concurrently(
+        [partial(_list_groups, rg_client), partial(_list_resources, res_client)], 2
+    )
+    if groups_error or resources_error:
+        raise groups_error or resources_error
 
     snapshot = {
         "timestamp": datetime.utcnow().isoformat(),
+        "subscription_id": subscription_id,
         "resources": []
     }
+    for name, location in groups:
+        snapshot["resources"].append({
+            "resource_group": name,
+            "location": location,
+            "resources": by_group.pop(name.lower(), []) if name else []
+        })
 
-    # Fetch all resources once
-    all_resources = list(res_client.resources.list())
-
-    for rg in rg_client.resource_groups.list():
-        rg_data = {
-            "resource_group": rg.name,
-            "location": rg.location,
-            "resources": []
-        }
-
-        # Filter resources by current resource group
-        rg_resources = [
-            res for res in all_resources
-            if res.id and rg.name and
-            res.id.lower().split("/resourcegroups/")[1].split("/")[0] == rg.name.lower()
-        ]
-
-        for res in rg_resources:
-            rg_data["resources"].append({
-                "name": res.name,
-                "type": res.type,
-                "location": res.location,
-                "id": res.id,
-                "tags": res.tags
-            })
-
-        snapshot["resources"].append(rg_data)
+    # Resources outside any listed group: subscription-level resources (no
+    # group segment in their id) or groups created between the two listings
+    for group_name, resources in by_group.items():
+        snapshot["resources"].append({
+            "resource_group": group_name,
+            "location": None,
+            "resources": resources
+        })
 
     save_snapshot(snapshot)
-    print("Snapshot collected and saved successfully.")
+    stats = {
+        "resource_groups": len(snapshot["resources"]),
+        "resources": sum(len(group["resources"]) for group in snapshot["resources"]),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    SNAPSHOT_SUBSCRIPTION_SECONDS.labels(subscription_id).observe(stats["seconds"])
+    SNAPSHOT_GROUPS.labels(subscription_id).set(stats["resource_groups"])
+    SNAPSHOT_RESOURCES.labels(subscription_id).set(stats["resources"])
+    return stats
+
+
+def collect_snapshot():
+    """Collect every subscription on a bounded thread pool.
+
+    A failing subscription is reported and skipped; the others are still
+    saved. Returns per-subscription stats, also kept in last_run_stats.
+    """
+    started = time.perf_counter()
+    subscriptions = subscription_ids()
+    tasks = [partial(collect_subscription, subscription_id) for subscription_id in subscriptions]
+
+    stats = {}
+    for subscription_id, (result, error) in zip(subscriptions, run_concurrently(tasks, SNAPSHOT_CONCURRENCY)):
+        if error is not None:
+            SNAPSHOT_FAILURES.labels(subscription_id).inc()
+            logger.error("Snapshot of subscription %s failed: %s", subscription_id, error)
+            result = {"error": str(error)}
+        stats[subscription_id] = result
+    SNAPSHOT_SECONDS.observe(time.perf_counter() - started)
+
+    last_run_stats.clear()
+    last_run_stats.update(stats)
+    saved = sum(1 for result in stats.values() if "error" not in result)
+    if stats and not saved:
+        raise RuntimeError("Snapshot failed for every subscription")
+    logger.info("Snapshot collected and saved for %d/%d subscriptions", saved, len(stats))
+    return stats
 
 if __name__ == "__main__":
+    from logging_config import configure_logging
+
+    configure_logging()
     collect_snapshot()
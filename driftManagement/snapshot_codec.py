@@ -0,0 +1,186 @@
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import Binary
+
+# Stored documents whose resource payload (``resources`` of keyframes, the
+# change lists of deltas) is packed into the binary ``payload`` field.
+# Timestamps, subscription ids and counts stay plain, queryable fields.
+PACKED = "packed-v1"
+PAYLOAD_FIELDS = ("resources", "groups", "added", "changed", "removed")
+COMPRESSION_LEVEL = 1
+
+RG_SEGMENT = "/resourcegroups/"
+# Encoded "id" values: >= 0 is a plain string, DERIVED_ID is
+# "<group prefix>providers/<type>/<name>" and anything lower is
+# "<group prefix>" + strings[-value - 2]
+DERIVED_ID = -1
+
+
+def _group_prefix(resource_id: str) -> Optional[str]:
+    """``/subscriptions/<id>/resourceGroups/<name>/`` of an ARM id, in its original case."""
+    start = resource_id.lower().find(RG_SEGMENT)
+    if start == -1:
+        return None
+    end = resource_id.find("/", start + len(RG_SEGMENT))
+    return None if end == -1 else resource_id[:end + 1]
+
+
+class _Packer:
+    """Dictionary-encodes strings and dict layouts into JSON-compatible rows.
+
+    Strings become indexes into ``strings``; dicts become
+    ``[shape, value, ...]`` rows where ``shape`` indexes a key list in
+    ``shapes``; other values are wrapped as ``{"=": value}``.
+    """
+
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+        self.string_index: Dict[str, int] = {}
+        self.shapes: List[List[int]] = []
+        self.shape_index: Dict[Tuple[str, ...], int] = {}
+        self.prefixes: Dict[Optional[str], str] = {}
+
+    def string(self, value: str) -> int:
+        index = self.string_index.get(value)
+        if index is None:
+            index = self.string_index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def value(self, value: Any) -> Any:
+        if isinstance(value, str):
+            return self.string(value)
+        if value is None:
+            return None
+        if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+            return self.row(value)
+        return {"=": value}
+
+    def row(self, value: Dict[str, Any], resource_id: Optional[int] = None) -> List[Any]:
+        keys = tuple(value)
+        shape = self.shape_index.get(keys)
+        if shape is None:
+            shape = self.shape_index[keys] = len(self.shapes)
+            self.shapes.append([self.string(k) for k in keys])
+        if resource_id is None:
+            return [shape] + [self.value(v) for v in value.values()]
+        return [shape] + [resource_id if k == "id" else self.value(v) for k, v in value.items()]
+
+    def resource(self, resource_group: Optional[str], resource: Dict[str, Any]) -> List[Any]:
+        """Like row, with the id stored relative to the resource group when possible."""
+        resource_id = resource.get("id")
+        if not isinstance(resource_id, str):
+            return self.row(resource)
+        prefix = self.prefixes.get(resource_group)
+        if prefix is None:
+            prefix = _group_prefix(resource_id)
+            if prefix is None:
+                return self.row(resource)
+            self.prefixes[resource_group] = prefix
+        if not resource_id.startswith(prefix):
+            return self.row(resource)
+        rest = resource_id[len(prefix):]
+        if rest == f"providers/{resource.get('type')}/{resource.get('name')}":
+            return self.row(resource, DERIVED_ID)
+        return self.row(resource, -self.string(rest) - 2)
+
+
+class _Unpacker:
+    def __init__(self, strings: List[str], shapes: List[List[int]], prefixes: List[List[Any]]) -> None:
+        self.strings = strings
+        self.shapes = [[strings[k] for k in shape] for shape in shapes]
+        self.prefixes = {self.value(rg): strings[prefix] for rg, prefix in prefixes}
+
+    def value(self, value: Any) -> Any:
+        if isinstance(value, int):
+            return self.strings[value]
+        if value is None:
+            return None
+        if isinstance(value, list):
+            return self.row(value)
+        return value["="]
+
+    def row(self, row: List[Any]) -> Dict[str, Any]:
+        value = self.value
+        return dict(zip(self.shapes[row[0]], [value(v) for v in row[1:]]))
+
+    def resource(self, resource_group: Optional[str], row: List[Any]) -> Dict[str, Any]:
+        keys = self.shapes[row[0]]
+        if "id" not in keys:
+            return self.row(row)
+        position = 1 + keys.index("id")
+        encoded = row[position]
+        if not isinstance(encoded, int) or encoded >= 0:
+            return self.row(row)
+        resource = self.row(row[:position] + [None] + row[position + 1:])
+        prefix = self.prefixes[resource_group]
+        if encoded == DERIVED_ID:
+            resource["id"] = f"{prefix}providers/{resource.get('type')}/{resource.get('name')}"
+        else:
+            resource["id"] = prefix + self.strings[-encoded - 2]
+        return resource
+
+
+def pack(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of a stored keyframe or delta document with its payload packed."""
+    packer = _Packer()
+    body: Dict[str, Any] = {}
+    if "resources" in doc:
+        body["resources"] = [
+            [packer.value(group.get("resource_group")), packer.value(group.get("location")),
+             [packer.resource(group.get("resource_group"), res) for res in group.get("resources") or []]]
+            for group in doc["resources"] or []
+        ]
+    if "groups" in doc:
+        body["groups"] = [[packer.value(name), packer.value(location)] for name, location in doc["groups"]]
+    for field in ("added", "changed"):
+        if field in doc:
+            body[field] = [
+                [packer.value(entry["resource_group"]), packer.resource(entry["resource_group"], entry["resource"])]
+                for entry in doc[field]
+            ]
+    if "removed" in doc:
+        body["removed"] = [packer.string(key) for key in doc["removed"]]
+
+    body["strings"] = packer.strings
+    body["shapes"] = packer.shapes
+    body["prefixes"] = [[packer.value(rg), packer.string(prefix)] for rg, prefix in packer.prefixes.items()]
+    raw = json.dumps(body, separators=(",", ":"), default=str).encode("utf-8")
+
+    packed = {k: v for k, v in doc.items() if k not in PAYLOAD_FIELDS}
+    packed["encoding"] = PACKED
+    packed["payload"] = Binary(zlib.compress(raw, COMPRESSION_LEVEL))
+    return packed
+
+
+def unpack(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of pack; documents stored without packing are returned as is."""
+    if doc.get("encoding") != PACKED:
+        return doc
+    body = json.loads(zlib.decompress(doc["payload"]))
+    unpacker = _Unpacker(body["strings"], body["shapes"], body["prefixes"])
+    value = unpacker.value
+
+    unpacked = {k: v for k, v in doc.items() if k not in ("encoding", "payload")}
+    if "resources" in body:
+        unpacked["resources"] = []
+        for name, location, rows in body["resources"]:
+            group = value(name)
+            unpacked["resources"].append({
+                "resource_group": group,
+                "location": value(location),
+                "resources": [unpacker.resource(group, row) for row in rows],
+            })
+    if "groups" in body:
+        unpacked["groups"] = [[value(name), value(location)] for name, location in body["groups"]]
+    for field in ("added", "changed"):
+        if field in body:
+            unpacked[field] = []
+            for name, row in body[field]:
+                group = value(name)
+                unpacked[field].append({"resource_group": group, "resource": unpacker.resource(group, row)})
+    if "removed" in body:
+        unpacked["removed"] = [body["strings"][key] for key in body["removed"]]
+    return unpacked
@@ -0,0 +1,108 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# Storage kinds for documents in the snapshots collection. Documents written
+# before delta storage existed carry no "storage" field and are read as
+# keyframes.
+KEYFRAME = "keyframe"
+DELTA = "delta"
+
+# Fields that only exist in stored documents and never in rebuilt snapshots
+INTERNAL_FIELDS = ("_id", "storage", "base", "groups", "added", "changed", "removed", "encoding", "payload")
+
+# groups: {resource group name: location}, in snapshot order
+# items: {lower-cased resource id: (resource group name, resource dict)}
+Groups = Dict[Optional[str], Optional[str]]
+Items = Dict[str, Tuple[Optional[str], Dict[str, Any]]]
+
+
+def resource_key(resource_group: Optional[str], resource: Dict[str, Any]) -> str:
+    """Stable, case-insensitive key for a resource within a snapshot."""
+    if resource.get("id"):
+        return resource["id"].lower()
+    return f"{resource_group}/{resource.get('type')}/{resource.get('name')}".lower()
+
+
+def resource_hash(resource_group: Optional[str], resource: Dict[str, Any]) -> str:
+    """Content hash of a resource together with the group it lives in."""
+    payload = json.dumps([resource_group, resource], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def index_snapshot(snapshot: Dict[str, Any]) -> Tuple[Groups, Items]:
+    """Flatten the nested resource-group layout of a snapshot into lookup tables."""
+    groups: Groups = {}
+    items: Items = {}
+    for group in snapshot.get("resources") or []:
+        name = group.get("resource_group")
+        groups[name] = group.get("location")
+        for resource in group.get("resources") or []:
+            items[resource_key(name, resource)] = (name, resource)
+    return groups, items
+
+
+def hash_items(items: Items) -> Dict[str, str]:
+    return {key: resource_hash(rg, res) for key, (rg, res) in items.items()}
+
+
+def encode_delta(previous_hashes: Dict[str, str], snapshot: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Encode a snapshot as the changes against the previous snapshot's hashes.
+
+    Returns the delta fields to store and the hashes of the new snapshot,
+    which become ``previous_hashes`` for the next delta.
+    """
+    groups, items = index_snapshot(snapshot)
+    hashes = {}
+    added: List[Dict[str, Any]] = []
+    changed: List[Dict[str, Any]] = []
+
+    for key, (rg, res) in items.items():
+        digest = resource_hash(rg, res)
+        hashes[key] = digest
+        previous = previous_hashes.get(key)
+        if previous is None:
+            added.append({"resource_group": rg, "resource": res})
+        elif previous != digest:
+            changed.append({"resource_group": rg, "resource": res})
+
+    removed = [key for key in previous_hashes if key not in hashes]
+
+    delta = {
+        "groups": [[name, location] for name, location in groups.items()],
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+    }
+    return delta, hashes
+
+
+def apply_delta(groups: Groups, items: Items, delta: Dict[str, Any]) -> None:
+    """Apply a stored delta document to the lookup tables in place."""
+    groups.clear()
+    for name, location in delta.get("groups") or []:
+        groups[name] = location
+
+    for key in delta.get("removed") or []:
+        items.pop(key, None)
+    for entry in (delta.get("changed") or []) + (delta.get("added") or []):
+        rg, res = entry["resource_group"], entry["resource"]
+        items[resource_key(rg, res)] = (rg, res)
+
+
+def build_snapshot(groups: Groups, items: Items, doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild the nested snapshot layout from lookup tables.
+
+    Top-level fields other than ``resources`` (timestamp and friends) are
+    taken from ``doc``, the stored document the snapshot is rebuilt for.
+    """
+    by_group: Dict[Optional[str], List[Dict[str, Any]]] = {name: [] for name in groups}
+    for rg, res in items.values():
+        by_group.setdefault(rg, []).append(res)
+
+    snapshot = {k: v for k, v in doc.items() if k not in INTERNAL_FIELDS and k != "resources"}
+    snapshot["resources"] = [
+        {"resource_group": name, "location": groups.get(name), "resources": resources}
+        for name, resources in by_group.items()
+    ]
+    return snapshot
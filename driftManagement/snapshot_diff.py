@@ -0,0 +1,125 @@
+from typing import Any, Dict, List, Optional
+
+from snapshot_delta import Items, index_snapshot
+
+RG_SEGMENT = "/resourcegroups/"
+
+# Properties compared one by one when a resource changed; any other
+# difference is reported as a plain change
+TAGS = "tags"
+LOCATION = "location"
+
+
+def _without_group(key: str) -> Optional[str]:
+    """Lower-cased ARM id with its resource group segment removed, or None."""
+    start = key.find(RG_SEGMENT)
+    if start == -1:
+        return None
+    end = key.find("/", start + len(RG_SEGMENT))
+    return key[:start] if end == -1 else key[:start] + key[end:]
+
+
+def _tag_changes(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    before, after = before or {}, after or {}
+    return {
+        "added": {k: v for k, v in after.items() if k not in before},
+        "removed": sorted(k for k in before if k not in after),
+        "changed": {k: [before[k], v] for k, v in after.items() if k in before and before[k] != v},
+    }
+
+
+def diff_items(previous: Items, current: Items) -> Dict[str, Any]:
+    """Classify the differences between two indexed snapshots (see snapshot_delta.index_snapshot).
+
+    One pass over ``current`` looks every resource up by its lower-cased id.
+    Unchanged resources are settled by comparing the (group, resource)
+    pair: resources carried through a delta chain share the same tuple, so
+    that is an identity check, and otherwise the comparison stops at the
+    first difference. Only resources that differ have their tags and
+    location inspected.
+    Resources whose id only differs in the resource group segment are
+    reported as moved rather than as removed and added.
+
+    Returns ids (as in ``current``, or ``previous`` for removed ones) under
+    ``added``, ``removed`` and ``changed`` (any in-place change), plus
+    ``moved``, ``tags_changed`` and ``location_changed`` with the details,
+    and ``total``, the number of resources in the larger snapshot.
+    """
+    added: List[str] = []
+    changed: List[str] = []
+    moved: List[Dict[str, Any]] = []
+    tags_changed: List[Dict[str, Any]] = []
+    location_changed: List[Dict[str, Any]] = []
+    lookup = previous.get
+
+    for key, pair in current.items():
+        before = lookup(key)
+        if before is None:
+            added.append(key)
+            continue
+        if before is pair or before == pair:
+            continue
+        (old_group, old), (group, resource) = before, pair
+        resource_id = resource.get("id") or key
+        if old_group != group:
+            moved.append({"id": resource_id, "previous_id": old.get("id") or key, "from": old_group, "to": group})
+            continue
+        changed.append(resource_id)
+        if old.get(TAGS) != resource.get(TAGS):
+            tags_changed.append(dict(_tag_changes(old.get(TAGS), resource.get(TAGS)), id=resource_id))
+        if old.get(LOCATION) != resource.get(LOCATION):
+            location_changed.append({"id": resource_id, "from": old.get(LOCATION), "to": resource.get(LOCATION)})
+    removed = list(previous.keys() - current.keys())
+
+    # A move to another resource group changes the id; pair those up by the
+    # rest of the id. Only the (small) added and removed sets are scanned.
+    if added and removed:
+        gone = {}
+        for key in removed:
+            rest = _without_group(key)
+            if rest is not None:
+                gone.setdefault(rest, key)
+        matched = set()
+        still_added = []
+        for key in added:
+            rest = _without_group(key)
+            old_key = gone.pop(rest, None) if rest is not None else None
+            if old_key is None:
+                still_added.append(key)
+                continue
+            matched.add(old_key)
+            (old_group, old), (group, resource) = previous[old_key], current[key]
+            moved.append({"id": resource.get("id") or key, "previous_id": old.get("id") or old_key,
+                          "from": old_group, "to": group})
+        removed = [key for key in removed if key not in matched]
+        added = still_added
+
+    def original(keys, items):
+        return sorted(items[key][1].get("id") or key for key in keys)
+
+    return {
+        "added": original(added, current),
+        "removed": original(removed, previous),
+        "changed": sorted(changed),
+        "moved": sorted(moved, key=lambda m: m["id"]),
+        "tags_changed": sorted(tags_changed, key=lambda t: t["id"]),
+        "location_changed": sorted(location_changed, key=lambda l: l["id"]),
+        "total": max(len(previous), len(current)),
+    }
+
+
+def diff_snapshots(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """diff_items for two snapshots in the nested resource-group layout."""
+    return diff_items(index_snapshot(previous)[1], index_snapshot(current)[1])
+
+
+def drift_score(diff: Dict[str, Any], tolerance: float) -> float:
+    """Share of resources that drifted, less ``tolerance`` as noise (like DriftDetector scores)."""
+    affected = len(diff["added"]) + len(diff["removed"]) + len(diff["changed"]) + len(diff["moved"])
+    return max(min(affected / max(diff["total"], 1), 1.0) - tolerance, 0.0)
+
+
+def assess(diff: Dict[str, Any], detector) -> Dict[str, Any]:
+    """Add ``drift_score`` and the DriftDetector ``severity`` to a diff."""
+    score = drift_score(diff, detector.tolerance)
+    return dict(diff, drift_score=score, severity=detector.determine_severity(score))
@@ -24,19 +24,42 @@ document.addEventListener("DOMContentLoaded", () => {
         });
     }
 
-    // auto-refresh data every 60 seconds 
-    setInterval(() => {
-        fetch(window.location.href)
-            .then(response => response.text())
-            .then(html => {
-                const parser = new DOMParser();
-                const doc = parser.parseFromString(html, "text/html");
+    // Replace the JSON shown in a block, creating the <pre> if the block only
+    // held a placeholder message. Unchanged blocks are left alone.
+    function showJson(blockId, value) {
+        const block = document.getElementById(blockId);
+        const text = JSON.stringify(value, null, 4);
+        let pre = block.querySelector("pre.code-block");
+        if (!pre) {
+            pre = document.createElement("pre");
+            pre.className = "code-block";
+            block.replaceChildren(pre);
+        }
+        if (pre.textContent !== text) {
+            pre.textContent = text;
+        }
+    }
+
+    // Live updates: the server pushes an event only when a new snapshot or
+    // drift result lands; the page's etag tells it what we already show.
+    if (window.EventSource) {
+        let snapshotTimestamp = document.body.dataset.snapshot || null;
+        const etag = document.body.dataset.etag || "";
+        const source = new EventSource("/events?last_event_id=" + encodeURIComponent(etag));
 
-                const newSnapshots = doc.querySelector("#snapshot-block").innerHTML;
-                const newDrift = doc.querySelector("#drift-block").innerHTML;
+        source.addEventListener("drift", event => {
+            showJson("drift-block", JSON.parse(event.data));
+        });
 
-                document.querySelector("#snapshot-block").innerHTML = newSnapshots;
-                document.querySelector("#drift-block").innerHTML = newDrift;
-            });
-    }, 60000);
+        source.addEventListener("snapshot", event => {
+            const { timestamp } = JSON.parse(event.data);
+            if (!timestamp || timestamp === snapshotTimestamp) {
+                return;
+            }
+            snapshotTimestamp = timestamp;
+            fetch("/snapshots/latest")
+                .then(response => response.json())
+                .then(snapshots => showJson("snapshot-block", snapshots));
+        });
+    }
 });
@@ -0,0 +1,152 @@
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import db
+from drift_detect import DriftDetector
+from features import (BUCKET_SIZES, DIMENSIONS, SERIES_BUCKET, SERIES_WINDOW, bucket_start, series_collection,
+                      series_drift_scores, series_windows)
+
+# Per-tenant drift settings, written by taskOne's /api/drift/configs
+CONFIGS_DATABASE = os.getenv("DRIFT_CONFIGS_DATABASE", db.DATABASE_NAME)
+CONFIGS_COLLECTION = "drift_configs"
+# Numeric settings read from a config's ``thresholds``; a nested dict under a
+# dimension name (e.g. ``{"user": {"tolerance": 0.5}}``) overrides them for
+# that dimension only
+SETTINGS = ("tolerance", "critical", "high", "medium")
+
+_cache = {"version": None, "tenants": {}}
+_cache_lock = threading.Lock()
+
+
+def configs_collection():
+    return db.get_client()[CONFIGS_DATABASE][CONFIGS_COLLECTION]
+
+
+def configs_version():
+    """Cheap fingerprint of drift_configs: document count, newest _id and newest created_at.
+
+    taskOne only inserts configs (the count and newest _id change) or
+    deletes them (the count drops); it never updates one in place.
+    """
+    summary = next(configs_collection().aggregate([
+        {"$group": {"_id": None, "count": {"$sum": 1}, "newest": {"$max": "$_id"},
+                    "created": {"$max": "$created_at"}}},
+    ]), None)
+    if summary is None:
+        return (0, None, None)
+    return (summary["count"], summary["newest"], summary.get("created"))
+
+
+def _numbers(values):
+    """The numeric SETTINGS in a thresholds dict (user input, so anything else is ignored)."""
+    return {
+        name: float(values[name])
+        for name in SETTINGS
+        if isinstance(values.get(name), (int, float)) and not isinstance(values.get(name), bool)
+    }
+
+
+def _merge(tenants, config):
+    tenant = tenants.setdefault(config.get("tenant_id"), {"defaults": {}, "dimensions": {}, "alerts": set()})
+    thresholds = config.get("thresholds")
+    if isinstance(thresholds, dict):
+        tenant["defaults"].update(_numbers(thresholds))
+        for dimension in DIMENSIONS:
+            if isinstance(thresholds.get(dimension), dict):
+                tenant["dimensions"].setdefault(dimension, {}).update(_numbers(thresholds[dimension]))
+    for alert in config.get("alerts") or []:
+        severity = alert.get("severity") if isinstance(alert, dict) else alert
+        if isinstance(severity, str):
+            tenant["alerts"].add(severity.upper())
+
+
+def load_tenant_settings():
+    """Every tenant's merged drift configs, reloaded only when drift_configs changed.
+
+    Returns {tenant_id: {"defaults", "dimensions", "alerts"}}; configs of a
+    tenant are applied oldest first, so newer ones win. An unchanged
+    collection costs one aggregate round-trip.
+    """
+    version = configs_version()
+    with _cache_lock:
+        if _cache["version"] == version:
+            return _cache["tenants"]
+    tenants = {}
+    projection = {"_id": 0, "tenant_id": 1, "thresholds": 1, "alerts": 1}
+    for config in configs_collection().find({}, projection).sort([("created_at", 1), ("_id", 1)]):
+        _merge(tenants, config)
+    with _cache_lock:
+        _cache.update(version=version, tenants=tenants)
+    return tenants
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.update(version=None, tenants={})
+
+
+def row_settings(tenants, rows, detector):
+    """Per-row (tolerance, critical, high, medium) for (tenant_id, dimension, ...) row keys."""
+    levels = detector.severity_levels
+    fallback = {"tolerance": detector.tolerance, "critical": levels.CRITICAL, "high": levels.HIGH,
+                "medium": levels.MEDIUM}
+    resolved = {}
+    settings = np.empty((len(rows), len(SETTINGS)))
+    for i, (tenant_id, dimension) in enumerate(row[:2] for row in rows):
+        values = resolved.get((tenant_id, dimension))
+        if values is None:
+            tenant = tenants.get(tenant_id) or {"defaults": {}, "dimensions": {}}
+            merged = {**fallback, **tenant["defaults"], **tenant["dimensions"].get(dimension, {})}
+            values = resolved[(tenant_id, dimension)] = [merged[name] for name in SETTINGS]
+        settings[i] = values
+    return settings
+
+
+def load_all_series(since, until):
+    """Return {(tenant_id, dimension, key): {bucket: count}} for every dimension in one query."""
+    query = {"dimension": {"$in": list(DIMENSIONS)}, "bucket": {"$gte": since, "$lt": until}}
+    projection = {"_id": 0, "tenant_id": 1, "dimension": 1, "key": 1, "bucket": 1, "count": 1}
+    series = {}
+    for doc in series_collection().find(query, projection):
+        key = (doc.get("tenant_id"), doc["dimension"], doc.get("key"))
+        series.setdefault(key, {})[doc["bucket"]] = doc["count"]
+    return series
+
+
+def evaluate_tenants(detector=None, end=None, window=SERIES_WINDOW, unit=SERIES_BUCKET):
+    """Score the sign-in series of every tenant and dimension with each tenant's drift configs.
+
+    All series are scored in one batch (features.series_drift_scores)
+    with per-row tolerances and severity thresholds, so a cycle costs the
+    same few Mongo round-trips however many tenants and configs there are.
+    Rows whose severity is listed in the tenant's ``alerts`` are flagged
+    ``alert``.
+    """
+    detector = detector or DriftDetector()
+    end = end or datetime.utcnow()
+    tenants = load_tenant_settings()
+    since = bucket_start(end, unit) - BUCKET_SIZES[unit] * 2 * window
+    keys, baselines, currents = series_windows(load_all_series(since, end), end, window, unit)
+    if not keys:
+        return []
+    settings = row_settings(tenants, keys, detector)
+    scores = series_drift_scores(detector, baselines, currents, tolerance=settings[:, 0])
+    severities = detector.determine_severities(scores, settings[:, 1:])
+    no_alerts = set()
+    return [
+        {
+            "tenant_id": tenant_id,
+            "dimension": dimension,
+            "key": key,
+            "drift_score": float(score),
+            "severity": str(severity),
+            "alert": str(severity) in (tenants.get(tenant_id) or {}).get("alerts", no_alerts),
+            "baseline_total": int(sum(baseline)),
+            "current_total": int(sum(current)),
+        }
+        for (tenant_id, dimension, key), score, severity, baseline, current
+        in zip(keys, scores, severities, baselines, currents)
+    ]
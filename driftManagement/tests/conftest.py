@@ -0,0 +1,34 @@
+import os
+
+import mongomock
+import pytest
+
+import db
+import mongomock_compat
+
+mongomock_compat.install()
+
+
+@pytest.fixture(autouse=True)
+def no_live_mongo(monkeypatch):
+    """Any client db.py opens during a test is an in-memory mongomock one."""
+    monkeypatch.setattr(db, "MongoClient", lambda *args, **kwargs: mongomock.MongoClient())
+    monkeypatch.setattr(db, "_client", None)
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    """Point db.py at an in-memory mongomock database."""
+    client = mongomock.MongoClient()
+    database = client[db.DATABASE_NAME]
+    monkeypatch.setattr(db, "_client", client)
+    monkeypatch.setattr(db, "_client_pid", os.getpid())
+    # Concrete collections rather than the lazy handles, so tests can patch their methods
+    monkeypatch.setattr(db, "db", database)
+    monkeypatch.setattr(db, "snapshots_collection", database["snapshots"])
+    monkeypatch.setattr(db, "logs_collection", database["signin_logs"])
+    monkeypatch.setattr(db, "state_collection", database["ingest_state"])
+    monkeypatch.setattr(db, "history_collection", database["resource_history"])
+    monkeypatch.setattr(db, "_indexes_ready", False)
+    monkeypatch.setattr(db, "_chains", {})
+    return database
@@ -0,0 +1,115 @@
+"""Local stand-in for the Microsoft Graph sign-in log endpoint."""
+import bisect
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+SIGNINS_PATH = "/v1.0/auditLogs/signIns"
+
+
+def make_signins(count, start_minute=0):
+    return [
+        {
+            "id": f"signin-{i}",
+            "createdDateTime": f"2024-01-01T{(start_minute + i) // 60 % 24:02d}:{(start_minute + i) % 60:02d}:00Z",
+            "userPrincipalName": f"user{i % 7}@contoso.com",
+            "appDisplayName": "Portal",
+        }
+        for i in range(count)
+    ]
+
+
+class GraphStub:
+    """Serve ``signins`` newest first with $filter on createdDateTime, paging and throttling."""
+
+    def __init__(self, signins=(), page_size=50, throttle_every=0, retry_after="0", latency=0.0):
+        self.signins = list(signins)
+        self.page_size = page_size
+        # Every throttle_every-th request is answered 429 with Retry-After
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.latency = latency
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._sorted, self._keys, self._sorted_count = [], [], -1
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}{SIGNINS_PATH}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, query):
+        with self._lock:
+            self.requests += 1
+            throttle = self.throttle_every and self.requests % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttle:
+            return 429, {"Retry-After": self.retry_after}, {"error": {"code": "TooManyRequests"}}
+        return self.page(query)
+
+    def _index(self):
+        if self._sorted_count != len(self.signins):
+            self._sorted = sorted(self.signins, key=lambda s: s["createdDateTime"])
+            self._keys = [s["createdDateTime"] for s in self._sorted]
+            self._sorted_count = len(self.signins)
+        return self._sorted, self._keys
+
+    def page(self, query):
+        """Return (status, headers, body) for a parsed query string."""
+        entries, keys = self._index()
+        lo, hi = 0, len(entries)
+        for op, value in re.findall(r"createdDateTime (ge|lt) (\S+)", query.get("$filter", [""])[0]):
+            if op == "ge":
+                lo = max(lo, bisect.bisect_left(keys, value))
+            else:
+                hi = min(hi, bisect.bisect_left(keys, value))
+
+        # Newest first: page N covers entries[hi - (N+1)*size : hi - N*size]
+        skip = int(query.get("$skiptoken", ["0"])[0])
+        end = hi - skip
+        body = {"value": entries[max(lo, end - self.page_size):max(lo, end)][::-1]}
+        if end - self.page_size > lo:
+            next_query = {k: v[0] for k, v in query.items()}
+            next_query["$skiptoken"] = skip + self.page_size
+            body["@odata.nextLink"] = f"{self.url}?{urlencode(next_query)}"
+        return 200, {}, body
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like Graph
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, headers, body = stub.respond(parse_qs(urlparse(self.path).query))
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,22 @@
+"""Let mongomock 4.3 run the bulk writes of current pymongo releases.
+
+pymongo 4.11 added ``sort`` to UpdateOne/ReplaceOne and passes it on to
+the bulk builder, whose mongomock version does not take it yet.
+"""
+import inspect
+
+from mongomock.collection import BulkOperationBuilder
+
+
+def install():
+    add_update = BulkOperationBuilder.add_update
+    if "sort" in inspect.signature(add_update).parameters or getattr(add_update, "drops_sort", False):
+        return
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        if sort is not None:
+            raise NotImplementedError("mongomock does not support sort in bulk updates")
+        return add_update(self, *args, **kwargs)
+
+    add_update_without_sort.drops_sort = True
+    BulkOperationBuilder.add_update = add_update_without_sort
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+
+import db
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_import_has_no_side_effects(tmp_path):
+    # A fresh interpreter, so modules imported by other tests don't count
+    code = (
+        "import threading, app, db; "
+        "assert db._client is None, 'MongoClient opened at import'; "
+        "assert threading.active_count() == 1, threading.enumerate()"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(HERE), MONGO_URI="mongodb://unreachable.invalid:1")
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, check=True, timeout=60)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_client_is_created_per_process(monkeypatch):
+    created = []
+    monkeypatch.setattr(db, "MongoClient", lambda *args, **kwargs: created.append(object()) or created[-1])
+
+    assert db.get_client() is db.get_client()
+    monkeypatch.setattr(db, "_client_pid", -1)  # as seen from a forked child
+    assert db.get_client() is created[1]
+    assert len(created) == 2
+
+
+def test_create_app_serves_without_jobs(mongo_db, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "configure_logging", lambda: None)
+    client = app.create_app(start_jobs=False).test_client()
+
+    assert client.get("/snapshots").get_json() == []
+    assert client.get("/drift").status_code == 200
+    assert client.get("/metrics").status_code == 200
+
+    for limit in ("abc", "-1", "0", "2.5"):
+        response = client.get(f"/logs?limit={limit}")
+        assert response.status_code == 400
+        assert "limit" in response.get_json()["error"]
+    assert client.get("/logs?limit=5").status_code == 200
+
+
+def test_logging_goes_through_a_queue(tmp_path):
+    import logging
+    import logging.handlers
+
+    import logging_config
+
+    path = tmp_path / "drift.log"
+    logging_config.configure_logging(path=str(path))
+    try:
+        assert any(isinstance(h, logging.handlers.QueueHandler) for h in logging.getLogger().handlers)
+        logging.getLogger("drift_detect").warning("queued record")
+    finally:
+        logging_config.stop_logging()
+    assert "drift_detect - WARNING - queued record" in path.read_text()
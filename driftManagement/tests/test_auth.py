@@ -0,0 +1,75 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import auth
+
+
+class FakeCredential:
+    def __init__(self, clock, lifetime=3600):
+        self.clock = clock
+        self.lifetime = lifetime
+        self.calls = 0
+
+    def get_token(self, scope, **kwargs):
+        self.calls += 1
+        time.sleep(0.01)
+        return SimpleNamespace(token=f"{scope}-{self.calls}", expires_on=self.clock() + self.lifetime)
+
+
+def make_cache(now):
+    credentials = {}
+
+    def factory(tenant_id):
+        credentials[tenant_id] = FakeCredential(lambda: now[0])
+        return credentials[tenant_id]
+
+    return auth.TokenCache(factory, refresh_margin=300, clock=lambda: now[0]), credentials
+
+
+def test_tokens_are_cached_per_scope_and_tenant():
+    now = [1000.0]
+    cache, credentials = make_cache(now)
+
+    graph = cache.get_token(auth.GRAPH_SCOPE)
+    assert cache.get_token(auth.GRAPH_SCOPE) is graph
+    arm = cache.get_token(auth.ARM_SCOPE)
+    cache.get_token(auth.GRAPH_SCOPE, tenant_id="other")
+
+    assert arm is not graph
+    assert credentials[None].calls == 2
+    assert credentials["other"].calls == 1
+    assert cache.stats == {"hits": 1, "misses": 3, "refreshes": 0}
+
+
+def test_token_refreshed_before_expiry():
+    now = [1000.0]
+    cache, credentials = make_cache(now)
+    first = cache.get_token(auth.GRAPH_SCOPE)
+
+    now[0] += 3600 - 301
+    assert cache.get_token(auth.GRAPH_SCOPE) is first
+    now[0] += 2
+    assert cache.get_token(auth.GRAPH_SCOPE) is not first
+    assert cache.stats["refreshes"] == 1
+
+
+def test_concurrent_callers_share_one_refresh():
+    now = [1000.0]
+    cache, credentials = make_cache(now)
+    threads = [threading.Thread(target=cache.get_token, args=(auth.GRAPH_SCOPE,)) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert credentials[None].calls == 1
+    assert cache.stats["misses"] == 1
+    assert cache.stats["hits"] == 15
+
+
+def test_cached_credential_serves_sdk_clients():
+    now = [1000.0]
+    cache, credentials = make_cache(now)
+    credential = auth.CachedCredential(cache)
+    assert credential.get_token(auth.ARM_SCOPE) is credential.get_token(auth.ARM_SCOPE)
+    assert credentials[None].calls == 1
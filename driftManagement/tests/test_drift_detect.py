@@ -1,6 +1,6 @@
 import pytest
 import numpy as np
-from drift_detect import DriftDetector, DriftSeverity
+from drift_detect import DriftDetector, DriftMonitor, DriftSeverity, MetricSketch
 
 @pytest.fixture
 def drift_detector():
@@ -66,4 +66,169 @@ def test_get_drift_summary(drift_detector):
 def test_empty_data_handling(drift_detector):
     empty_result = drift_detector.detect_drift([], [])
     assert empty_result["drift_score"] == 0.0
-    assert empty_result["severity"] == "LOW" 
\ No newline at end of file
+    assert empty_result["severity"] == "LOW" 
+
+def reference_score(baseline, current, tolerance):
+    """KL(current || baseline) of the softmaxed z-scores of one pair, written out longhand."""
+    def distribution(values):
+        values = np.asarray(values, dtype=float)
+        std = values.std()
+        z = (values - values.mean()) / std if std > 0 else np.zeros_like(values)
+        weights = np.exp(z)
+        return weights / weights.sum()
+
+    p, q = distribution(current), distribution(baseline)
+    return max(float(np.sum(p * np.log(p / q))) - tolerance, 0.0)
+
+
+def test_reference_score_values():
+    # Worked by hand: z(current) = [1, -1] and z(baseline) = [-1, 1], so p = [b, a] and q = [a, b]
+    a, b = 1 / (1 + np.e ** 2), np.e ** 2 / (1 + np.e ** 2)
+    assert reference_score([1, 3], [3, 1], 0.1) == pytest.approx((a - b) * np.log(a / b) - 0.1)
+    assert reference_score([1, 2, 3], [2, 4, 6], 0.1) == 0.0
+
+
+def test_batch_scores_match_reference(drift_detector):
+    rng = np.random.default_rng(7)
+    baselines = rng.normal(size=(50, 40))
+    currents = baselines + rng.normal(scale=rng.uniform(0, 2, size=(50, 1)), size=(50, 40))
+
+    scores, severities = drift_detector.detect_drift_batch(baselines, currents)
+
+    expected = [reference_score(b, c, drift_detector.tolerance) for b, c in zip(baselines, currents)]
+    assert np.allclose(scores, expected)
+    assert any(score > 0 for score in expected)
+    assert list(severities) == [drift_detector.determine_severity(score) for score in expected]
+    assert [drift_detector.calculate_drift_score(list(b), list(c)) for b, c in zip(baselines, currents)] \
+        == pytest.approx(expected)
+
+
+def test_batch_scores_ragged_rows(drift_detector):
+    baselines = [[1, 2, 3, 4, 5], [3, 1, 2], [], [2, 2, 2]]
+    currents = [[5, 4, 3, 2, 1], [3, 1, 2], [1, 2], [2, 2, 2]]
+
+    scores = drift_detector.calculate_drift_scores(baselines, currents)
+
+    assert scores[0] == pytest.approx(reference_score(baselines[0], currents[0], drift_detector.tolerance))
+    assert scores[0] > 0
+    assert list(scores[1:]) == [0.0, 0.0, 0.0]
+
+
+def test_batch_scores_with_masks_and_float32(drift_detector):
+    rng = np.random.default_rng(3)
+    baselines = rng.normal(size=(20, 30))
+    currents = rng.normal(size=(20, 30))
+    mask = np.arange(30) < rng.integers(5, 30, size=(20, 1))
+
+    masked = drift_detector.calculate_drift_scores(baselines, currents, mask, mask)
+    ragged = drift_detector.calculate_drift_scores(
+        [b[m] for b, m in zip(baselines, mask)], [c[m] for c, m in zip(currents, mask)]
+    )
+    single = drift_detector.calculate_drift_scores(baselines, currents, mask, mask, dtype=np.float32)
+
+    assert np.allclose(masked, ragged)
+    assert single.dtype == np.float32
+    assert np.allclose(single, masked, atol=1e-4)
+
+
+def test_per_row_tolerance_and_thresholds(drift_detector):
+    scores = drift_detector.calculate_drift_scores([[1, 2, 3, 4, 5]] * 2, [[5, 4, 3, 2, 1]] * 2,
+                                                   tolerance=np.array([0.1, 100.0]))
+    assert scores[0] > 0 and scores[1] == 0
+    severities = drift_detector.determine_severities(np.array([0.5, 0.5]), np.array([[0.8, 0.6, 0.4], [0.3, 0.2, 0.1]]))
+    assert list(severities) == ["MEDIUM", "CRITICAL"]
+
+
+def test_sketch_tracks_moments_without_samples():
+    rng = np.random.default_rng(1)
+    values = rng.normal(5, 2, size=10_000)
+    sketch = MetricSketch(-5, 15, bins=40)
+    sketch.update(values[:5000])
+    for value in values[5000:5010]:
+        sketch.add(value)
+    sketch.update(values[5010:])
+
+    assert sketch.count == 10_000
+    assert sketch.counts.sum() == 10_000
+    assert np.isclose(sketch.mean, values.mean())
+    assert np.isclose(sketch.variance, values.var())
+
+
+def test_sketch_merge_and_round_trip():
+    rng = np.random.default_rng(2)
+    a, b = rng.normal(size=300), rng.normal(1, 1, size=700)
+    left, right, whole = MetricSketch(-4, 4), MetricSketch(-4, 4), MetricSketch(-4, 4)
+    left.update(a)
+    right.update(b)
+    whole.update(np.concatenate([a, b]))
+
+    merged = MetricSketch.from_dict(left.to_dict()).merge(right)
+
+    assert np.array_equal(merged.counts, whole.counts)
+    assert np.isclose(merged.mean, whole.mean)
+    assert np.isclose(merged.m2, whole.m2)
+    with pytest.raises(ValueError):
+        left.merge(MetricSketch(-4, 4, bins=8))
+
+
+@pytest.mark.parametrize("method", ["kl", "psi", "js"])
+def test_sketch_drift(drift_detector, method):
+    rng = np.random.default_rng(4)
+    baseline, same, shifted = MetricSketch(-6, 6), MetricSketch(-6, 6), MetricSketch(-6, 6)
+    baseline.update(rng.normal(size=20_000))
+    same.update(rng.normal(size=20_000))
+    shifted.update(rng.normal(2, 1, size=20_000))
+
+    assert drift_detector.calculate_sketch_drift(baseline, same, method) == 0.0
+    drifted = drift_detector.calculate_sketch_drift(baseline, shifted, method)
+    assert np.isfinite(drifted) and drifted > 0
+    result = drift_detector.detect_sketch_drift(baseline, shifted, method)
+    assert result["severity"] == drift_detector.determine_severity(drifted)
+    assert result["current_size"] == 20_000
+
+
+def test_monitor_emits_only_on_severity_change():
+    monitor = DriftMonitor(DriftDetector(tolerance=0.1), reference_size=200, recent_size=50, min_samples=30)
+    rng = np.random.default_rng(5)
+
+    assert monitor.observe_many("signins", rng.normal(10, 1, size=400)) == []
+    assert monitor.severity("signins") == "LOW"
+
+    changes = monitor.observe_many("signins", rng.normal(20, 1, size=50))
+    assert changes
+    assert changes[-1]["severity"] == "CRITICAL"
+    assert changes[0]["previous_severity"] == "LOW"
+    assert set(changes[0]) >= {"timestamp", "drift_score", "severity", "baseline_size", "current_size", "tolerance"}
+
+    # Once the shifted level fills the reference window it becomes the new normal
+    recovered = monitor.observe_many("signins", rng.normal(20, 1, size=400))
+    assert recovered[-1]["severity"] == "LOW"
+    assert monitor.severity("other") is None
+
+
+def test_monitor_running_stats_match_window_contents():
+    monitor = DriftMonitor(reference_size=20, recent_size=10, min_samples=5)
+    values = np.random.default_rng(6).normal(1e6, 3, size=137)
+    monitor.observe_many("m", values)
+    reference, recent = monitor._windows["m"]
+
+    assert np.isclose(recent.mean(), values[-10:].mean())
+    assert np.isclose(recent.variance(), values[-10:].var())
+    assert np.isclose(reference.mean(), values[-30:-10].mean())
+    assert np.isclose(reference.variance(), values[-30:-10].var())
+
+
+def test_monitor_running_stats_survive_a_level_shift():
+    monitor = DriftMonitor(DriftDetector(tolerance=0.1), reference_size=50, recent_size=20, min_samples=10)
+    rng = np.random.default_rng(8)
+    monitor.observe_many("m", rng.normal(0, 1, size=100))
+    values = 1e8 + rng.normal(0, 0.9, size=150)
+    monitor.observe_many("m", values)
+    reference, recent = monitor._windows["m"]
+
+    assert recent.variance() == pytest.approx(values[-20:].var(), rel=1e-6)
+    assert reference.variance() == pytest.approx(values[-70:-20].var(), rel=1e-6)
+    assert reference.mean() == pytest.approx(values[-70:-20].mean(), abs=1e-6)
+    # Both windows hold the same level again, so there is no drift left
+    assert monitor._score(reference, recent) < 1
+    assert monitor.severity("m") == "LOW"
@@ -0,0 +1,56 @@
+import pytest
+
+import db
+import drift_results
+
+
+@pytest.fixture
+def results(mongo_db):
+    drift_results.clear_cache()
+    yield mongo_db
+    drift_results.clear_cache()
+
+
+def save(*resources):
+    db.save_snapshot({"resources": [{"resource_group": "rg", "location": "westeurope", "resources": list(resources)}]})
+
+
+def test_snapshot_drift_between_two_newest_snapshots(results):
+    save({"id": "/r/a", "tags": {"env": "dev"}}, {"id": "/r/b"})
+    assert drift_results.snapshot_drift() is None
+    save({"id": "/R/A", "tags": {"env": "prod"}}, {"id": "/r/c"})
+
+    drift = drift_results.snapshot_drift()
+    assert drift["added"] == ["/r/c"]
+    assert drift["removed"] == ["/r/b"]
+    assert drift["changed"] == ["/R/A"]
+
+
+def test_refresh_only_stores_changed_reports(results):
+    save({"id": "/r/a"})
+    save({"id": "/r/a"}, {"id": "/r/b"})
+    first = drift_results.refresh_drift_results()
+    again = drift_results.refresh_drift_results()
+    assert again["etag"] == first["etag"]
+    assert again["updated_at"] == first["updated_at"]
+
+    save({"id": "/r/b"})
+    changed = drift_results.refresh_drift_results()
+    assert changed["etag"] != first["etag"]
+    assert changed["report"]["snapshots"]["removed"] == ["/r/a"]
+    assert results[drift_results.RESULTS_COLLECTION].count_documents({}) == 1
+
+
+def test_cached_results_pick_up_other_processes_writes(results, monkeypatch):
+    save({"id": "/r/a"})
+    save({"id": "/r/b"})
+    cached = drift_results.get_drift_results()
+    assert drift_results.get_drift_results() is cached
+
+    # Another worker stores a newer report
+    results[drift_results.RESULTS_COLLECTION].update_one(
+        {"_id": drift_results.LATEST}, {"$set": {"etag": "newer"}}
+    )
+    assert drift_results.get_drift_results() is cached
+    monkeypatch.setattr(drift_results, "RESULTS_CACHE_SECONDS", 0)
+    assert drift_results.get_drift_results()["etag"] == "newer"
@@ -0,0 +1,60 @@
+import json
+import threading
+from datetime import datetime
+
+from events import EventBroadcaster
+
+
+class FakeResults:
+    def __init__(self):
+        self.doc = None
+
+    def publish(self, etag, timestamp):
+        self.doc = {"etag": etag, "report": {"snapshots": {"timestamp": timestamp}, "signins": []}}
+
+    def __call__(self):
+        return self.doc
+
+
+def parse(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+    return fields["id"], fields["event"], json.loads(fields["data"])
+
+
+def test_check_publishes_only_on_new_etag():
+    results = FakeResults()
+    broadcaster = EventBroadcaster(load=results)
+    assert not broadcaster.check()
+    results.publish("a", datetime(2024, 1, 1))
+    assert broadcaster.check()
+    assert not broadcaster.check()
+    assert [name for name, _ in broadcaster.events] == ["snapshot", "drift"]
+
+
+def test_stream_sends_missed_state_then_keep_alives():
+    results = FakeResults()
+    results.publish("b", datetime(2024, 1, 1, 12))
+    broadcaster = EventBroadcaster(load=results, interval=3600)
+    broadcaster.check()
+
+    stream = broadcaster.stream(last_etag="a", heartbeat=0.01)
+    assert next(stream).startswith("retry:")
+    assert parse(next(stream)) == ("b", "snapshot", {"timestamp": "2024-01-01T12:00:00"})
+    etag, name, _ = parse(next(stream))
+    assert (etag, name) == ("b", "drift")
+    assert next(stream) == ": keep-alive\n\n"
+    broadcaster.stop()
+
+
+def test_waiting_streams_wake_on_publish():
+    results = FakeResults()
+    broadcaster = EventBroadcaster(load=results, interval=3600)
+    woke = []
+    waiters = [threading.Thread(target=lambda: woke.append(broadcaster.wait(None, 5)[0])) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    results.publish("c", None)
+    broadcaster.check()
+    for waiter in waiters:
+        waiter.join()
+    assert woke == ["c", "c", "c"]
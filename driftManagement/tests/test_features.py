@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import features
+import db
+
+
+def test_pipeline_recounts_from_bucket_boundary():
+    pipeline = features.build_series_pipeline("2024-01-01T10:00:00Z")
+    assert pipeline[0] == {"$match": {"createdDateTime": {"$gte": "2024-01-01T10:00:00"}}}
+    # Fractional seconds in the boundary second are still counted
+    assert "2024-01-01T10:00:00.5Z" >= pipeline[0]["$match"]["createdDateTime"]["$gte"]
+    assert "2024-01-01T09:59:59.9Z" < pipeline[0]["$match"]["createdDateTime"]["$gte"]
+    assert "$merge" in pipeline[-1]
+    dims = pipeline[1]["$project"]["dims"]
+    assert {d["d"] for d in dims} == set(features.DIMENSIONS)
+    assert "$match" not in features.build_series_pipeline()[0]
+
+
+@pytest.fixture
+def recounts(mongo_db, monkeypatch):
+    """The createdDateTime lower bound of every series recount (None for a full one)."""
+    pipelines = []
+    monkeypatch.setattr(db.logs_collection, "aggregate", lambda pipeline: pipelines.append(pipeline) or iter(()))
+    return pipelines
+
+
+def fetch(log_id, created, fetched_at):
+    db.logs_collection.insert_one({"id": log_id, "createdDateTime": created, "fetched_at": fetched_at})
+
+
+def recount_since(pipeline):
+    return pipeline[0]["$match"]["createdDateTime"]["$gte"] if "$match" in pipeline[0] else None
+
+
+def test_update_signin_series_only_recounts_new_buckets(recounts):
+    fetch("a", "2024-01-01T10:42:13Z", datetime(2024, 1, 1, 10, 50))
+
+    assert features.update_signin_series() == {"updated": True, "since": None}
+    assert features.update_signin_series() == {"updated": False, "since": None}
+
+    fetch("b", "2024-01-01T11:05:00Z", datetime(2024, 1, 1, 11, 10))
+    assert features.update_signin_series() == {"updated": True, "since": "2024-01-01T11:00:00Z"}
+    assert [recount_since(p) for p in recounts] == [None, "2024-01-01T11:00:00"]
+
+
+def test_late_backfill_is_recounted(recounts):
+    fetch("a", "2024-01-01T12:30:00Z", datetime(2024, 1, 1, 12, 40))
+    features.update_signin_series()
+    # A failed tenant's retry stores sign-ins created before ones already counted
+    fetch("b", "2024-01-01T13:15:00Z", datetime(2024, 1, 1, 13, 20))
+    fetch("c", "2024-01-01T09:05:00Z", datetime(2024, 1, 1, 13, 20))
+
+    assert features.update_signin_series() == {"updated": True, "since": "2024-01-01T09:00:00Z"}
+    assert recount_since(recounts[-1]) == "2024-01-01T09:00:00"
+
+
+def test_score_signin_series_feeds_detector(mongo_db):
+    end = datetime(2024, 1, 3)
+    docs = []
+    for hour in range(48):
+        bucket = end - timedelta(hours=48 - hour)
+        # alice signs in steadily; bob's activity flips to the night shift
+        docs.append({"dimension": "user", "tenant_id": "t1", "key": "alice", "bucket": bucket, "count": 5})
+        bob = (hour % 24) if hour < 24 else 24 - hour % 24
+        docs.append({"dimension": "user", "tenant_id": "t1", "key": "bob", "bucket": bucket, "count": bob})
+    docs.append({"dimension": "app", "tenant_id": "t1", "key": "Portal", "bucket": end, "count": 1})
+    mongo_db[features.SERIES_COLLECTION].insert_many(docs)
+
+    results = {r["key"]: r for r in features.score_signin_series("user", end=end, window=24, unit="hour")}
+
+    assert set(results) == {"alice", "bob"}
+    assert results["alice"]["drift_score"] == 0.0
+    assert results["alice"]["current_total"] == 5 * 24
+    assert results["bob"]["drift_score"] > 0
+    assert results["bob"]["tenant_id"] == "t1"
+
+
+def add_series(mongo_db, key, counts, end):
+    mongo_db[features.SERIES_COLLECTION].insert_many([
+        {"dimension": "user", "tenant_id": "t1", "key": key, "bucket": end - timedelta(hours=len(counts) - hour),
+         "count": count}
+        for hour, count in enumerate(counts)
+    ])
+
+
+def test_volume_changes_are_scored(mongo_db):
+    end = datetime(2024, 1, 3)
+    noise = [4, 6, 5, 5, 7, 3] * 4
+    # Same shape in both windows, so only the level tells these apart
+    add_series(mongo_db, "surge", noise + [100 * count for count in noise], end)
+    add_series(mongo_db, "silent", noise + [0] * 24, end)
+    add_series(mongo_db, "steady", noise + [count + 1 for count in noise], end)
+
+    results = {r["key"]: r for r in features.score_signin_series("user", end=end, window=24, unit="hour")}
+
+    assert results["surge"]["severity"] == "CRITICAL"
+    assert results["silent"]["severity"] == "CRITICAL"
+    assert results["steady"]["severity"] == "LOW"
+
+
+def test_level_scores():
+    # A one-standard-deviation shift of the mean scores 0.5
+    assert features.level_scores([[10, 30]], [[30, 50]]) == pytest.approx([0.5 * 400 / 100])
+    assert features.level_scores([[5] * 4], [[5] * 4]) == [0.0]
+    # Constant or quiet baselines are floored at Poisson noise
+    assert features.level_scores([[0] * 24], [[0] * 23 + [1]]) == pytest.approx([0.5 / 24 ** 2])
+    assert features.level_scores([[9] * 4], [[12] * 4]) == pytest.approx([0.5])
+
+
+def test_series_windows_fill_missing_buckets():
+    end = datetime(2024, 1, 1, 4, 30)
+    series = {("t", "k"): {datetime(2024, 1, 1, 0): 3, datetime(2024, 1, 1, 3): 7}}
+    keys, baselines, currents = features.series_windows(series, end, window=2, unit="hour")
+    assert keys == [("t", "k")]
+    assert baselines == [[3, 0]]
+    assert currents == [[0, 7]]
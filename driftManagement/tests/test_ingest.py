@@ -0,0 +1,114 @@
+import pytest
+
+import ingest
+from graph_client import GraphClient, GraphError, retry_after_seconds
+from graph_stub import GraphStub, make_signins
+
+
+@pytest.fixture
+def graph(monkeypatch, mongo_db):
+    with GraphStub(make_signins(120), page_size=50) as stub:
+        monkeypatch.setattr(ingest, "GRAPH_ENDPOINT", stub.url)
+        monkeypatch.setattr(ingest, "get_graph_token", lambda tenant_id=None: "token")
+        monkeypatch.setattr(ingest, "_clients", {})
+        monkeypatch.setattr(ingest, "INGEST_SLICES", 1)
+        monkeypatch.setattr(ingest, "INGEST_LOOKBACK_DAYS", 365 * 20)
+        yield stub
+
+
+def test_first_run_ingests_every_page(graph, mongo_db):
+    stats = ingest.ingest_signin_logs()
+
+    assert stats["pages"] == 3
+    assert stats["inserted"] == 120
+    assert stats["duplicates"] == 0
+    assert stats["complete"]
+    assert stats["watermark"] == max(s["createdDateTime"] for s in graph.signins)
+    assert mongo_db["signin_logs"].count_documents({}) == 120
+    assert ingest.last_run_stats == stats
+
+
+def test_rerun_only_fetches_past_the_watermark(graph, mongo_db):
+    ingest.ingest_signin_logs()
+    graph.signins.extend(make_signins(130)[120:])
+
+    stats = ingest.ingest_signin_logs()
+
+    assert stats["pages"] == 1
+    assert stats["inserted"] == 10
+    assert stats["duplicates"] == 1  # the boundary sign-in is fetched again
+    assert mongo_db["signin_logs"].count_documents({}) == 130
+
+
+def test_repeated_page_is_a_no_op(mongo_db):
+    page = make_signins(5)
+    assert ingest.save_signin_logs([dict(s) for s in page]) == (5, 0)
+    assert ingest.save_signin_logs([dict(s) for s in page]) == (0, 5)
+    assert mongo_db["signin_logs"].count_documents({}) == 5
+
+
+def test_newest_sign_in_is_compared_as_a_time(mongo_db, monkeypatch):
+    page = [{"id": "a", "createdDateTime": "2024-01-01T10:00:00.5Z"},
+            {"id": "b", "createdDateTime": "2024-01-01T10:00:00Z"},
+            {"id": "c", "createdDateTime": "2024-01-01T09:59:59.9999999Z"}]
+
+    class Client:
+        def iter_pages(self, url, params):
+            yield [dict(log) for log in page]
+
+    monkeypatch.setattr(ingest, "get_client", lambda tenant_id=None: Client())
+    # As strings, "...:00Z" sorts after "...:00.5Z"
+    assert ingest.ingest_stream(None, "createdDateTime ge 2024-01-01T09:00:00Z")["newest"] == "2024-01-01T10:00:00.5Z"
+    assert ingest.later("2024-01-01T10:00:00.5Z", "2024-01-01T10:00:00Z")
+    assert not ingest.later("2024-01-01T10:00:00Z", "2024-01-01T10:00:00.000001Z")
+
+
+def test_failed_run_keeps_watermark(graph, mongo_db, monkeypatch):
+    monkeypatch.setattr(graph, "page", lambda query: (404, {}, {"error": "boom"}))
+    stats = ingest.ingest_signin_logs()
+    assert not stats["complete"]
+    assert stats["failed"] == 1
+    assert ingest.get_watermark(ingest.WATERMARK_KEY) is None
+
+
+def test_time_sliced_streams_fetched_concurrently(graph, mongo_db, monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_SLICES", 4)
+    stats = ingest.ingest_signin_logs()
+    assert stats["streams"] == 4
+    assert stats["inserted"] == 120
+    assert stats["duplicates"] == 0
+
+
+def test_time_slices_are_contiguous():
+    now = ingest.parse_graph_time("2024-01-01T04:00:00.5Z")
+    slices = ingest.time_slices("2024-01-01T00:00:00Z", now)
+    assert len(slices) == 4
+    assert slices[0] == "createdDateTime ge 2024-01-01T00:00:00Z and createdDateTime lt 2024-01-01T01:00:00Z"
+    assert slices[-1] == "createdDateTime ge 2024-01-01T03:00:00Z"
+    assert ingest.time_slices("2024-01-01T03:30:00.1234567Z", now) == ["createdDateTime ge 2024-01-01T03:30:00.1234567Z"]
+
+
+def test_client_retries_throttled_requests():
+    waits = []
+    with GraphStub(make_signins(30), page_size=10, throttle_every=2, retry_after="3") as stub:
+        client = GraphClient(lambda: "token", sleep=waits.append, backoff=0.01)
+        pages = list(client.iter_pages(stub.url))
+    assert sum(len(page) for page in pages) == 30
+    assert client.stats["throttled"] == stub.throttled > 0
+    assert all(wait >= 3 for wait in waits)
+
+
+def test_client_gives_up_after_max_retries():
+    with GraphStub(make_signins(5), throttle_every=1) as stub:
+        client = GraphClient(lambda: "token", max_retries=2, sleep=lambda s: None)
+        with pytest.raises(GraphError) as excinfo:
+            client.get(stub.url)
+    assert excinfo.value.status_code == 429
+    assert stub.requests == 3
+
+
+def test_retry_after_parsing():
+    assert retry_after_seconds("7") == 7
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert retry_after_seconds("soon") is None
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES
+
+from leader import JobRunner, MongoLease
+
+NOW = datetime(2024, 1, 1, 12)
+
+
+@pytest.fixture
+def clock():
+    state = {"now": NOW}
+    state["read"] = lambda: state["now"]
+    return state
+
+
+def test_lease_is_exclusive_until_released_or_expired(mongo_db, clock):
+    leases = mongo_db["leases"]
+    a = MongoLease("lock", "a", 60, leases, clock["read"])
+    b = MongoLease("lock", "b", 60, leases, clock["read"])
+    assert a.acquire()
+    assert not b.acquire()
+    assert a.acquire()  # renewal
+    assert a.holder() == "a"
+
+    clock["now"] = NOW + timedelta(seconds=61)
+    assert b.acquire()
+    assert not a.acquire()
+    b.release()
+    assert a.holder() is None
+    assert a.acquire()
+
+
+def test_only_the_leader_runs_jobs(mongo_db, clock):
+    calls = []
+    runners = [JobRunner(owner=name, database=mongo_db, clock=clock["read"]) for name in ("a", "b")]
+    assert [runner.renew() for runner in runners] == [True, False]
+
+    assert runners[1].run("job", lambda: calls.append("b")) is None
+    run = runners[0].run("job", lambda: calls.append("a"))
+    assert calls == ["a"]
+    assert run["status"] == "ok" and run["owner"] == "a"
+
+    # A run still holding the job lock makes the next one skip
+    MongoLease("job:job", "old-leader", 3600, mongo_db["leases"], clock["read"]).acquire()
+    assert runners[0].run("job", lambda: calls.append("again"))["status"] == "skipped"
+    assert calls == ["a"]
+
+
+def test_failed_job_releases_its_lock(mongo_db, clock, caplog):
+    runner = JobRunner(owner="a", database=mongo_db, clock=clock["read"])
+    runner.renew()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    assert runner.run("job", fail)["error"] == "boom"
+    assert runner.run("job", lambda: None)["status"] == "ok"
+    failure = next(r for r in caplog.records if r.name == "leader" and r.levelname == "ERROR")
+    assert failure.getMessage() == "Job job failed"
+    assert failure.exc_info[1].args == ("boom",)
+
+
+def test_runs_are_recorded_with_lag(mongo_db, clock):
+    runner = JobRunner(owner="a", database=mongo_db, clock=clock["read"])
+    runner.renew()
+    clock["now"] = NOW + timedelta(seconds=5)
+    run = runner.run("job", lambda: None)
+    scheduled = NOW.replace(tzinfo=timezone.utc)
+    runner._record(SimpleNamespace(code=EVENT_JOB_EXECUTED, job_id="job", retval=run, scheduled_run_time=scheduled))
+    runner._record(SimpleNamespace(code=EVENT_JOB_MAX_INSTANCES, job_id="job", scheduled_run_times=[scheduled]))
+
+    stored = list(mongo_db["job_runs"].find({}, {"_id": 0}).sort("status", 1))
+    assert [r["status"] for r in stored] == ["ok", "skipped"]
+    assert stored[0]["lag"] == 5.0
+    assert stored[0]["scheduled_at"] == NOW
+    assert runner.last_runs["job"]["status"] == "skipped"
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+from flask import Flask
+from prometheus_client import REGISTRY
+
+import metrics
+from drift_detect import DriftDetector
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_mongo_listener_times_commands():
+    before = sample("drift_mongo_command_seconds_count", command="find")
+    failures = sample("drift_mongo_command_failures_total", command="find")
+    listener = metrics.MongoCommandMetrics()
+    listener.succeeded(SimpleNamespace(command_name="find", duration_micros=1500))
+    listener.failed(SimpleNamespace(command_name="find", duration_micros=500))
+    assert sample("drift_mongo_command_seconds_count", command="find") == before + 2
+    assert sample("drift_mongo_command_failures_total", command="find") == failures + 1
+
+
+def test_single_and_batch_scoring_are_timed_separately():
+    single = sample("drift_score_seconds_count", mode="single")
+    rows = sample("drift_score_rows_total", mode="batch")
+    detector = DriftDetector()
+    detector.calculate_drift_score([1, 2, 3], [3, 2, 1])
+    detector.calculate_drift_scores([[1, 2, 3]] * 4, [[3, 2, 1]] * 4)
+    assert sample("drift_score_seconds_count", mode="single") == single + 1
+    assert sample("drift_score_rows_total", mode="batch") == rows + 4
+
+
+def test_routes_are_timed_by_rule_and_metrics_are_served():
+    app = Flask(__name__)
+    metrics.init_app(app)
+    app.add_url_rule("/items/<item>", "item", lambda item: item)
+    client = app.test_client()
+
+    client.get("/items/a")
+    client.get("/items/b")
+    assert sample("drift_http_request_seconds_count", method="GET", route="/items/<item>", status="200") == 2
+
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain"
+    assert b"drift_http_request_seconds_bucket" in response.data
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def signin_logs(mongo_db):
+    start = datetime(2024, 1, 1)
+    mongo_db["signin_logs"].insert_many([
+        {"id": str(i), "userPrincipalName": f"user{i}", "fetched_at": start + timedelta(minutes=i // 2)}
+        for i in range(10)
+    ])
+    return start
+
+
+def test_signin_log_pages_cover_every_document_once(signin_logs):
+    seen, cursor = [], None
+    while True:
+        page = list(db.iter_signin_logs(cursor=cursor, limit=3))
+        seen.extend(log["id"] for _, log in page)
+        if len(page) < 3:
+            break
+        cursor = page[-1][0]
+    assert sorted(seen) == [str(i) for i in range(10)]
+    assert len(seen) == 10
+
+
+def test_signin_logs_time_range_and_projection(signin_logs):
+    logs = db.get_signin_logs(since=signin_logs + timedelta(minutes=1), until=signin_logs + timedelta(minutes=3),
+                              fields=["id"])
+    assert sorted(log["id"] for log in logs) == ["2", "3", "4", "5"]
+    assert all(set(log) == {"id"} for log in logs)
+
+
+def test_invalid_cursor_raises_value_error(mongo_db):
+    with pytest.raises(ValueError):
+        list(db.iter_signin_logs(cursor="not-a-cursor"))
+
+
+def test_snapshot_pages_rebuild_deltas(mongo_db):
+    for size in range(1, 5):
+        db.save_snapshot({"resources": [{
+            "resource_group": "rg",
+            "location": "westeurope",
+            "resources": [{"id": f"/subscriptions/s/resourceGroups/rg/r/{i}", "name": str(i)} for i in range(size)],
+        }]})
+
+    first = list(db.iter_snapshots(limit=2))
+    rest = list(db.iter_snapshots(cursor=first[-1][0], limit=2))
+    sizes = [len(snapshot["resources"][0]["resources"]) for _, snapshot in first + rest]
+    assert sizes == [4, 3, 2, 1]
+
+    summaries = db.get_snapshots(fields=["timestamp"])
+    assert len(summaries) == 4
+    assert all(set(s) == {"timestamp"} for s in summaries)
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+import poll_azure
+
+
+def arm_resource(rg, name):
+    rid = f"/subscriptions/sub/resourceGroups/{rg}/providers/Microsoft.Web/sites/{name}"
+    return SimpleNamespace(name=name, type="Microsoft.Web/sites", location="westeurope", id=rid, tags={})
+
+
+class FakeClient:
+    def __init__(self, groups, resources):
+        self.resource_groups = SimpleNamespace(list=lambda: iter(groups))
+        self.resources = SimpleNamespace(list=lambda: iter(resources))
+
+
+def test_resource_group_of():
+    assert poll_azure.resource_group_of("/subscriptions/s/resourceGroups/My-RG/providers/x/y/z") == "my-rg"
+    assert poll_azure.resource_group_of("/subscriptions/s/resourceGroups/My-RG") == "my-rg"
+    assert poll_azure.resource_group_of("/subscriptions/s/providers/Microsoft.Authorization/x") is None
+    assert poll_azure.resource_group_of(None) is None
+
+
+def test_collect_snapshot_partitions_resources(monkeypatch):
+    groups = [SimpleNamespace(name="RG-A", location="westeurope"), SimpleNamespace(name="rg-b", location="northeurope")]
+    resources = [
+        arm_resource("rg-a", "site1"),
+        arm_resource("RG-B", "site2"),
+        arm_resource("rg-a", "site3"),
+        SimpleNamespace(name="lock", type="Microsoft.Authorization/locks", location=None,
+                        id="/subscriptions/sub/providers/Microsoft.Authorization/locks/lock", tags=None),
+    ]
+    client = FakeClient(groups, resources)
+    saved = []
+    monkeypatch.setattr(poll_azure, "get_credentials", lambda: None)
+    monkeypatch.setattr("azure.mgmt.resource.ResourceManagementClient", lambda *a: client)
+    monkeypatch.setattr("azure.mgmt.resource.resources.ResourceManagementClient", lambda *a: client)
+    monkeypatch.setattr(poll_azure, "save_snapshot", saved.append)
+    monkeypatch.setattr(poll_azure, "_clients", {})
+
+    poll_azure.collect_snapshot()
+
+    layout = {g["resource_group"]: [r["name"] for r in g["resources"]] for g in saved[0]["resources"]}
+    assert layout == {"RG-A": ["site1", "site3"], "rg-b": ["site2"], None: ["lock"]}
+
+
+def test_collect_snapshot_isolates_failing_subscriptions(monkeypatch):
+    def clients(subscription_id):
+        if subscription_id == "broken":
+            raise RuntimeError("AuthorizationFailed")
+        groups = [SimpleNamespace(name="rg-a", location="westeurope")]
+        client = FakeClient(groups, [arm_resource("rg-a", f"site-{subscription_id}")])
+        return client, client
+
+    saved = []
+    monkeypatch.setattr(poll_azure, "SUBSCRIPTION_IDS", ["sub-1", "broken", "sub-2"])
+    monkeypatch.setattr(poll_azure, "get_clients", clients)
+    monkeypatch.setattr(poll_azure, "save_snapshot", saved.append)
+
+    stats = poll_azure.collect_snapshot()
+
+    assert sorted(s["subscription_id"] for s in saved) == ["sub-1", "sub-2"]
+    assert stats["broken"] == {"error": "AuthorizationFailed"}
+    assert stats["sub-1"]["resources"] == 1 and stats["sub-1"]["resource_groups"] == 1
+    assert poll_azure.last_run_stats == stats
+
+
+def test_collect_snapshot_fails_when_every_subscription_fails(monkeypatch):
+    monkeypatch.setattr(poll_azure, "SUBSCRIPTION_IDS", ["broken"])
+    monkeypatch.setattr(poll_azure, "get_clients", lambda s: 1 / 0)
+
+    with pytest.raises(RuntimeError):
+        poll_azure.collect_snapshot()
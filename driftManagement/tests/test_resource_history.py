@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+import db
+
+VM1 = "/subscriptions/sub/resourceGroups/rg1/providers/Microsoft.Compute/virtualMachines/vm1"
+
+
+def make_snapshot(resources):
+    groups = {}
+    for rg, name, tags in resources:
+        groups.setdefault(rg, []).append({
+            "name": name,
+            "type": "Microsoft.Compute/virtualMachines",
+            "location": "westeurope",
+            "id": f"/subscriptions/sub/resourceGroups/{rg}/providers/Microsoft.Compute/virtualMachines/{name}",
+            "tags": tags,
+        })
+    return {"resources": [{"resource_group": rg, "location": "westeurope", "resources": items}
+                          for rg, items in groups.items()]}
+
+
+@pytest.mark.parametrize("storage", ["delta", "full"])
+def test_history_records_each_change(mongo_db, monkeypatch, storage):
+    monkeypatch.setattr(db, "SNAPSHOT_STORAGE", storage)
+    monkeypatch.setattr(db, "SNAPSHOT_KEYFRAME_INTERVAL", 2)
+    db.save_snapshot(make_snapshot([("rg1", "vm1", {}), ("rg1", "vm2", {})]))
+    db.save_snapshot(make_snapshot([("rg1", "vm1", {}), ("rg1", "vm2", {})]))
+    db.save_snapshot(make_snapshot([("rg1", "vm1", {"env": "prod"}), ("rg1", "vm2", {})]))
+    db._chains.clear()  # restart: the next diff is against the reloaded chain
+    db.save_snapshot(make_snapshot([("rg1", "vm2", {})]))
+
+    history = [change for _, change in db.iter_resource_history(VM1.upper())]
+    assert [h["change"] for h in history] == ["removed", "changed", "added"]
+    assert history[1]["resource"]["tags"] == {"env": "prod"}
+    assert history[1]["resource_group"] == "rg1"
+    assert "resource" not in history[0]
+    assert mongo_db["resource_history"].count_documents({}) == 4
+
+
+def test_history_endpoint_pages_by_time(mongo_db, monkeypatch):
+    days = iter(range(3))
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime(2024, 3, 1) + timedelta(days=next(days))
+
+    monkeypatch.setattr(db, "datetime", FakeDatetime)
+    monkeypatch.setattr(app, "configure_logging", lambda: None)
+    client = app.create_app(start_jobs=False).test_client()
+    for tags in ({}, {"v": "1"}, {"v": "2"}):
+        db.save_snapshot(make_snapshot([("rg1", "vm1", tags)]))
+
+    response = client.get(f"/resources{VM1}/history?limit=2")
+    assert [h["resource"]["tags"] for h in response.get_json()] == [{"v": "2"}, {"v": "1"}]
+    cursor = response.headers["X-Next-Cursor"]
+    rest = client.get(f"/resources{VM1}/history?cursor={cursor}").get_json()
+    assert [h["change"] for h in rest] == ["added"]
+
+    assert len(client.get(f"/resources{VM1}/history?since=2024-03-02T00:00:00Z").get_json()) == 2
+    assert client.get("/resources/subscriptions/sub/unknown/history").get_json() == []
+
+
+def test_history_lookup_uses_the_index(mongo_db):
+    db.ensure_indexes()
+    keys = [index["key"] for index in mongo_db["resource_history"].index_information().values()]
+    assert [("resource_id", 1), ("timestamp", -1), ("_id", -1)] in keys
+    db.save_snapshot(make_snapshot([("rg1", "vm1", {})]))
+    assert [h["timestamp"] for _, h in db.iter_resource_history(VM1, until=datetime(2000, 1, 1))] == []
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import db
+
+NOW = datetime(2024, 3, 1)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Make save_snapshot stamp documents with a controllable time."""
+    state = {"now": NOW}
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return state["now"]
+
+    monkeypatch.setattr(db, "datetime", FakeDatetime)
+    return state
+
+
+def save_at(clock, when, size):
+    clock["now"] = when
+    db.save_snapshot({"resources": [{
+        "resource_group": "rg",
+        "location": "westeurope",
+        "resources": [{"id": f"/subscriptions/s/resourceGroups/rg/r/{i}", "name": str(i)} for i in range(size)],
+    }]})
+
+
+def sizes(snapshots):
+    return [len(s["resources"][0]["resources"]) for s in snapshots]
+
+
+def test_ensure_indexes_is_idempotent(mongo_db):
+    db.ensure_indexes()
+    db.ensure_indexes()
+    logs = mongo_db["signin_logs"].index_information()
+    assert logs["id_1"]["unique"]
+    assert logs[db.LOG_TTL_INDEX]["expireAfterSeconds"] == db.SIGNIN_LOG_RETENTION_DAYS * 86400
+    assert "timestamp_-1__id_-1" in mongo_db["snapshots"].index_information()
+
+
+def test_ensure_indexes_dedupes_existing_logs(mongo_db):
+    # Written before ingestion upserted on id: the same sign-in on every poll
+    logs = mongo_db["signin_logs"]
+    logs.insert_many([{"id": "a", "poll": 1}, {"id": "b", "poll": 1}, {"id": "a", "poll": 2},
+                      {"id": "a", "poll": 3}, {"id": "b", "poll": 2}])
+    db.ensure_indexes()
+    assert logs.index_information()["id_1"]["unique"]
+    assert sorted((log["id"], log["poll"]) for log in logs.find()) == [("a", 1), ("b", 1)]
+    assert db.save_signin_logs([{"id": "a", "poll": 4}, {"id": "c", "poll": 4}]) == (1, 1)
+
+
+def test_unique_index_failure_is_logged_not_raised(mongo_db, monkeypatch, caplog):
+    monkeypatch.setattr(db, "_dedupe_signin_logs", lambda: 0)
+    mongo_db["signin_logs"].insert_many([{"id": "a"}, {"id": "a"}])
+    db.ensure_indexes()
+    assert "id_1" not in mongo_db["signin_logs"].index_information()
+    assert "Could not create the unique index" in caplog.text
+
+
+def test_log_retention_can_be_disabled(mongo_db, monkeypatch):
+    db.ensure_indexes()
+    monkeypatch.setattr(db, "SIGNIN_LOG_RETENTION_DAYS", 0)
+    db.ensure_indexes()
+    assert db.LOG_TTL_INDEX not in mongo_db["signin_logs"].index_information()
+
+
+def test_rollup_keeps_last_snapshot_per_bucket(mongo_db, clock, monkeypatch):
+    monkeypatch.setattr(db, "SNAPSHOT_KEYFRAME_INTERVAL", 4)
+    # Four snapshots every 15 minutes on two old days, then recent ones
+    size = 0
+    for day in (NOW - timedelta(days=40), NOW - timedelta(days=10)):
+        for hour in range(2):
+            for quarter in range(4):
+                size += 1
+                save_at(clock, day + timedelta(hours=hour, minutes=15 * quarter), size)
+    for minutes in range(0, 120, 30):
+        size += 1
+        save_at(clock, NOW - timedelta(minutes=120 - minutes), size)
+
+    stats = db.rollup_snapshots(now=NOW)
+    assert stats == {"scanned": 16, "kept": 3, "removed": 13}
+
+    snapshots = list(reversed(db.get_snapshots()))
+    # One per day past 30 days, one per hour past 7 days, recent ones untouched
+    assert sizes(snapshots) == [8, 12, 16, 17, 18, 19, 20]
+    assert [s.get("granularity") for s in snapshots] == ["day", "hour", "hour", None, None, None, None]
+
+    # Nothing left to downsample until the hourly rollups age past 30 days
+    assert db.rollup_snapshots(now=NOW)["scanned"] == 0
+    later = db.rollup_snapshots(now=NOW + timedelta(days=21))
+    assert later["removed"] == 1
+    assert sizes(reversed(db.get_snapshots())) == [8, 16, 17, 18, 19, 20]
+
+
+def test_rollup_leaves_current_chain_appendable(mongo_db, clock):
+    for hours in range(3):
+        save_at(clock, NOW - timedelta(days=8, hours=2 - hours), hours + 1)
+    db.rollup_snapshots(now=NOW)
+
+    # Every snapshot lives on the open chain, so nothing was rewritten
+    save_at(clock, NOW, 5)
+    assert sizes(reversed(db.get_snapshots())) == [1, 2, 3, 5]
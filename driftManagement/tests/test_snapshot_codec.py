@@ -0,0 +1,80 @@
+import copy
+import json
+import zlib
+from datetime import datetime
+
+import db
+from snapshot_codec import DERIVED_ID, PACKED, pack, unpack
+from snapshot_delta import DELTA, encode_delta, hash_items, index_snapshot
+
+
+def make_snapshot(resources):
+    groups = {}
+    for rg, name, tags in resources:
+        groups.setdefault(rg, []).append({
+            "name": name,
+            "type": "Microsoft.Compute/virtualMachines",
+            "location": "westeurope",
+            "id": f"/subscriptions/sub/resourceGroups/{rg}/providers/Microsoft.Compute/virtualMachines/{name}",
+            "tags": tags,
+        })
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "resources": [{"resource_group": rg, "location": "westeurope", "resources": items} for rg, items in groups.items()],
+    }
+
+
+def normalized(snapshot):
+    return sorted(json.dumps(group, sort_keys=True) for group in snapshot["resources"])
+
+
+def odd_snapshot():
+    snapshot = make_snapshot([("rg1", "vm1", {"env": "prod"}), ("rg1", "vm2", None), ("RG2", "vm3", {})])
+    extra = snapshot["resources"][0]["resources"]
+    # Nested resource types, ids outside the group and non-string values
+    extra.append({"name": "db1", "type": "Microsoft.Sql/servers/databases", "location": "westeurope",
+                  "id": "/subscriptions/sub/resourceGroups/rg1/providers/Microsoft.Sql/servers/s1/databases/db1",
+                  "tags": {"size": 3, "on": True}, "sku": {"name": "S0", "tier": ["a", 1]}})
+    extra.append({"name": "lock", "type": "Microsoft.Authorization/locks", "location": None,
+                  "id": "/subscriptions/sub/providers/Microsoft.Authorization/locks/lock", "tags": None})
+    snapshot["resources"].append({"resource_group": None, "location": None, "resources": [{"name": "noid"}]})
+    return snapshot
+
+
+def test_pack_round_trips_keyframes_and_deltas():
+    snapshot = odd_snapshot()
+    packed = pack(snapshot)
+    assert packed["encoding"] == PACKED and "resources" not in packed
+    assert packed["timestamp"] == snapshot["timestamp"]
+    assert unpack(packed) == snapshot
+
+    _, items = index_snapshot(make_snapshot([("rg1", "vm1", {})]))
+    delta, _ = encode_delta(hash_items(items), snapshot)
+    assert unpack(pack(delta)) == delta
+
+
+def test_ids_are_stored_relative_to_the_group():
+    snapshot = make_snapshot([("rg1", f"vm{i}", {}) for i in range(50)])
+    packed = pack(snapshot)
+    assert len(packed["payload"]) < len(str(snapshot)) / 5
+    body = json.loads(zlib.decompress(packed["payload"]))
+    assert not any(s.startswith("/subscriptions/") and "vm" in s for s in body["strings"])
+    assert body["resources"][0][2][0][4] == DERIVED_ID
+
+
+def test_packed_storage_is_transparent(mongo_db, monkeypatch):
+    monkeypatch.setattr(db, "SNAPSHOT_ENCODING", "packed")
+    monkeypatch.setattr(db, "SNAPSHOT_KEYFRAME_INTERVAL", 3)
+    versions = [odd_snapshot(), make_snapshot([("rg1", "vm1", {"env": "dev"})]), odd_snapshot(), odd_snapshot()]
+    for version in versions:
+        db.save_snapshot(copy.deepcopy(version))
+
+    stored = list(mongo_db["snapshots"].find())
+    assert all(doc["encoding"] == PACKED and "resources" not in doc and "added" not in doc for doc in stored)
+    assert sum(doc.get("storage") == DELTA for doc in stored) == 2
+
+    rebuilt = db.get_snapshots()
+    assert [normalized(s) for s in rebuilt] == [normalized(v) for v in reversed(versions)]
+    summaries = db.get_snapshots(fields=["timestamp", "resource_count", "group_count"])
+    assert [(s["resource_count"], s["group_count"]) for s in summaries] == [(6, 3), (6, 3), (1, 1), (6, 3)]
+    assert mongo_db["snapshots"].count_documents({"resource_count": {"$gt": 1}}) == 3
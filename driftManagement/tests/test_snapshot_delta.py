@@ -0,0 +1,169 @@
+import copy
+import threading
+from datetime import datetime, timedelta
+
+import db
+from snapshot_delta import DELTA, KEYFRAME, encode_delta, hash_items, index_snapshot
+
+
+def make_snapshot(resources):
+    groups = {}
+    for rg, name, tags in resources:
+        groups.setdefault(rg, []).append({
+            "name": name,
+            "type": "Microsoft.Compute/virtualMachines",
+            "location": "westeurope",
+            "id": f"/subscriptions/sub/resourceGroups/{rg}/providers/Microsoft.Compute/virtualMachines/{name}",
+            "tags": tags,
+        })
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "resources": [
+            {"resource_group": rg, "location": "westeurope", "resources": items}
+            for rg, items in groups.items()
+        ],
+    }
+
+
+def normalized(snapshot):
+    return sorted(
+        (group["resource_group"], sorted(r["id"] for r in group["resources"]), str(group["resources"]))
+        for group in snapshot["resources"]
+    )
+
+
+def test_encode_delta_reports_added_changed_removed():
+    before = make_snapshot([("rg1", "vm1", {}), ("rg1", "vm2", {"env": "dev"})])
+    after = make_snapshot([("rg1", "vm2", {"env": "prod"}), ("rg2", "vm3", {})])
+    _, items = index_snapshot(before)
+
+    delta, hashes = encode_delta(hash_items(items), after)
+
+    assert [e["resource"]["name"] for e in delta["added"]] == ["vm3"]
+    assert [e["resource"]["name"] for e in delta["changed"]] == ["vm2"]
+    assert delta["removed"] == ["/subscriptions/sub/resourcegroups/rg1/providers/microsoft.compute/virtualmachines/vm1"]
+    assert len(hashes) == 2
+
+
+def test_unchanged_snapshot_encodes_empty_delta():
+    snapshot = make_snapshot([("rg1", "vm1", {"a": "b"})])
+    _, items = index_snapshot(snapshot)
+    delta, _ = encode_delta(hash_items(items), copy.deepcopy(snapshot))
+    assert delta["added"] == delta["changed"] == delta["removed"] == []
+
+
+def test_delta_storage_round_trip(mongo_db, monkeypatch):
+    monkeypatch.setattr(db, "SNAPSHOT_KEYFRAME_INTERVAL", 3)
+    versions = [
+        make_snapshot([("rg1", "vm1", {}), ("rg1", "vm2", {})]),
+        make_snapshot([("rg1", "vm1", {}), ("rg1", "vm2", {"owner": "ops"})]),
+        make_snapshot([("rg1", "vm2", {"owner": "ops"}), ("rg2", "vm3", {})]),
+        make_snapshot([("rg2", "vm3", {}), ("rg2", "vm4", {})]),
+    ]
+    expected = [copy.deepcopy(v) for v in versions]
+    for version in versions:
+        db.save_snapshot(version)
+
+    kinds = [d["storage"] for d in mongo_db["snapshots"].find().sort("timestamp", 1)]
+    assert kinds == [KEYFRAME, DELTA, DELTA, KEYFRAME]
+
+    rebuilt = db.get_snapshots()
+    assert len(rebuilt) == len(expected)
+    for snapshot, original in zip(reversed(rebuilt), expected):
+        assert normalized(snapshot) == normalized(original)
+        assert "storage" not in snapshot
+
+
+def test_get_snapshot_at_replays_from_keyframe(mongo_db):
+    first = make_snapshot([("rg1", "vm1", {})])
+    second = make_snapshot([("rg1", "vm1", {}), ("rg1", "vm2", {})])
+    db.save_snapshot(first)
+    db.save_snapshot(second)
+    mongo_db["snapshots"].update_one({"storage": KEYFRAME}, {"$set": {"timestamp": datetime(2024, 1, 1)}})
+    mongo_db["snapshots"].update_one({"storage": DELTA}, {"$set": {"timestamp": datetime(2024, 1, 2)}})
+
+    assert db.get_snapshot_at(datetime(2023, 12, 31)) is None
+    at_first = db.get_snapshot_at(datetime(2024, 1, 1, 12))
+    at_second = db.get_snapshot_at(datetime(2024, 1, 2) + timedelta(hours=1))
+    assert [r["name"] for r in at_first["resources"][0]["resources"]] == ["vm1"]
+    assert [r["name"] for r in at_second["resources"][0]["resources"]] == ["vm1", "vm2"]
+
+
+def test_chain_resumes_after_restart(mongo_db):
+    db.save_snapshot(make_snapshot([("rg1", "vm1", {})]))
+    db._chains.clear()
+    db.save_snapshot(make_snapshot([("rg1", "vm1", {})]))
+
+    delta = mongo_db["snapshots"].find_one({"storage": DELTA})
+    assert delta["added"] == delta["changed"] == delta["removed"] == []
+
+
+def test_full_storage_mode(mongo_db, monkeypatch):
+    monkeypatch.setattr(db, "SNAPSHOT_STORAGE", "full")
+    db.save_snapshot(make_snapshot([("rg1", "vm1", {})]))
+    db.save_snapshot(make_snapshot([("rg1", "vm1", {})]))
+    assert all("storage" not in d for d in mongo_db["snapshots"].find())
+    assert len(db.get_snapshots()) == 2
+
+
+def test_subscriptions_keep_separate_chains(mongo_db):
+    for name in ("vm1", "vm2"):
+        for subscription_id in ("sub-a", "sub-b"):
+            snapshot = make_snapshot([("rg1", f"{subscription_id}-{name}", {})])
+            snapshot["subscription_id"] = subscription_id
+            db.save_snapshot(snapshot)
+
+    deltas = list(mongo_db["snapshots"].find({"storage": DELTA}))
+    bases = {d["_id"]: d["subscription_id"] for d in mongo_db["snapshots"].find({"storage": KEYFRAME})}
+    assert sorted(bases[d["base"]] for d in deltas) == ["sub-a", "sub-b"]
+
+    # Interleaved chains rebuild correctly in one pass
+    rebuilt = {(s["subscription_id"], r["name"]) for s in db.get_snapshots() for r in s["resources"][0]["resources"]}
+    assert rebuilt == {(s, f"{s}-{n}") for s in ("sub-a", "sub-b") for n in ("vm1", "vm2")}
+    assert [s["subscription_id"] for s in db.get_snapshots(subscription_id="sub-a")] == ["sub-a", "sub-a"]
+
+    latest = db.get_latest_snapshots()
+    assert sorted(s["resources"][0]["resources"][0]["name"] for s in latest) == ["sub-a-vm2", "sub-b-vm2"]
+
+
+def test_subscriptions_are_saved_in_parallel(mongo_db, monkeypatch):
+    record_history = db._record_history
+    blocked, release = threading.Event(), threading.Event()
+
+    def slow_record_history(changes, snapshot_id, data):
+        if data["subscription_id"] == "sub-a":
+            blocked.set()
+            release.wait(5)
+        record_history(changes, snapshot_id, data)
+
+    monkeypatch.setattr(db, "_record_history", slow_record_history)
+    snapshots = {s: dict(make_snapshot([("rg1", f"{s}-vm", {})]), subscription_id=s) for s in ("sub-a", "sub-b")}
+    writer = threading.Thread(target=db.save_snapshot, args=(snapshots["sub-a"],))
+    writer.start()
+    try:
+        assert blocked.wait(5)
+        # sub-a holds its own chain lock, not sub-b's
+        other = threading.Thread(target=db.save_snapshot, args=(snapshots["sub-b"],))
+        other.start()
+        other.join(5)
+        assert not other.is_alive()
+    finally:
+        release.set()
+        writer.join()
+    assert sorted(db.subscription_ids()) == ["sub-a", "sub-b"]
+
+
+def test_chain_reloads_after_another_writer(mongo_db):
+    # Process A and process B (e.g. a leader before and after a lease hand-over)
+    db.save_snapshot(make_snapshot([("rg1", "a", {}), ("rg1", "b", {})]))
+    chains_a = db._chains
+    db._chains = {}
+    db.save_snapshot(make_snapshot([("rg1", "a", {}), ("rg1", "c", {})]))
+    db._chains = chains_a
+    db.save_snapshot(make_snapshot([("rg1", "a", {}), ("rg1", "b", {})]))
+
+    latest = db.get_snapshots(limit=1)[0]
+    assert sorted(r["name"] for r in latest["resources"][0]["resources"]) == ["a", "b"]
+    history = sorted(f"{h['change']}:{h['resource_id'].rsplit('/', 1)[1]}"
+                     for h in mongo_db["resource_history"].find())
+    assert history == ["added:a", "added:b", "added:b", "added:c", "removed:b", "removed:c"]
@@ -0,0 +1,65 @@
+import copy
+
+import db
+import drift_results
+from drift_detect import DriftDetector
+from snapshot_diff import assess, diff_snapshots
+
+
+def resource(rg, name, tags=None, location="westeurope"):
+    return {
+        "name": name,
+        "type": "Microsoft.Compute/virtualMachines",
+        "location": location,
+        "id": f"/subscriptions/sub/resourceGroups/{rg}/providers/Microsoft.Compute/virtualMachines/{name}",
+        "tags": tags or {},
+    }
+
+
+def make_snapshot(*resources):
+    groups = {}
+    for res in resources:
+        groups.setdefault(res["id"].split("/")[4], []).append(res)
+    return {"resources": [{"resource_group": rg, "location": "westeurope", "resources": items}
+                          for rg, items in groups.items()]}
+
+
+def test_diff_classifies_changes():
+    before = make_snapshot(resource("rg1", "vm1", {"env": "dev", "team": "a"}), resource("rg1", "vm2"),
+                           resource("rg1", "vm3"), resource("rg1", "vm4"), resource("rg1", "vm5"))
+    after = make_snapshot(resource("rg1", "vm1", {"env": "prod", "owner": "b"}), resource("rg2", "vm2"),
+                          resource("rg1", "vm3", location="northeurope"), dict(resource("rg1", "vm5"), sku="B2"),
+                          resource("rg1", "vm6"))
+
+    diff = diff_snapshots(before, after)
+    vm = lambda rg, name: resource(rg, name)["id"]
+    assert diff["added"] == [vm("rg1", "vm6")]
+    assert diff["removed"] == [vm("rg1", "vm4")]
+    assert diff["changed"] == [vm("rg1", "vm1"), vm("rg1", "vm3"), vm("rg1", "vm5")]
+    assert diff["moved"] == [{"id": vm("rg2", "vm2"), "previous_id": vm("rg1", "vm2"), "from": "rg1", "to": "rg2"}]
+    assert diff["tags_changed"] == [{"id": vm("rg1", "vm1"), "added": {"owner": "b"}, "removed": ["team"],
+                                     "changed": {"env": ["dev", "prod"]}}]
+    assert diff["location_changed"] == [{"id": vm("rg1", "vm3"), "from": "westeurope", "to": "northeurope"}]
+    assert diff["total"] == 5
+
+
+def test_unchanged_snapshots_score_low():
+    snapshot = make_snapshot(*(resource("rg1", f"vm{i}") for i in range(10)))
+    diff = assess(diff_snapshots(snapshot, copy.deepcopy(snapshot)), DriftDetector())
+    assert not any(diff[key] for key in ("added", "removed", "changed", "moved"))
+    assert (diff["drift_score"], diff["severity"]) == (0.0, "LOW")
+
+    replaced = make_snapshot(*(resource("rg1", f"new{i}") for i in range(10)))
+    diff = assess(diff_snapshots(snapshot, replaced), DriftDetector())
+    assert diff["severity"] == "CRITICAL"
+
+
+def test_report_includes_moves_and_severity(mongo_db):
+    db.save_snapshot(make_snapshot(resource("rg1", "vm1"), resource("rg1", "vm2", {"env": "dev"})))
+    db.save_snapshot(make_snapshot(resource("rg2", "vm1"), resource("rg1", "vm2", {"env": "prod"})))
+
+    report = drift_results.snapshot_drift()
+    assert [m["to"] for m in report["moved"]] == ["rg2"]
+    assert report["added"] == report["removed"] == []
+    assert [t["changed"] for t in report["tags_changed"]] == [{"env": ["dev", "prod"]}]
+    assert report["severity"] == report["subscriptions"]["default"]["severity"] == "CRITICAL"
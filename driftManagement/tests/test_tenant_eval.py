@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import features
+import tenant_eval
+
+END = datetime(2024, 1, 3)
+
+
+@pytest.fixture
+def configs(mongo_db):
+    tenant_eval.clear_cache()
+    yield mongo_db[tenant_eval.CONFIGS_COLLECTION]
+    tenant_eval.clear_cache()
+
+
+def add_series(mongo_db, tenant_id, dimension, key, counts):
+    mongo_db[features.SERIES_COLLECTION].insert_many([
+        {"dimension": dimension, "tenant_id": tenant_id, "key": key,
+         "bucket": END - timedelta(hours=len(counts) - hour), "count": count}
+        for hour, count in enumerate(counts)
+    ])
+
+
+def test_each_tenant_is_scored_with_its_own_configs(configs, mongo_db):
+    # The same activity shift in three tenants
+    shift = [5] * 24 + [0] * 12 + [10] * 12
+    for tenant_id in ("t1", "t2", "t3"):
+        add_series(mongo_db, tenant_id, "user", "bob", shift)
+        add_series(mongo_db, tenant_id, "app", "Portal", shift)
+    configs.insert_many([
+        {"tenant_id": "t1", "config_id": "a", "thresholds": {"tolerance": 100}, "alerts": [],
+         "created_at": datetime(2024, 1, 1)},
+        {"tenant_id": "t2", "config_id": "b", "thresholds": {"critical": 0.01, "high": 0.005, "medium": 0.001,
+                                                              "user": {"critical": 1000, "high": 1000}},
+         "alerts": [{"severity": "critical"}], "created_at": datetime(2024, 1, 1)},
+        {"tenant_id": "t2", "config_id": "c", "thresholds": {"tolerance": "lots"}, "alerts": ["MEDIUM"],
+         "created_at": datetime(2024, 1, 2)},
+    ])
+
+    rows = {(r["tenant_id"], r["dimension"]): r
+            for r in tenant_eval.evaluate_tenants(end=END, window=24, unit="hour")}
+    assert rows[("t1", "user")]["drift_score"] == rows[("t1", "app")]["drift_score"] == 0.0
+    assert rows[("t2", "user")]["drift_score"] == rows[("t3", "user")]["drift_score"] > 0
+    assert rows[("t2", "app")]["severity"] == "CRITICAL" and rows[("t2", "app")]["alert"]
+    assert rows[("t2", "user")]["severity"] == "MEDIUM" and rows[("t2", "user")]["alert"]
+    assert rows[("t3", "user")]["severity"] == "LOW" and not rows[("t3", "user")]["alert"]
+
+
+def test_configs_are_cached_until_they_change(configs, monkeypatch):
+    configs.insert_one({"tenant_id": "t1", "thresholds": {"tolerance": 0.5}, "alerts": []})
+    loads = []
+
+    class CountingConfigs:
+        def aggregate(self, pipeline):
+            return configs.aggregate(pipeline)
+
+        def find(self, *args):
+            loads.append(args)
+            return configs.find(*args)
+
+    monkeypatch.setattr(tenant_eval, "configs_collection", CountingConfigs)
+
+    first = tenant_eval.load_tenant_settings()
+    assert tenant_eval.load_tenant_settings() is first
+    assert len(loads) == 1 and first["t1"]["defaults"] == {"tolerance": 0.5}
+
+    configs.insert_one({"tenant_id": "t1", "thresholds": {"tolerance": 0.7}, "alerts": []})
+    assert tenant_eval.load_tenant_settings()["t1"]["defaults"] == {"tolerance": 0.7}
+    # Same count, as when a config is deleted and another created
+    configs.delete_one({"thresholds.tolerance": 0.5})
+    configs.insert_one({"tenant_id": "t1", "thresholds": {"tolerance": 0.9}, "alerts": [],
+                        "created_at": datetime(2024, 1, 1)})
+    assert tenant_eval.load_tenant_settings()["t1"]["defaults"] == {"tolerance": 0.9}
+    configs.delete_many({})
+    assert tenant_eval.load_tenant_settings() == {}
+    assert len(loads) == 4
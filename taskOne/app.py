@@ -1,41 +1,77 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Blueprint, Flask, current_app, request, jsonify, render_template
 from flask_cors import CORS
 from flask_pymongo import PyMongo
 from dotenv import load_dotenv
 import os
-import bcrypt
 import jwt
 import datetime
-from functools import wraps
+from functools import partial, wraps
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 from flask import make_response
-from security import SecurityManager, rate_limit
+from ratelimit import MongoStore
+from repository import Repository, page_limit
+from security import SecurityManager
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__, template_folder="templates", static_folder="static")
-CORS(app, supports_credentials=True)
-
-# Security configuration
-app.config["JWT_SECRET"] = os.getenv("JWT_SECRET")
-app.config["MONGO_URI"] = os.getenv("MONGO_URI")
-security = SecurityManager(app)
-security.init_app(app)
-
-# MongoDB setup
-mongo = PyMongo(app)
+# Extensions are bound to an app in create_app; nothing connects at import
+security = SecurityManager()
+mongo = PyMongo()
+repo = Repository(lambda: mongo.db)
+bp = Blueprint("main", __name__)
 
 # Default admin credentials
 DEFAULT_ADMIN_EMAIL = os.getenv("DEFAULT_ADMIN_EMAIL")
 DEFAULT_ADMIN_PASSWORD_PLAIN = os.getenv("DEFAULT_ADMIN_PASSWORD")
+# Create the default admin when the app is built (off: run `flask create-admin` once instead)
+CREATE_DEFAULT_ADMIN = os.getenv("CREATE_DEFAULT_ADMIN", "true").lower() in ("1", "true", "yes")
+# Where rate limit counters live: "mongo" (shared by all workers) or "memory" (per process)
+RATELIMIT_STORAGE = os.getenv("RATELIMIT_STORAGE", "mongo")
+# Create the unique and lookup indexes when the app is built
+ENSURE_INDEXES = os.getenv("ENSURE_INDEXES", "true").lower() in ("1", "true", "yes")
+
+
+def create_app(config=None):
+    """Build the app. Each process (e.g. each gunicorn worker) calls this after fork,
+    so its MongoClient is never shared with a parent process."""
+    app = Flask(__name__, template_folder="templates", static_folder="static")
+    CORS(app, supports_credentials=True)
+
+    # Security configuration
+    app.config["JWT_SECRET"] = os.getenv("JWT_SECRET")
+    app.config["MONGO_URI"] = os.getenv("MONGO_URI")
+    app.config["CREATE_DEFAULT_ADMIN"] = CREATE_DEFAULT_ADMIN
+    app.config["RATELIMIT_STORAGE"] = RATELIMIT_STORAGE
+    app.config["ENSURE_INDEXES"] = ENSURE_INDEXES
+    app.config.update(config or {})
+    storage = None
+    if app.config["RATELIMIT_STORAGE"] == "mongo":
+        storage = MongoStore(lambda: mongo.db.rate_limits)
+    security.init_app(app, rate_limit_storage=storage)
+
+    # MongoDB setup; the client connects on its first operation
+    mongo.init_app(app, connect=False)
+
+    app.register_blueprint(bp)
+    app.cli.command("create-admin")(create_default_admin)
+    with app.app_context():
+        if app.config["ENSURE_INDEXES"]:
+            repo.ensure_indexes()
+        if app.config["CREATE_DEFAULT_ADMIN"] and DEFAULT_ADMIN_EMAIL:
+            create_default_admin()
+    return app
+
 
 def create_default_admin():
-    admin = mongo.db.users.find_one({"email": DEFAULT_ADMIN_EMAIL})
-    if not admin:
+    """Create the default admin account if it does not exist."""
+    # The lookup only saves hashing on every start; the unique email index
+    # settles races between workers starting together
+    created = False
+    if not repo.find_user(DEFAULT_ADMIN_EMAIL):
         hashed_pw = security.hash_password(DEFAULT_ADMIN_PASSWORD_PLAIN)
-        mongo.db.users.insert_one({
+        created = repo.insert_user({
             "email": DEFAULT_ADMIN_EMAIL,
             "password": hashed_pw,
             "role": "admin",
@@ -43,13 +79,11 @@ def create_default_admin():
             "2fa_enabled": False,
             "created_at": datetime.datetime.utcnow()
         })
+    if created:
         print("Default admin created.")
     else:
         print("ℹAdmin already exists.")
 
-# Initialize admin
-create_default_admin()
-
 # New token verification decorator 
 def token_required(f):
     @wraps(f)
@@ -66,7 +100,7 @@ def token_required(f):
             return jsonify({"error": "Token is missing!"}), 401
 
         try:
-            data = jwt.decode(token, app.config["JWT_SECRET"], algorithms=["HS256"])
+            data = jwt.decode(token, current_app.config["JWT_SECRET"], algorithms=["HS256"])
             if data.get("role") != "admin":
                 return jsonify({"error": "Unauthorized, admin only"}), 403
             request.user = data  # you can access user info from request.user in the route if needed
@@ -79,25 +113,40 @@ def token_required(f):
 
     return decorated
 
+def paginated(list_page):
+    """JSON list of one page; the cursor for the next page is in X-Next-Cursor.
+
+    ``list_page(cursor=..., limit=...)`` returns (documents, next cursor).
+    """
+    try:
+        docs, next_cursor = list_page(cursor=request.args.get("cursor"),
+                                      limit=page_limit(request.args.get("limit")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = jsonify(docs)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
 # --- HTML Page Routes ---
-@app.route("/")
+@bp.route("/")
 def serve_home():
     return render_template("index.html", google_client_id=os.getenv("GOOGLE_CLIENT_ID"))
 
-@app.route("/admin")
+@bp.route("/admin")
 @security.verify_session
 @security.require_role(["admin"])
 def serve_admin():
     return render_template("admin.html")
 
-@app.route("/user")
+@bp.route("/user")
 @security.verify_session
 def serve_user():
     return render_template("user.html")
 
 # --- API Endpoints ---
-@app.route("/api/auth/login", methods=["POST"])
-@rate_limit("5 per minute")
+@bp.route("/api/auth/login", methods=["POST"])
+@security.rate_limit("5 per minute")
 def login():
     data = request.get_json()
     email = data.get("email")
@@ -107,11 +156,10 @@ def login():
     if not email or not password:
         return jsonify({"error": "Email and password required"}), 400
 
-    user = mongo.db.users.find_one({"email": email})
-    if not user:
-        return jsonify({"error": "User not found"}), 401
-
-    if not security.verify_password(password, user["password"]):
+    user = repo.find_user(email)
+    # Unknown emails still pay for a (dummy) hash check and get the same
+    # answer, so neither timing nor message reveals which accounts exist
+    if not security.verify_password(password, (user or {}).get("password")):
         return jsonify({"error": "Invalid credentials"}), 401
 
     # Check 2FA if enabled
@@ -123,11 +171,17 @@ def login():
 
     return security.create_session_token(user)
 
-@app.route("/api/auth/2fa/setup", methods=["POST"])
+@bp.route("/api/security/hashing", methods=["GET"])
+@security.verify_session
+@security.require_role(["admin"])
+def hashing_stats():
+    return jsonify(security.hasher.stats())
+
+@bp.route("/api/auth/2fa/setup", methods=["POST"])
 @security.verify_session
 def setup_2fa():
     user = request.user
-    db_user = mongo.db.users.find_one({"email": user["email"]})
+    db_user = repo.find_user(user["email"])
     
     if db_user.get("2fa_enabled"):
         return jsonify({"error": "2FA already enabled"}), 400
@@ -135,8 +189,8 @@ def setup_2fa():
     setup_data = security.setup_2fa(user["email"])
     
     # Store the secret temporarily (user needs to verify before enabling)
-    mongo.db.users.update_one(
-        {"email": user["email"]},
+    repo.update_user(
+        user["email"],
         {"$set": {"2fa_temp_secret": setup_data["secret"]}}
     )
     
@@ -145,14 +199,14 @@ def setup_2fa():
         "uri": setup_data["uri"]
     })
 
-@app.route("/api/auth/2fa/verify", methods=["POST"])
+@bp.route("/api/auth/2fa/verify", methods=["POST"])
 @security.verify_session
 def verify_2fa_setup():
     data = request.get_json()
     token = data.get("token")
     
     user = request.user
-    db_user = mongo.db.users.find_one({"email": user["email"]})
+    db_user = repo.find_user(user["email"])
     
     if not db_user.get("2fa_temp_secret"):
         return jsonify({"error": "No pending 2FA setup"}), 400
@@ -161,8 +215,8 @@ def verify_2fa_setup():
         return jsonify({"error": "Invalid token"}), 401
     
     # Enable 2FA
-    mongo.db.users.update_one(
-        {"email": user["email"]},
+    repo.update_user(
+        user["email"],
         {
             "$set": {
                 "2fa_enabled": True,
@@ -174,20 +228,19 @@ def verify_2fa_setup():
     
     return jsonify({"message": "2FA enabled successfully"})
 
-@app.route("/api/auth/logout", methods=["POST"])
+@bp.route("/api/auth/logout", methods=["POST"])
 def logout():
     response = make_response(jsonify({"message": "Logged out successfully"}))
     response.delete_cookie('session_token')
     return response
 
-@app.route("/api/tenants", methods=["GET"])
+@bp.route("/api/tenants", methods=["GET"])
 @security.verify_session
 @security.require_role(["admin"])
 def get_tenants():
-    tenants = list(mongo.db.tenants.find({}, {"_id": 0}))
-    return jsonify(tenants)
+    return paginated(repo.list_tenants)
 
-@app.route("/api/tenants", methods=["POST"])
+@bp.route("/api/tenants", methods=["POST"])
 @security.verify_session
 @security.require_role(["admin"])
 def create_tenant():
@@ -198,9 +251,6 @@ def create_tenant():
     if not tenant_id or not name:
         return jsonify({"error": "Tenant ID and name required"}), 400
     
-    if mongo.db.tenants.find_one({"tenant_id": tenant_id}):
-        return jsonify({"error": "Tenant ID already exists"}), 400
-    
     tenant = {
         "tenant_id": tenant_id,
         "name": name,
@@ -209,23 +259,20 @@ def create_tenant():
         "created_at": datetime.datetime.utcnow()
     }
     
-    mongo.db.tenants.insert_one(tenant)
+    if not repo.insert_tenant(tenant):
+        return jsonify({"error": "Tenant ID already exists"}), 400
     return jsonify({"message": "Tenant created successfully"})
 
-@app.route("/api/drift/configs", methods=["GET"])
+@bp.route("/api/drift/configs", methods=["GET"])
 @security.verify_session
 def get_drift_configs():
     tenant_id = request.user.get("tenant_id")
     if not tenant_id:
         return jsonify({"error": "Tenant ID required"}), 400
     
-    configs = list(mongo.db.drift_configs.find(
-        {"tenant_id": tenant_id},
-        {"_id": 0}
-    ))
-    return jsonify(configs)
+    return paginated(partial(repo.list_drift_configs, tenant_id))
 
-@app.route("/api/drift/configs", methods=["POST"])
+@bp.route("/api/drift/configs", methods=["POST"])
 @security.verify_session
 def create_drift_config():
     tenant_id = request.user.get("tenant_id")
@@ -241,11 +288,12 @@ def create_drift_config():
         "created_at": datetime.datetime.utcnow()
     }
     
-    mongo.db.drift_configs.insert_one(config)
+    if not repo.insert_drift_config(config):
+        return jsonify({"error": "Config ID already exists"}), 400
     return jsonify({"message": "Drift configuration created successfully"})
 
 #Block back button from sending admin or user back to dashboard after logging out
-@app.after_request
+@bp.after_app_request
 def add_header(response):
     response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0"
     response.headers["Pragma"] = "no-cache"
@@ -253,4 +301,4 @@ def add_header(response):
     return response
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5500)
+    create_app().run(debug=True, port=5500)
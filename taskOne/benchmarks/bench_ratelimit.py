@@ -0,0 +1,60 @@
+"""Per-request overhead of the rate limiter.
+
+Times a GCRA hit on each store, and a full limit check inside a Flask
+request context, over many client keys.
+
+Run from taskOne/: python benchmarks/bench_ratelimit.py [--mongo-uri mongodb://localhost:27017]
+"""
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ratelimit import Limit, MemoryStore, MongoStore, RateLimiter  # noqa: E402
+
+HITS = 200_000
+MONGO_HITS = 2_000
+KEYS = 10_000
+
+
+def per_hit(fn, hits):
+    start = time.perf_counter()
+    for i in range(hits):
+        fn(i)
+    return (time.perf_counter() - start) / hits * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", help="also time MongoStore against this MongoDB")
+    args = parser.parse_args()
+
+    limit = Limit("50 per hour")
+    now = time.time()
+    store = MemoryStore()
+    memory = per_hit(lambda i: store.hit(f"k{i % KEYS}", limit, now + i * 1e-3), HITS)
+    print(f"MemoryStore.hit                  {memory:8.2f} us")
+
+    app = Flask(__name__)
+    limiter = RateLimiter(default_limits=["200 per day", "50 per hour"])
+    with app.test_request_context("/", environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        check = per_hit(lambda i: limiter.check(f"endpoint{i % KEYS}", limiter.default_limits), HITS)
+    print(f"RateLimiter.check (2 limits)     {check:8.2f} us")
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+
+        collection = MongoClient(args.mongo_uri)["ratelimit_bench"]["rate_limits"]
+        collection.drop()
+        mongo = MongoStore(lambda: collection)
+        mongo_hit = per_hit(lambda i: mongo.hit(f"k{i % KEYS}", limit, time.time()), MONGO_HITS)
+        print(f"MongoStore.hit                   {mongo_hit:8.2f} us")
+        collection.drop()
+
+
+if __name__ == "__main__":
+    main()
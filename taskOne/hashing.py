@@ -0,0 +1,143 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# bcrypt work factor for new hashes (existing hashes keep the cost they were made with)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Processes hashing passwords per app process; 0 hashes in the request thread
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Hashes queued or running at once before requests are turned away with 503
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "16"))
+# Retry-After (seconds) sent with those 503s
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "2"))
+
+
+class HashingOverloaded(Exception):
+    """Raised instead of queueing a hash when PASSWORD_HASH_QUEUE_LIMIT are pending."""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+# These run in the pool processes. time.monotonic() is system-wide on
+# Linux, so the start time can be compared with the submit time.
+def _hash(password, rounds):
+    started = time.monotonic()
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)), started
+
+
+def _check(password, hashed):
+    started = time.monotonic()
+    return bcrypt.checkpw(password, hashed), started
+
+
+class PasswordHasher:
+    """bcrypt on a bounded process pool, so hashing never holds a request worker's CPU.
+
+    At most ``queue_limit`` hashes are queued or running; beyond that calls
+    raise HashingOverloaded rather than wait. The pool is created on first
+    use in each process, so forked servers never share one.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_HASH_WORKERS, queue_limit=PASSWORD_HASH_QUEUE_LIMIT,
+                 retry_after=PASSWORD_HASH_RETRY_AFTER):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._dummy = None
+        self._dummy_lock = threading.Lock()
+        self._stats = {"completed": 0, "rejected": 0, "latency_seconds_total": 0.0, "latency_seconds_max": 0.0,
+                       "queue_wait_seconds_total": 0.0, "queue_wait_seconds_max": 0.0}
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # spawn: forking a threaded server process can copy held locks
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                self._stats["rejected"] += 1
+                raise HashingOverloaded(self.retry_after)
+            self._pending += 1
+        submitted = time.monotonic()
+        try:
+            if self.workers > 0:
+                result, started = self._pool().submit(fn, *args).result()
+            else:
+                result, started = fn(*args)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool on the next call
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            finished = time.monotonic()
+            with self._lock:
+                self._pending -= 1
+        self._record(finished - submitted, max(started - submitted, 0.0))
+        return result
+
+    def _record(self, latency, queue_wait):
+        with self._lock:
+            stats = self._stats
+            stats["completed"] += 1
+            stats["latency_seconds_total"] += latency
+            stats["latency_seconds_max"] = max(stats["latency_seconds_max"], latency)
+            stats["queue_wait_seconds_total"] += queue_wait
+            stats["queue_wait_seconds_max"] = max(stats["queue_wait_seconds_max"], queue_wait)
+        logger.debug("Password hash took %.3fs (%.3fs queued)", latency, queue_wait)
+
+    def hash(self, password):
+        return self._run(_hash, password.encode("utf-8"), self.rounds).decode("utf-8")
+
+    def verify(self, password, hashed):
+        """Check a password; with no ``hashed`` (unknown user) a dummy hash is checked
+        instead, so the response takes as long as for a real account."""
+        if not hashed:
+            hashed = self._dummy_hash()
+            self._run(_check, password.encode("utf-8"), hashed)
+            return False
+        return self._run(_check, password.encode("utf-8"), hashed.encode("utf-8"))
+
+    def warm_up(self):
+        """Make the dummy hash now, so no login has to pay for it."""
+        self._dummy_hash()
+
+    def _dummy_hash(self):
+        with self._dummy_lock:
+            if self._dummy is None:
+                self._dummy = bcrypt.hashpw(os.urandom(16).hex().encode("utf-8"), bcrypt.gensalt(self.rounds))
+            return self._dummy
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, queue_depth=self._pending, queue_limit=self.queue_limit,
+                         workers=self.workers, rounds=self.rounds)
+        completed = stats["completed"] or 1
+        stats["latency_seconds_mean"] = stats["latency_seconds_total"] / completed
+        stats["queue_wait_seconds_mean"] = stats["queue_wait_seconds_total"] / completed
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown()
@@ -0,0 +1,168 @@
+import datetime
+import re
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# "5 per minute", "100/hour", "2 per 10 seconds"
+LIMIT_PATTERN = re.compile(r"^\s*(\d+)\s*(?:per|/)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$", re.IGNORECASE)
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(limit_string):
+    """Return (count, period in seconds) for a limit like "5 per minute"."""
+    match = LIMIT_PATTERN.match(limit_string)
+    if not match:
+        raise ValueError(f"Invalid rate limit {limit_string!r}; expected e.g. '5 per minute'")
+    count, multiplier, unit = match.groups()
+    count, period = int(count), int(multiplier or 1) * PERIODS[unit.lower()]
+    if count < 1 or period < 1:
+        raise ValueError(f"Invalid rate limit {limit_string!r}")
+    return count, period
+
+
+class Limit:
+    """A parsed limit, enforced with GCRA (generic cell rate algorithm).
+
+    Each key stores a single number, its theoretical arrival time (TAT): a
+    request is allowed when advancing the TAT by one ``interval`` keeps it
+    within ``period`` of now. That allows ``count`` requests in a burst and
+    then one per ``interval``, like a sliding window but in O(1) time and
+    space per key. Once the TAT has passed the key is as good as new, so
+    stores can drop it then.
+    """
+
+    def __init__(self, limit_string):
+        self.text = limit_string
+        self.count, self.period = parse_limit(limit_string)
+        self.interval = self.period / self.count
+
+
+class MemoryStore:
+    """Per-process GCRA state; each server process counts on its own."""
+
+    def __init__(self):
+        self._tats = {}
+        self._lock = threading.Lock()
+        self._since_sweep = 0
+
+    def hit(self, key, limit, now):
+        """Count a request; returns (allowed, seconds until the next one would be)."""
+        with self._lock:
+            tat = max(self._tats.get(key, now), now)
+            allowed = tat + limit.interval - now <= limit.period
+            if allowed:
+                tat = self._tats[key] = tat + limit.interval
+            # Sweep expired keys once every len(keys) hits: amortized O(1)
+            self._since_sweep += 1
+            if self._since_sweep >= len(self._tats):
+                self._tats = {k: t for k, t in self._tats.items() if t > now}
+                self._since_sweep = 0
+        return allowed, max(tat + limit.interval - limit.period - now, 0.0)
+
+    def __len__(self):
+        return len(self._tats)
+
+
+class MongoStore:
+    """GCRA state in a MongoDB collection, shared by every server process.
+
+    Each hit is one atomic find_one_and_update with an update pipeline, and
+    a TTL index on ``expires_at`` removes keys once their TAT has passed.
+    ``collection`` is a callable returning the collection, so it can be
+    resolved per request (e.g. ``lambda: mongo.db.rate_limits``).
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    def _ensure_index(self, collection):
+        if not self._indexed:
+            collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    def hit(self, key, limit, now):
+        collection = self.collection()
+        self._ensure_index(collection)
+        pipeline = [
+            {"$set": {"next": {"$add": [{"$max": [{"$ifNull": ["$tat", now]}, now]}, limit.interval]}}},
+            {"$set": {"allowed": {"$lte": [{"$subtract": ["$next", now]}, limit.period]}}},
+            # The TAT never runs more than a period ahead, so the key can go then
+            {"$set": {"tat": {"$cond": ["$allowed", "$next", "$tat"]},
+                      "expires_at": datetime.datetime.utcfromtimestamp(now + limit.period)}},
+            {"$project": {"next": 0}},
+        ]
+        try:
+            doc = collection.find_one_and_update({"_id": key}, pipeline, upsert=True,
+                                                 return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            # Another process created the key first; it exists now
+            doc = collection.find_one_and_update({"_id": key}, pipeline, return_document=ReturnDocument.AFTER)
+        return doc["allowed"], max(doc["tat"] + limit.interval - limit.period - now, 0.0)
+
+
+def remote_address():
+    return request.remote_addr or "127.0.0.1"
+
+
+class RateLimiter:
+    """Per-route rate limits, parsed once when the route is registered.
+
+    ``limit`` decorates a view; ``default_limits`` apply to every other
+    endpoint. Limits are counted per endpoint and ``key_func`` value (the
+    client address by default) in ``storage``; denied requests get 429
+    with Retry-After.
+    """
+
+    def __init__(self, storage=None, key_func=remote_address, default_limits=()):
+        self.storage = storage or MemoryStore()
+        self.key_func = key_func
+        self.default_limits = [Limit(text) for text in default_limits]
+        self.clock = time.time
+
+    def init_app(self, app, storage=None):
+        if storage is not None:
+            self.storage = storage
+        limited = self
+
+        @app.before_request
+        def apply_default_limits():
+            view = current_app.view_functions.get(request.endpoint)
+            if view is None or request.endpoint == "static" or getattr(view, "rate_limited", False):
+                return None
+            return limited.check(request.endpoint, limited.default_limits)
+
+    def check(self, scope, limits):
+        """Count a request against ``limits``; returns a 429 response if one is exceeded."""
+        key = f"{scope}:{self.key_func()}"
+        now = self.clock()
+        for limit in limits:
+            allowed, retry_after = self.storage.hit(f"{key}:{limit.text}", limit, now)
+            if not allowed:
+                response = jsonify({"error": f"Rate limit exceeded: {limit.text}"})
+                response.headers["Retry-After"] = str(max(int(retry_after + 0.999), 1))
+                return response, 429
+        return None
+
+    def limit(self, *limit_strings):
+        """Decorator limiting a view, e.g. ``@limiter.limit("5 per minute")``."""
+        limits = [Limit(text) for text in limit_strings]
+
+        def decorator(f):
+            scope = f"{f.__module__}.{f.__name__}"
+
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                denied = self.check(scope, limits)
+                if denied is not None:
+                    return denied
+                return f(*args, **kwargs)
+
+            decorated.rate_limited = True
+            return decorated
+        return decorator
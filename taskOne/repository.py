@@ -0,0 +1,160 @@
+import base64
+import logging
+import os
+import threading
+
+from bson import ObjectId
+from cachetools import TTLCache
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# List endpoints return pages of this many documents (clients may ask for up to MAX_PAGE_SIZE)
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = 1000
+# Tenant and config reads are cached per process for this long (writes in
+# this process invalidate at once; other processes see them after the TTL)
+READ_CACHE_SIZE = int(os.getenv("READ_CACHE_SIZE", "1024"))
+READ_CACHE_SECONDS = float(os.getenv("READ_CACHE_SECONDS", "30"))
+
+# (collection, keys, options) created by ensure_indexes
+INDEXES = [
+    ("users", [("email", 1)], {"unique": True}),
+    ("tenants", [("tenant_id", 1)], {"unique": True}),
+    # config_id is optional; only named configs must be unique per tenant
+    ("drift_configs", [("tenant_id", 1), ("config_id", 1)],
+     {"unique": True, "partialFilterExpression": {"config_id": {"$type": "string"}}}),
+    ("drift_configs", [("tenant_id", 1), ("_id", 1)], {}),
+]
+
+
+def encode_cursor(oid):
+    """Opaque cursor pointing just past the document with ``_id`` ``oid``."""
+    return base64.urlsafe_b64encode(str(oid).encode("ascii")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input."""
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("ascii"))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def page_limit(value):
+    """Validate a requested page size (None for the default)."""
+    if value is None:
+        return PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid limit: {value!r}")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+class Repository:
+    """Data access for users, tenants and drift configs.
+
+    ``database`` is a callable returning the pymongo Database (e.g.
+    ``lambda: mongo.db``), resolved on each call. Uniqueness is enforced by
+    indexes, so inserts are single writes that report duplicates instead
+    of checking first.
+    """
+
+    def __init__(self, database, cache_size=READ_CACHE_SIZE, cache_seconds=READ_CACHE_SECONDS):
+        self.database = database
+        self._cache = TTLCache(cache_size, cache_seconds)
+        # Bumping a scope's generation orphans its cached entries, which
+        # then age out of the cache
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        database = self.database()
+        for name, keys, options in INDEXES:
+            try:
+                database[name].create_index(keys, **options)
+            except OperationFailure as e:
+                # Existing duplicates; the app still works, without the guarantee
+                logger.warning("Could not create index %s on %s: %s", keys, name, e)
+
+    # -- cache -----------------------------------------------------------
+
+    def _cached(self, scope, key, load):
+        with self._lock:
+            full_key = (scope, self._generations.get(scope, 0)) + key
+            if full_key in self._cache:
+                return self._cache[full_key]
+        value = load()
+        with self._lock:
+            if full_key[1] == self._generations.get(scope, 0):
+                self._cache[full_key] = value
+        return value
+
+    def invalidate(self, scope):
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._generations.clear()
+
+    def _page(self, collection, query, cursor=None, limit=PAGE_SIZE):
+        """One page of ``query`` in _id order: (documents without _id, next cursor or None)."""
+        if cursor:
+            query = dict(query, _id={"$gt": decode_cursor(cursor)})
+        docs = list(self.database()[collection].find(query).sort("_id", 1).limit(limit))
+        next_cursor = encode_cursor(docs[-1]["_id"]) if len(docs) == limit else None
+        for doc in docs:
+            del doc["_id"]
+        return docs, next_cursor
+
+    # -- users -----------------------------------------------------------
+
+    def find_user(self, email):
+        return self.database().users.find_one({"email": email})
+
+    def insert_user(self, user):
+        """Insert a user; False if the email is taken."""
+        try:
+            self.database().users.insert_one(user)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def update_user(self, email, update):
+        return self.database().users.update_one({"email": email}, update)
+
+    # -- tenants ---------------------------------------------------------
+
+    def list_tenants(self, cursor=None, limit=PAGE_SIZE):
+        return self._cached("tenants", (cursor, limit), lambda: self._page("tenants", {}, cursor, limit))
+
+    def insert_tenant(self, tenant):
+        """Insert a tenant; False if the tenant_id is taken."""
+        try:
+            self.database().tenants.insert_one(tenant)
+        except DuplicateKeyError:
+            return False
+        finally:
+            self.invalidate("tenants")
+        return True
+
+    # -- drift configs ---------------------------------------------------
+
+    def list_drift_configs(self, tenant_id, cursor=None, limit=PAGE_SIZE):
+        return self._cached(("drift_configs", tenant_id), (cursor, limit),
+                            lambda: self._page("drift_configs", {"tenant_id": tenant_id}, cursor, limit))
+
+    def insert_drift_config(self, config):
+        """Insert a drift config; False if the tenant already has one with this config_id."""
+        try:
+            self.database().drift_configs.insert_one(config)
+        except DuplicateKeyError:
+            return False
+        finally:
+            self.invalidate(("drift_configs", config["tenant_id"]))
+        return True
@@ -2,22 +2,43 @@ from functools import wraps
 from flask import request, jsonify, make_response
 import jwt
 import datetime
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 import pyotp
-import bcrypt
 from flask import current_app
+from ratelimit import RateLimiter
+from hashing import (BCRYPT_ROUNDS, PASSWORD_HASH_QUEUE_LIMIT, PASSWORD_HASH_WORKERS, HashingOverloaded,
+                     PasswordHasher)
 
 class SecurityManager:
-    def __init__(self, app):
+    def __init__(self, app=None):
+        self.app = None
+        self.limiter = RateLimiter(default_limits=["200 per day", "50 per hour"])
+        self.hasher = PasswordHasher()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, rate_limit_storage=None):
         self.app = app
-        self.limiter = Limiter(
-            app=app,
-            key_func=get_remote_address,
-            default_limits=["200 per day", "50 per hour"]
+        self.limiter.init_app(app, rate_limit_storage)
+
+        # Password hashing runs on a process pool sized per app
+        app.config.setdefault("BCRYPT_ROUNDS", BCRYPT_ROUNDS)
+        app.config.setdefault("PASSWORD_HASH_WORKERS", PASSWORD_HASH_WORKERS)
+        app.config.setdefault("PASSWORD_HASH_QUEUE_LIMIT", PASSWORD_HASH_QUEUE_LIMIT)
+        self.hasher.shutdown()
+        self.hasher = PasswordHasher(
+            rounds=app.config["BCRYPT_ROUNDS"],
+            workers=app.config["PASSWORD_HASH_WORKERS"],
+            queue_limit=app.config["PASSWORD_HASH_QUEUE_LIMIT"],
         )
-        
-    def init_app(self, app):
+        # Unknown-email logins check against a dummy hash; make it before serving
+        self.hasher.warm_up()
+
+        @app.errorhandler(HashingOverloaded)
+        def hashing_overloaded(error):
+            response = jsonify({"error": "Server busy, try again shortly"})
+            response.headers["Retry-After"] = str(error.retry_after)
+            return response, 503
+
         # Configure security headers
         @app.after_request
         def add_security_headers(response):
@@ -81,6 +102,10 @@ class SecurityManager:
             return decorated
         return decorator
 
+    def rate_limit(self, *limit_strings):
+        """Limit a route, e.g. @security.rate_limit("5 per minute"); parsed once at registration"""
+        return self.limiter.limit(*limit_strings)
+
     def setup_2fa(self, user_id):
         """Generate 2FA secret for a user"""
         secret = pyotp.random_base32()
@@ -100,18 +125,9 @@ class SecurityManager:
         return totp.verify(token)
 
     def hash_password(self, password):
-        """Hash password with bcrypt"""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        """Hash password with bcrypt on the hashing pool"""
+        return self.hasher.hash(password)
 
     def verify_password(self, password, hashed):
-        """Verify password against hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-
-# Rate limiting decorators
-def rate_limit(limit_string):
-    def decorator(f):
-        @wraps(f)
-        def decorated(*args, **kwargs):
-            return Limiter.limit(limit_string)(f)(*args, **kwargs)
-        return decorated
-    return decorator 
\ No newline at end of file
+        """Verify password against hash; a missing hash runs a dummy check and fails"""
+        return self.hasher.verify(password, hashed)
@@ -0,0 +1,39 @@
+import flask_pymongo
+import mongomock
+import pytest
+
+import app as app_module
+from ratelimit import MemoryStore
+
+TEST_CONFIG = {
+    "TESTING": True,
+    "MONGO_URI": "mongodb://localhost:27017/taskone_test",
+    "JWT_SECRET": "taskone-test-secret-of-at-least-32-bytes",
+    "RATELIMIT_STORAGE": "memory",
+    "CREATE_DEFAULT_ADMIN": False,
+    # Cheapest bcrypt cost, hashed in the test process
+    "BCRYPT_ROUNDS": 4,
+    "PASSWORD_HASH_WORKERS": 0,
+}
+
+
+@pytest.fixture
+def database():
+    """An empty in-memory mongomock database."""
+    return mongomock.MongoClient()["taskone_test"]
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """taskOne built on an in-memory mongomock database, with fresh rate limit counters and read cache."""
+    monkeypatch.setattr(flask_pymongo, "MongoClient", lambda *args, **kwargs: mongomock.MongoClient())
+    app = app_module.create_app(TEST_CONFIG)
+    monkeypatch.setattr(app_module.security.limiter, "storage", MemoryStore())
+    app_module.repo.clear_cache()
+    yield app
+    app_module.security.hasher.shutdown()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
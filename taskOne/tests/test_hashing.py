@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+import app as app_module
+import hashing
+from hashing import HashingOverloaded, PasswordHasher
+
+
+def count_calls(monkeypatch, module, name):
+    calls = []
+    original = getattr(module, name)
+
+    def counted(*args):
+        calls.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(module, name, counted)
+    return calls
+
+
+def test_hash_and_verify_inline():
+    hasher = PasswordHasher(rounds=4, workers=0)
+    hashed = hasher.hash("s3cret")
+    assert hashed.startswith("$2b$04$")
+    assert hasher.verify("s3cret", hashed)
+    assert not hasher.verify("wrong", hashed)
+    assert hasher.stats()["completed"] == 3
+
+
+def test_hash_and_verify_on_process_pool():
+    hasher = PasswordHasher(rounds=4, workers=1)
+    try:
+        hashed = hasher.hash("s3cret")
+        assert hasher.verify("s3cret", hashed)
+        assert not hasher.verify("wrong", hashed)
+    finally:
+        hasher.shutdown()
+    stats = hasher.stats()
+    assert stats["completed"] == 3
+    assert stats["workers"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_full_queue_is_rejected_with_retry_after(monkeypatch):
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_hash(password, rounds):
+        entered.set()
+        release.wait(5)
+        return b"hashed", time.monotonic()
+
+    monkeypatch.setattr(hashing, "_hash", slow_hash)
+    hasher = PasswordHasher(rounds=4, workers=0, queue_limit=1, retry_after=7)
+    first = threading.Thread(target=hasher.hash, args=("first",))
+    first.start()
+    assert entered.wait(5)
+    try:
+        assert hasher.stats()["queue_depth"] == 1
+        with pytest.raises(HashingOverloaded) as excinfo:
+            hasher.hash("second")
+    finally:
+        release.set()
+        first.join()
+    assert excinfo.value.retry_after == 7
+    stats = hasher.stats()
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_unknown_user_costs_one_check(monkeypatch):
+    hasher = PasswordHasher(rounds=4, workers=0)
+    hasher.warm_up()
+    hashes = count_calls(monkeypatch, hashing.bcrypt, "hashpw")
+    checks = count_calls(monkeypatch, hashing, "_check")
+    assert not hasher.verify("s3cret", None)
+    assert not hasher.verify("s3cret", "")
+    assert hashes == []
+    assert len(checks) == 2
+
+
+def test_dummy_hash_is_made_once_across_threads(monkeypatch):
+    hasher = PasswordHasher(rounds=4, workers=0)
+    hashes = count_calls(monkeypatch, hashing.bcrypt, "hashpw")
+    threads = [threading.Thread(target=hasher.verify, args=("s3cret", None)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(hashes) == 1
+    assert hasher.stats()["completed"] == 8
+
+
+def test_app_warms_up_the_dummy_hash(app, client, monkeypatch):
+    hashes = count_calls(monkeypatch, hashing.bcrypt, "hashpw")
+    response = client.post("/api/auth/login", json={"email": "nobody@example.com", "password": "s3cret"})
+    assert response.status_code == 401
+    assert response.get_json() == {"error": "Invalid credentials"}
+    assert hashes == []
+    assert app_module.security.hasher.stats()["completed"] == 1
+
+
+def test_overloaded_hashing_returns_503(app, client, monkeypatch):
+    monkeypatch.setattr(app_module.security, "hasher",
+                        PasswordHasher(rounds=4, workers=0, queue_limit=0, retry_after=3))
+    response = client.post("/api/auth/login", json={"email": "admin@example.com", "password": "s3cret"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert app_module.security.hasher.stats()["rejected"] == 1
@@ -0,0 +1,125 @@
+import pytest
+from flask import Flask
+
+from ratelimit import Limit, MemoryStore, RateLimiter, parse_limit
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def limited(clock):
+    """A Flask app with one route limited to 2 per minute, one more at the defaults (3 per hour)."""
+    app = Flask(__name__)
+    limiter = RateLimiter(default_limits=["3 per hour"])
+    limiter.clock = clock
+    limiter.init_app(app)
+
+    @app.route("/login")
+    @limiter.limit("2 per minute")
+    def login():
+        return "ok"
+
+    @app.route("/other")
+    def other():
+        return "ok"
+
+    return app.test_client()
+
+
+def get(client, path, address="10.0.0.1"):
+    return client.get(path, environ_base={"REMOTE_ADDR": address})
+
+
+@pytest.mark.parametrize("text, count, period, interval", [
+    ("5 per minute", 5, 60, 12.0),
+    ("100/hour", 100, 3600, 36.0),
+    ("2 per 10 seconds", 2, 10, 5.0),
+    ("200 per day", 200, 86400, 432.0),
+])
+def test_limit_emission_interval(text, count, period, interval):
+    limit = Limit(text)
+    assert (limit.count, limit.period) == (count, period) == parse_limit(text)
+    assert limit.interval == interval
+
+
+@pytest.mark.parametrize("text", ["5 per fortnight", "0 per minute", "many per hour", ""])
+def test_invalid_limits_are_rejected(text):
+    with pytest.raises(ValueError):
+        Limit(text)
+
+
+def test_memory_store_allows_a_burst_then_one_per_interval():
+    store, limit, now = MemoryStore(), Limit("5 per minute"), 100.0
+    assert [store.hit("k", limit, now)[0] for _ in range(6)] == [True] * 5 + [False]
+    assert store.hit("k", limit, now) == (False, 12.0)
+    # Each interval frees exactly one request
+    assert store.hit("k", limit, now + 11.9)[0] is False
+    assert store.hit("k", limit, now + 12)[0] is True
+    assert store.hit("k", limit, now + 12)[0] is False
+
+
+def test_memory_store_drops_expired_keys():
+    store, limit = MemoryStore(), Limit("5 per minute")
+    for i in range(10):
+        store.hit(f"k{i}", limit, 0.0)
+    assert len(store) == 10
+    # Every key's TAT (12s) has passed; sweeps are amortized over the hits
+    for _ in range(10):
+        store.hit("fresh", limit, 100.0)
+    assert len(store) == 1
+
+
+def test_exceeding_a_limit_returns_429_with_retry_after(limited):
+    assert get(limited, "/login").status_code == 200
+    assert get(limited, "/login").status_code == 200
+    response = get(limited, "/login")
+    assert response.status_code == 429
+    assert response.get_json() == {"error": "Rate limit exceeded: 2 per minute"}
+    # Next request fits one interval (60s / 2) from now
+    assert response.headers["Retry-After"] == "30"
+
+
+def test_retry_after_rounds_up_to_whole_seconds(limited, clock):
+    get(limited, "/login")
+    get(limited, "/login")
+    clock.now += 29.5
+    response = get(limited, "/login")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_requests_recover_after_the_interval(limited, clock):
+    for _ in range(3):
+        get(limited, "/login")
+    clock.now += 30
+    assert get(limited, "/login").status_code == 200
+    assert get(limited, "/login").status_code == 429
+    clock.now += 60
+    assert [get(limited, "/login").status_code for _ in range(3)] == [200, 200, 429]
+
+
+def test_limits_are_per_client_and_per_endpoint(limited):
+    for _ in range(2):
+        assert get(limited, "/login").status_code == 200
+    assert get(limited, "/login").status_code == 429
+    # Another address has its own counter
+    assert get(limited, "/login", address="10.0.0.2").status_code == 200
+    # Default limits count separately from the decorated route
+    assert [get(limited, "/other").status_code for _ in range(4)] == [200, 200, 200, 429]
+    assert get(limited, "/other", address="10.0.0.2").status_code == 200
+
+
+def test_login_route_is_limited(client):
+    statuses = [client.post("/api/auth/login", json={}).status_code for _ in range(6)]
+    assert statuses == [400] * 5 + [429]
@@ -0,0 +1,142 @@
+import datetime
+
+import jwt
+import pytest
+from bson import ObjectId
+
+import repository
+from conftest import TEST_CONFIG
+from repository import Repository, decode_cursor, encode_cursor, page_limit
+
+
+@pytest.fixture
+def loads():
+    """Database lookups made by ``repo``; a cached read makes none."""
+    return []
+
+
+@pytest.fixture
+def repo(database, loads):
+    repo = Repository(lambda: loads.append(1) or database)
+    repo.ensure_indexes()
+    return repo
+
+
+def session_cookie(client, role="admin", tenant_id="t1"):
+    payload = {"email": "admin@example.com", "role": role, "tenant_id": tenant_id,
+               "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)}
+    client.set_cookie("session_token", jwt.encode(payload, TEST_CONFIG["JWT_SECRET"], algorithm="HS256"))
+
+
+def test_ensure_indexes(repo, database):
+    assert database.users.index_information()["email_1"]["unique"] is True
+    assert database.tenants.index_information()["tenant_id_1"]["unique"] is True
+    configs = database.drift_configs.index_information()
+    assert configs["tenant_id_1_config_id_1"]["unique"] is True
+    assert configs["tenant_id_1_config_id_1"]["partialFilterExpression"] == {"config_id": {"$type": "string"}}
+    assert configs["tenant_id_1__id_1"]["key"] == [("tenant_id", 1), ("_id", 1)]
+
+
+def test_duplicate_inserts_are_rejected(repo):
+    assert repo.insert_user({"email": "a@example.com"})
+    assert not repo.insert_user({"email": "a@example.com"})
+    assert repo.insert_tenant({"tenant_id": "t1"})
+    assert not repo.insert_tenant({"tenant_id": "t1"})
+    assert repo.insert_drift_config({"tenant_id": "t1", "config_id": "c1"})
+    assert not repo.insert_drift_config({"tenant_id": "t1", "config_id": "c1"})
+    # Another tenant may reuse the name, and unnamed configs never clash
+    assert repo.insert_drift_config({"tenant_id": "t2", "config_id": "c1"})
+    assert repo.insert_drift_config({"tenant_id": "t1", "config_id": None})
+    assert repo.insert_drift_config({"tenant_id": "t1", "config_id": None})
+
+
+def test_cursor_round_trip():
+    oid = ObjectId()
+    assert decode_cursor(encode_cursor(oid)) == oid
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+@pytest.mark.parametrize("value, expected", [(None, repository.PAGE_SIZE), ("1", 1), ("1000", 1000)])
+def test_page_limit(value, expected):
+    assert page_limit(value) == expected
+
+
+@pytest.mark.parametrize("value", ["0", "-3", "1001", "ten", "2.5"])
+def test_page_limit_rejects_bad_values(value):
+    with pytest.raises(ValueError):
+        page_limit(value)
+
+
+def test_pages_follow_cursors_in_insert_order(repo):
+    for i in range(5):
+        repo.insert_tenant({"tenant_id": f"t{i}"})
+    first, cursor = repo.list_tenants(limit=2)
+    second, cursor = repo.list_tenants(cursor=cursor, limit=2)
+    third, cursor = repo.list_tenants(cursor=cursor, limit=2)
+    assert [t["tenant_id"] for t in first + second + third] == [f"t{i}" for i in range(5)]
+    assert cursor is None
+    assert all("_id" not in tenant for tenant in first + second + third)
+
+
+def test_configs_are_paged_per_tenant(repo):
+    for i in range(3):
+        repo.insert_drift_config({"tenant_id": "t1", "config_id": f"c{i}"})
+    repo.insert_drift_config({"tenant_id": "t2", "config_id": "other"})
+    configs, cursor = repo.list_drift_configs("t1", limit=3)
+    assert [c["config_id"] for c in configs] == ["c0", "c1", "c2"]
+    # A full last page still hands out a cursor; following it ends the listing
+    assert repo.list_drift_configs("t1", cursor=cursor, limit=3) == ([], None)
+
+
+def test_reads_are_cached_until_a_write(repo, loads):
+    repo.insert_tenant({"tenant_id": "t1"})
+    repo.insert_drift_config({"tenant_id": "t1", "config_id": "c1"})
+    loads.clear()
+    assert repo.list_tenants() == repo.list_tenants()
+    assert repo.list_drift_configs("t1") == repo.list_drift_configs("t1")
+    assert len(loads) == 2
+
+    repo.insert_tenant({"tenant_id": "t2"})
+    tenants, _ = repo.list_tenants()
+    assert [t["tenant_id"] for t in tenants] == ["t1", "t2"]
+    # Only the tenant pages were invalidated
+    repo.list_drift_configs("t1")
+    assert len(loads) == 4
+
+
+def test_config_writes_invalidate_only_their_tenant(repo, loads):
+    repo.list_drift_configs("t1")
+    repo.list_drift_configs("t2")
+    repo.insert_drift_config({"tenant_id": "t1", "config_id": "c1"})
+    loads.clear()
+    configs, _ = repo.list_drift_configs("t1")
+    assert [c["config_id"] for c in configs] == ["c1"]
+    assert repo.list_drift_configs("t2") == ([], None)
+    assert len(loads) == 1
+
+
+def test_rejected_insert_still_invalidates(repo, loads):
+    repo.insert_tenant({"tenant_id": "t1"})
+    repo.list_tenants()
+    loads.clear()
+    assert not repo.insert_tenant({"tenant_id": "t1"})
+    repo.list_tenants()
+    assert len(loads) == 2
+
+
+def test_tenant_pages_over_http(client):
+    session_cookie(client)
+    for i in range(3):
+        assert client.post("/api/tenants", json={"tenant_id": f"t{i}", "name": f"Tenant {i}"}).status_code == 200
+    assert client.post("/api/tenants", json={"tenant_id": "t0", "name": "Again"}).status_code == 400
+
+    response = client.get("/api/tenants?limit=2")
+    assert [t["tenant_id"] for t in response.get_json()] == ["t0", "t1"]
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(f"/api/tenants?limit=2&cursor={cursor}")
+    assert [t["tenant_id"] for t in response.get_json()] == ["t2"]
+    assert "X-Next-Cursor" not in response.headers
+
+    assert client.get("/api/tenants?cursor=bogus").status_code == 400
+    assert client.get("/api/tenants?limit=0").status_code == 400